@@ -0,0 +1,71 @@
+import datetime
+
+import pytest
+
+from waveapps import models
+from waveapps.business import TransactionAccounts, build_query_class_helper
+
+ACCOUNT_COUNTS = [100, 1000, 10000]
+
+
+def test_build_query_class_helper(benchmark, create_business):
+    business = create_business()
+    benchmark(
+        build_query_class_helper,
+        class_fields={"business": models.Business},
+        input_fields={
+            "business": {"params": {"id": "$businessId"}, "useQuote": False}
+        },
+        operation_name="BusinessQuery",
+        query_params={"$businessId": "ID!", "$subtypes": "[AccountSubtypeValue!]!"},
+        variables={
+            "businessId": business.businessId,
+            "subtypes": [x.value for x in business.accountTypes],
+        },
+    )
+
+
+def test_as_gql(benchmark, create_business):
+    Query = create_business().build_accounts_query()
+    benchmark(Query.as_gql)
+
+
+@pytest.mark.parametrize("count", ACCOUNT_COUNTS)
+def test_query_helper_hydration(benchmark, run, create_business, count):
+    business = create_business(accounts=count)
+    Query = business.build_accounts_query()
+    result = benchmark(lambda: run(business.client.query_helper(Query)))
+    assert len(result.business.accounts.get_node_values()) == count
+
+
+@pytest.mark.parametrize("count", ACCOUNT_COUNTS)
+def test_get_accounts_for_transaction(benchmark, run, create_business, count):
+    business = create_business(accounts=count)
+    run(business.get_accounts())
+    result = benchmark(
+        business.get_accounts_for_transaction,
+        "Account %s" % (count - 2),
+        "Account %s" % (count - 4),
+        models.TransactionDirection.DEPOSIT,
+        models.CurrencyCode.NGN,
+    )
+    assert result["from"] and result["to"]
+
+
+def test_transaction_template_payload(benchmark, run, create_business):
+    business = create_business()
+    template = run(
+        business.transaction_template(
+            models.MoneyFlow.INFlOW,
+            TransactionAccounts(
+                _from="QWNjb3VudDo00000002",
+                to="QWNjb3VudDo00000000",
+                charges="QWNjb3VudDo00000003",
+            ),
+            "Lessons {orderId}",
+            charge_description="Service fee",
+        )
+    )
+    date = datetime.date(2020, 1, 17)
+    result = benchmark(template.payload, "order-1", date, 20000, charge_amount=400)
+    assert len(result["lineItems"]) == 2
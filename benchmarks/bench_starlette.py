@@ -0,0 +1,23 @@
+def test_create_transaction_endpoint(benchmark, run, app):
+    payload = {
+        "order": "bench-order",
+        "date": "2020-01-17",
+        "description": "Benchmark transaction",
+        "amount": 20000,
+        "kind": "income",
+        "accounts": {
+            "from": "QWNjb3VudDo00000002",
+            "to": "QWNjb3VudDo00000000",
+            "charges": "QWNjb3VudDo00000003",
+        },
+        "currency": "ngn",
+        "service_fee": 400,
+        "service_fee_description": "Service Fee",
+    }
+    response = benchmark(lambda: run(app.post("/create-transaction", json=payload)))
+    assert response.status_code == 200
+
+
+def test_accounts_endpoint(benchmark, run, app):
+    response = benchmark(lambda: run(app.get("/accounts")))
+    assert response.status_code == 200
@@ -0,0 +1,38 @@
+import asyncio
+
+import httpx
+import pytest
+from starlette.config import environ
+
+environ["WAVEAPPS_API_KEY"] = "fake-api-key"
+environ["WAVEAPPS_WEBHOOK_CALLBACK"] = ""
+environ["ALLOWED_HOSTS"] = "localhost"
+
+from waveapps import WaveBusiness
+from waveapps.frameworks.starlette import build_app
+from waveapps.fake import FakeWaveAPI
+
+BUSINESS_ID = "QnVzaW5lc3M6ZmFrZQ=="
+
+
+@pytest.fixture
+def run():
+    loop = asyncio.new_event_loop()
+    yield loop.run_until_complete
+    loop.close()
+
+
+@pytest.fixture
+def create_business():
+    def _create_business(accounts=100, **kwargs):
+        client = FakeWaveAPI(accounts=accounts, business_id=BUSINESS_ID, **kwargs)
+        return WaveBusiness(BUSINESS_ID, client)
+
+    return _create_business
+
+
+@pytest.fixture
+def app(create_business):
+    _app = build_app(api_key="fake-api-key", business_id=BUSINESS_ID)
+    _app.state.WAVE_BUSINESS = create_business(accounts=100)
+    return httpx.AsyncClient(app=_app, base_url="http://localhost")
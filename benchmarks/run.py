@@ -0,0 +1,35 @@
+"""Run the benchmark suite and write pytest-benchmark JSON results.
+
+    python benchmarks/run.py [output.json] [extra pytest args...]
+
+Compare two runs with `pytest-benchmark compare old.json new.json`.
+"""
+import os
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    output = "benchmark-results.json"
+    if argv and not argv[0].startswith("-"):
+        output = argv.pop(0)
+    return pytest.main(
+        [
+            HERE,
+            "-p",
+            "no:cacheprovider",
+            "-o",
+            "python_files=bench_*.py",
+            "--benchmark-only",
+            "--benchmark-json=%s" % output,
+            *argv,
+        ]
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_waveapps', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='waveappsstorage',
+            name='businessId',
+            field=models.CharField(max_length=200, null=True, unique=True),
+        ),
+    ]
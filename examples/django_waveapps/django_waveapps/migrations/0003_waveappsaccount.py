@@ -0,0 +1,22 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_waveapps', '0002_waveappsstorage_businessid_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WaveappsAccount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('businessId', models.CharField(max_length=200)),
+                ('accountId', models.CharField(max_length=200)),
+                ('name', models.CharField(max_length=200)),
+                ('currency', models.CharField(max_length=3)),
+                ('subtype', models.CharField(max_length=100)),
+            ],
+        ),
+    ]
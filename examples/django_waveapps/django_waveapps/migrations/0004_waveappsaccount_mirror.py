@@ -0,0 +1,36 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_waveapps', '0003_waveappsaccount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='waveappsaccount',
+            name='date_updated',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='waveappsaccount',
+            name='currency',
+            field=models.CharField(db_index=True, max_length=3),
+        ),
+        migrations.AlterField(
+            model_name='waveappsaccount',
+            name='name',
+            field=models.CharField(db_index=True, max_length=200),
+        ),
+        migrations.AlterField(
+            model_name='waveappsaccount',
+            name='subtype',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+        migrations.AlterUniqueTogether(
+            name='waveappsaccount',
+            unique_together={('businessId', 'accountId')},
+        ),
+    ]
@@ -1,14 +1,18 @@
+import json
+
 from django.db import models
 
 from django.utils import timezone
+from django.utils.functional import cached_property
+from waveapps.frameworks.django.models import AbstractWaveAccount
 
 
 class WaveappsStorage(models.Model):
     token = models.TextField()
-    businessId = models.CharField(max_length=200, null=True)
+    businessId = models.CharField(max_length=200, null=True, unique=True)
     date_added = models.DateTimeField(auto_now_add=True)
 
-    @property
+    @cached_property
     def raw_token(self):
         return json.loads(self.token)
 
@@ -29,10 +33,19 @@ class WaveappsStorage(models.Model):
         return self.raw_token["userId"]
 
     @classmethod
-    def get_token(cls):
+    def get_token(cls, businessId=None):
+        if businessId:
+            return cls.objects.filter(businessId=businessId).first()
         return cls.objects.first()
 
     @classmethod
     def save_token(cls, businessId, **kwargs):
-        cls.objects.all().delete()
-        return cls.objects.create(token=json.dumps(kwargs), businessId=businessId)
+        instance, _ = cls.objects.update_or_create(
+            businessId=businessId,
+            defaults={"token": json.dumps(kwargs), "date_added": timezone.now()},
+        )
+        return instance
+
+
+class WaveappsAccount(AbstractWaveAccount):
+    pass
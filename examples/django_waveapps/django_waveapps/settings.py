@@ -127,3 +127,12 @@ WAVEAPPS_CLIENT_ID = os.getenv("WAVEAPPS_CLIENT_ID")
 WAVEAPPS_CLIENT_SECRET = os.getenv("WAVEAPPS_CLIENT_SECRET")
 
 WAVEAPPS_STORAGE_CLASS = get_model
+
+
+def get_account_model():
+    from .models import WaveappsAccount
+
+    return WaveappsAccount
+
+
+WAVEAPPS_ACCOUNT_CLASS = get_account_model
@@ -42,6 +42,9 @@ setup(
         'httpx==0.10.0',
         'https://github.com/gbozee/graphql-client-utils/archive/0.0.1.zip'
     ],
+    extras_require={
+        'parquet': ['pyarrow'],
+    },
     classifiers=[
         'Environment :: Web Environment',
         'Framework :: Django',
@@ -0,0 +1,292 @@
+import asyncio
+import datetime
+
+import pytest
+
+from waveapps import WaveException, models
+from waveapps.business import AccountRef, TransactionAccounts, WaveBusiness
+from waveapps.fake import FakeWaveAPI, build_sales_tax_node
+from waveapps.idempotency import TransactionIndex
+
+
+@pytest.fixture
+def fake_business():
+    client = FakeWaveAPI(accounts=10)
+    return WaveBusiness(client.business_id, client)
+
+
+def build_transaction(orderId: str, **kwargs):
+    return {
+        "orderId": orderId,
+        "date": datetime.datetime(2020, 1, 17),
+        "description": "Payment of lessons",
+        "amount": 20000,
+        "kind": models.MoneyFlow.INFlOW,
+        "accounts": TransactionAccounts(
+            _from="QWNjb3VudDo00000002", to="QWNjb3VudDo00000000"
+        ),
+        **kwargs,
+    }
+
+
+@pytest.mark.asyncio
+async def test_create_transactions(fake_business: WaveBusiness):
+    items = [build_transaction("order-%s" % i) for i in range(25)]
+    items.append(build_transaction("order-bad", date=None))
+    results = [x async for x in fake_business.create_transactions(items, concurrency=4)]
+    assert len(results) == 26
+    created = [kwargs["orderId"] for kwargs, result, error in results if result]
+    assert sorted(created) == sorted("order-%s" % i for i in range(25))
+    failed = [error for kwargs, result, error in results if error]
+    assert len(failed) == 1
+    assert len(fake_business.client.transactions) == 25
+
+
+@pytest.mark.asyncio
+async def test_iter_account_pages(fake_business: WaveBusiness):
+    pages = [x async for x in fake_business.iter_account_pages(page_size=4)]
+    assert [len(x) for x in pages] == [4, 4, 2]
+    assert pages[2][-1].id == "QWNjb3VudDo00000009"
+
+
+@pytest.mark.asyncio
+async def test_account_snapshots(fake_business: WaveBusiness):
+    assert fake_business.snapshot.generation == 0
+    assert await fake_business.get_accounts()
+    snapshot = fake_business.snapshot
+    assert snapshot.generation == 1
+    # unchanged content keeps the current snapshot
+    assert not await fake_business.get_accounts()
+    assert fake_business.snapshot is snapshot
+
+    fake_business.client.accounts[0] = dict(
+        fake_business.client.accounts[0], name="Renamed"
+    )
+    assert await fake_business.get_accounts()
+    assert fake_business.snapshot.generation == 2
+    assert fake_business.accounts[0]["name"] == "Renamed"
+    # readers holding the old snapshot still see consistent data
+    assert snapshot.registry.accounts[0]["name"] == "Account 0"
+    assert len(snapshot.accounts) == len(snapshot.registry) == 10
+
+
+@pytest.mark.asyncio
+async def test_refresh_accounts(fake_business: WaveBusiness):
+    events = []
+    unsubscribe = fake_business.subscribe(events.append)
+    changes = await fake_business.refresh_accounts(page_size=4)
+    assert len(changes.added) == 10 and changes.generation == 1
+    assert isinstance(fake_business.instance, models.Business)
+    assert await fake_business.refresh_accounts(page_size=4) is None
+
+    upstream = fake_business.client
+    upstream.accounts[9] = dict(upstream.accounts[9], name="Renamed")
+    calls = upstream.calls
+    # the first page is unchanged so the rest is skipped
+    assert await fake_business.refresh_accounts(page_size=4) is None
+    assert upstream.calls == calls + 1
+    changes = await fake_business.refresh_accounts(page_size=4, force=True)
+    assert [x["name"] for x in changes.changed] == ["Renamed"]
+
+    upstream.create_account(
+        {"input": {"name": "New", "subtype": "EXPENSE", "currency": "NGN"}}
+    )
+    changes = await fake_business.refresh_accounts(page_size=4)
+    assert [x["name"] for x in changes.added] == ["New"]
+    assert len(events) == 3
+    unsubscribe()
+    assert fake_business.snapshot.generation == 3
+
+
+@pytest.mark.asyncio
+async def test_create_transaction_by_account_name(fake_business: WaveBusiness):
+    await fake_business.create_transaction(
+        **build_transaction(
+            "order-names",
+            accounts=TransactionAccounts(
+                _from="account 2",
+                to=("Account 1", "EXPENSE", "NGN"),
+                charges="QWNjb3VudDo00000003",
+            ),
+        )
+    )
+    anchor = fake_business.client.transactions[-1]["anchor"]
+    line = fake_business.client.transactions[-1]["lineItems"][0]
+    assert anchor["accountId"] == "QWNjb3VudDo00000002"
+    assert line["accountId"] == "QWNjb3VudDo00000001"
+
+    with pytest.raises(WaveException):
+        await fake_business.create_transaction(
+            **build_transaction(
+                "order-missing",
+                accounts=TransactionAccounts(_from="account 2", to=("Rent", "EXPENSE")),
+            )
+        )
+    # strings naming no account are ids the snapshot may not hold yet
+    account = await fake_business.create_new_account("Loans")
+    assert await fake_business.resolve_account(account.id) == account.id
+    with pytest.raises(WaveException, match="Unknown account"):
+        await fake_business.resolve_account(AccountRef("Deposits"))
+    assert await fake_business.resolve_account(AccountRef("Deposits"), create=True) in (
+        fake_business.registry.by_id
+    )
+    calls = fake_business.client.calls
+    await asyncio.gather(
+        *[
+            fake_business.create_transaction(
+                **build_transaction(
+                    "order-create-%s" % i,
+                    accounts=TransactionAccounts(
+                        _from="account 2", to=AccountRef("Rent", "EXPENSE")
+                    ),
+                    create_accounts=True,
+                )
+            )
+            for i in range(3)
+        ]
+    )
+    # one account creation shared by the three transactions
+    assert fake_business.client.calls == calls + 4
+    rent = fake_business.registry.find("rent")[0]
+    line = fake_business.client.transactions[-1]["lineItems"][0]
+    assert line["accountId"] == rent["id"]
+
+
+@pytest.mark.asyncio
+async def test_known_orders_short_circuit(tmp_path):
+    path = str(tmp_path / "index.jsonl")
+    client = FakeWaveAPI(accounts=10)
+    business = WaveBusiness(client.business_id, client, index=TransactionIndex(path))
+    results = await asyncio.gather(
+        *[business.create_transaction(**build_transaction("order-1")) for _ in range(3)]
+    )
+    assert len(client.transactions) == 1
+    assert len({x.transaction.id for x in results}) == 1
+
+    # a restarted process replays the same orders
+    business = WaveBusiness(client.business_id, client, index=TransactionIndex(path))
+    items = [build_transaction("order-%s" % i) for i in range(1, 4)]
+    created = [x async for x in business.create_transactions(items)]
+    assert len(created) == 3
+    assert len(client.transactions) == 3
+
+
+@pytest.mark.asyncio
+async def test_create_transaction_with_taxes():
+    client = FakeWaveAPI(
+        accounts=10,
+        sales_taxes=[
+            build_sales_tax_node(0, "VAT", 0.075),
+            build_sales_tax_node(1, "GST", 0.05),
+            build_sales_tax_node(2, "QST", 0.1, isCompound=True),
+        ],
+    )
+    business = WaveBusiness(client.business_id, client)
+    await business.create_transaction(**build_transaction("order-1", taxes=["VAT"]))
+    await business.create_transaction(
+        **build_transaction(
+            "order-2",
+            additional_line_item=[
+                {
+                    "accountId": "QWNjb3VudDo00000003",
+                    "amount": "200.00",
+                    "balance": models.BalanceType.CREDIT.value,
+                    "description": "Fee",
+                    "taxes": ["GST", "QST"],
+                }
+            ],
+        )
+    )
+    # accounts and the catalog are fetched once, before the first transaction
+    assert client.calls == 4
+    first, second = client.transactions
+    assert first["lineItems"][0]["taxes"] == [
+        {"salesTaxId": "U2FsZXNUYXg600000000", "amount": "1500.00"}
+    ]
+    assert second["lineItems"][0]["taxes"] == []
+    assert [x["amount"] for x in second["lineItems"][1]["taxes"]] == ["10.00", "21.00"]
+
+
+@pytest.mark.asyncio
+async def test_transaction_template(fake_business: WaveBusiness):
+    accounts = TransactionAccounts(
+        _from="QWNjb3VudDo00000002",
+        to="QWNjb3VudDo00000000",
+        charges="QWNjb3VudDo00000003",
+    )
+    await fake_business.create_transaction(
+        **build_transaction(
+            "order-0",
+            description="Lessons order-0",
+            accounts=accounts,
+            charge_amount=400,
+            charge_description="Service fee",
+        )
+    )
+    template = await fake_business.transaction_template(
+        models.MoneyFlow.INFlOW,
+        accounts,
+        "Lessons {orderId}",
+        charge_description="Service fee",
+    )
+    assert template.payload(
+        "order-0", datetime.datetime(2020, 1, 17), 20000, charge_amount=400
+    ) == fake_business.client.transactions[0]
+
+    items = [
+        {"orderId": "order-%s" % i, "date": "2020-01-18", "amount": 100 * i}
+        for i in range(1, 4)
+    ]
+    created = [
+        x async for x in fake_business.create_transactions(items, template=template)
+    ]
+    assert all(result.transaction for _, result, _ in created)
+    posted = fake_business.client.transactions[1:]
+    assert sorted(x["description"] for x in posted) == [
+        "Lessons order-1",
+        "Lessons order-2",
+        "Lessons order-3",
+    ]
+    assert all(len(x["lineItems"]) == 1 for x in posted)
+
+
+@pytest.mark.asyncio
+async def test_transaction_template_placeholders(fake_business: WaveBusiness):
+    accounts = TransactionAccounts(
+        _from="QWNjb3VudDo00000002", to="QWNjb3VudDo00000000"
+    )
+    await fake_business.get_accounts()
+    template = await fake_business.transaction_template(
+        models.MoneyFlow.INFlOW, accounts, "Lessons {{paid}} {orderId}"
+    )
+    payload = template.payload("order-1", "2020-01-18", 100)
+    assert payload["lineItems"][0]["description"] == "Lessons {paid} order-1"
+    for description in ["Lessons {customer}", "Lessons {", "Lessons }", "{0}"]:
+        with pytest.raises(WaveException):
+            await fake_business.transaction_template(
+                models.MoneyFlow.INFlOW, accounts, description
+            )
+
+
+class UnreachableWaveAPI(FakeWaveAPI):
+    failures = 1
+
+    async def send(self, data, headers):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionRefusedError("Connection refused")
+        return await super().send(data, headers)
+
+
+@pytest.mark.asyncio
+async def test_refresher_survives_connection_errors():
+    client = UnreachableWaveAPI(accounts=3)
+    business = WaveBusiness(client.business_id, client)
+    business.start_refresher(interval=0.01, jitter=0)
+    for _ in range(100):
+        if business.snapshot.generation:
+            break
+        await asyncio.sleep(0.01)
+    assert business.refreshing
+    assert len(business.accounts) == 3
+    await business.stop_refresher()
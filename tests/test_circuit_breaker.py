@@ -0,0 +1,68 @@
+import httpx
+import pytest
+
+from waveapps.app import CircuitBreakerRegistry, CircuitOpenError, circuit_breakers
+from waveapps.business import WaveBusiness
+from waveapps.fake import FakeResponse, FakeWaveAPI
+from waveapps.frameworks.starlette import build_app
+from waveapps.scheduler import schedulers
+
+
+class FlakyWaveAPI(FakeWaveAPI):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.failing = True
+
+    async def send(self, data, headers):
+        if self.failing:
+            self.calls += 1
+            return FakeResponse({"errors": []}, status_code=502)
+        return await super().send(data, headers)
+
+
+@pytest.mark.asyncio
+async def test_breaker_opens_and_recovers():
+    breakers = CircuitBreakerRegistry(failure_threshold=2, recovery_timeout=60)
+    client = FlakyWaveAPI(accounts=3, breakers=breakers)
+    business = WaveBusiness(client.business_id, client)
+    for _ in range(2):
+        with pytest.raises(Exception):
+            await business.get_accounts()
+    with pytest.raises(CircuitOpenError):
+        await business.get_accounts()
+    assert client.calls == 2
+    breaker = client.breaker("query")
+    assert breaker.state == breaker.OPEN
+    # mutations are tracked separately
+    client.ensure_available("mutation")
+
+    client.failing = False
+    breaker.opened_at -= 60
+    await business.get_accounts()
+    assert breaker.state == breaker.CLOSED
+    assert len(business.accounts) == 3
+    assert breakers.metrics()["%s query" % client.base_url]["opened"] == 1
+
+
+def test_apps_get_their_own_breakers():
+    threshold = circuit_breakers.failure_threshold
+    first, second = build_app(api_key="first"), build_app(api_key="second")
+    assert first.state.CIRCUIT_BREAKERS is not second.state.CIRCUIT_BREAKERS
+    assert first.state.SCHEDULERS is not schedulers
+    assert circuit_breakers.failure_threshold == threshold
+
+
+@pytest.mark.asyncio
+async def test_metrics_report_the_app_registries():
+    _app = build_app(api_key="metrics")
+    _app.state.WAVE_BUSINESS = None
+    _app.state.CIRCUIT_BREAKERS.get("https://wave.test", "query")
+    app = httpx.AsyncClient(app=_app, base_url="http://test-server")
+    # no business is needed for the metrics
+    response = await app.get("/metrics")
+    assert response.status_code == 200
+    assert list(response.json()["data"]["circuit_breakers"]) == [
+        "https://wave.test query"
+    ]
+    response = await app.get("/accounts")
+    assert response.status_code == 400
@@ -0,0 +1,74 @@
+import pytest
+
+from waveapps import models
+from waveapps.business import WaveBusiness
+from waveapps.customers import CustomerIndex
+from waveapps.fake import FakeWaveAPI, build_customer_node
+
+
+@pytest.mark.asyncio
+async def test_get_customers_concurrently():
+    client = FakeWaveAPI(accounts=0, customers=250)
+    business = WaveBusiness(client.business_id, client)
+    index = await business.get_customers(page_size=100)
+    assert len(index) == 250
+    assert client.calls == 3
+    assert index.find_email(" Customer7@Example.com ").name == "Customer 7"
+    assert [x.name for x in index.search("customer 24", limit=3)] == [
+        "Customer 24",
+        "Customer 240",
+        "Customer 241",
+    ]
+    assert index.match(name="customer 2").id == index.find_email(
+        "customer2@example.com"
+    ).id
+
+
+@pytest.mark.asyncio
+async def test_customer_pages_arrive_in_order():
+    client = FakeWaveAPI(accounts=0, customers=250)
+    business = WaveBusiness(client.business_id, client)
+    pages = [
+        [x.name for x in page]
+        async for page in business.iter_customer_pages(100, concurrency=1)
+    ]
+    assert [len(x) for x in pages] == [100, 100, 50]
+    assert pages[1][0] == "Customer 100"
+    index = CustomerIndex()
+    index.update(models.Customer(**x) for x in client.customers[:2])
+    renamed = {**client.customers[1], "name": "Renamed"}
+    index.update([models.Customer(**renamed)])
+    assert [x.name for x in index] == ["Customer 0", "Renamed"]
+    assert index.search("customer") == [index.get(client.customers[0]["id"])]
+
+
+@pytest.mark.asyncio
+async def test_upsert_customers():
+    client = FakeWaveAPI(accounts=0, customers=3)
+    business = WaveBusiness(client.business_id, client)
+    results = await business.upsert_customers(
+        [
+            {"name": "Customer 0", "email": "customer0@example.com"},
+            {"name": "Renamed", "email": "CUSTOMER1@example.com"},
+            {"name": "New", "email": "new@example.com"},
+            {"name": "New", "email": "new@example.com"},
+        ]
+    )
+    assert [error for _, _, error in results] == [None] * 4
+    assert len(client.customers) == 4
+    assert client.customers[1]["name"] == "Renamed"
+    assert results[2][1].id == results[3][1].id
+    # 1 page, 1 patch, 1 create
+    assert client.calls == 3
+    assert business.customers.match(email="new@example.com").name == "New"
+    assert business.customers.search("ren")[0].name == "Renamed"
+    assert business.customers.search("customer 1") == []
+
+
+def test_ambiguous_name_does_not_match():
+    index = CustomerIndex(
+        models.Customer(**build_customer_node(i, {"name": "Ada", "email": None}))
+        for i in range(2)
+    )
+    assert index.match(name="ada") is None
+    assert len(index.search("AD")) == 2
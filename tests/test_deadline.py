@@ -0,0 +1,34 @@
+import httpx
+import pytest
+
+from waveapps import WaveBusiness
+from waveapps.app import CircuitBreakerRegistry, DeadlineExceeded, deadline
+from waveapps.fake import FakeWaveAPI
+from waveapps.frameworks.starlette import build_app
+
+
+@pytest.mark.asyncio
+async def test_deadline_bounds_upstream_call():
+    client = FakeWaveAPI(accounts=3, latency=0.2, breakers=CircuitBreakerRegistry())
+    business = WaveBusiness(client.business_id, client)
+    with deadline(0.05):
+        with pytest.raises(DeadlineExceeded):
+            await business.get_accounts()
+    assert client.in_flight == 0
+    # running out of budget is not held against the upstream
+    assert client.breaker("query").failures == 0
+    await business.get_accounts()
+    assert len(business.accounts) == 3
+
+
+@pytest.mark.asyncio
+async def test_request_timeout_header():
+    upstream = FakeWaveAPI(accounts=3, latency=0.2)
+    _app = build_app(api_key="test-key", business_id=upstream.business_id)
+    _app.state.WAVE_BUSINESS = WaveBusiness(upstream.business_id, upstream)
+    app = httpx.AsyncClient(app=_app, base_url="http://test-server")
+    response = await app.get("/accounts", headers={"X-Request-Timeout": "0.05"})
+    assert response.status_code == 504
+    response = await app.get("/accounts")
+    assert response.status_code == 200
+    assert len(response.json()["data"]) == 3
@@ -0,0 +1,276 @@
+import asyncio
+import io
+import json
+
+import pytest
+
+django = pytest.importorskip("django")
+
+from django.conf import settings
+
+mirrored = []
+
+
+class MirroredAccounts:
+    @classmethod
+    def upsert_account(cls, businessId, account):
+        mirrored.append((businessId, account["name"]))
+
+
+if not settings.configured:
+    settings.configure(
+        INSTALLED_APPS=["waveapps.frameworks.django"],
+        DATABASES={
+            "default": {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"}
+        },
+        WAVEAPPS_API_KEY="django-api-key",
+        WAVEAPPS_BUSINESS_ID="",
+        WAVEAPPS_ACCOUNT_CLASS=lambda: MirroredAccounts,
+    )
+    django.setup()
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncRequestFactory, RequestFactory
+
+from waveapps.app import CircuitOpenError, DeadlineExceeded
+from waveapps.business import WaveBusiness
+from waveapps.fake import FakeWaveAPI
+from waveapps.frameworks.django import settings as django_settings
+from waveapps.frameworks.django import urls, views
+from waveapps.frameworks.django.management.base import WaveCommand
+from waveapps.frameworks.django.models import AbstractWaveAccount
+from waveapps.webhooks import WebhookDispatcher
+
+factory = AsyncRequestFactory()
+
+
+class WaveAccount(AbstractWaveAccount):
+    class Meta(AbstractWaveAccount.Meta):
+        app_label = "waveapps"
+
+
+def get_view(name):
+    return next(x.callback for x in views.urlpatterns if x.name == name)
+
+
+@pytest.fixture
+def accounts_table(monkeypatch):
+    monkeypatch.setattr(django_settings, "WAVEAPPS_ACCOUNT_CLASS", lambda: WaveAccount)
+    with connection.schema_editor() as editor:
+        editor.create_model(WaveAccount)
+    yield WaveAccount
+    with connection.schema_editor() as editor:
+        editor.delete_model(WaveAccount)
+
+
+@pytest.fixture
+def command_client(monkeypatch):
+    """The fake upstream behind every management command business."""
+    client = FakeWaveAPI(accounts=4)
+
+    def build_business(self, options, max_connections=20):
+        return WaveBusiness(options["business"], client)
+
+    monkeypatch.setattr(WaveCommand, "build_business", build_business)
+    return client
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    client = FakeWaveAPI(accounts=10)
+    monkeypatch.setattr(views, "get_client", lambda api_key, pooled=True: client)
+    return client
+
+
+@pytest.mark.asyncio
+async def test_pooled_clients_are_reused_per_loop():
+    client = views.get_client("django-api-key")
+    assert views.get_client("django-api-key") is client
+    assert client.http_client is not None
+    # without a long-lived loop requests get their own unpooled client
+    assert views.get_client("django-api-key", pooled=False).http_client is None
+    await client.close()
+    views._clients.pop(asyncio.get_event_loop())
+
+
+@pytest.mark.asyncio
+async def test_create_account_is_mirrored(fake_client):
+    request = factory.post(
+        "/create-account",
+        json.dumps(
+            {
+                "business": fake_client.business_id,
+                "name": "Deposits",
+                "currency": "NGN",
+                "type": "CASH_AND_BANK",
+            }
+        ),
+        content_type="application/json",
+    )
+    response = await get_view("create-account")(request)
+    assert response.status_code == 200, response.content
+    assert mirrored[-1] == (fake_client.business_id, "Deposits")
+
+
+@pytest.mark.asyncio
+async def test_errors_are_mapped_to_status_codes(fake_client, monkeypatch):
+    view = get_view("accounts")
+    request = factory.get("/accounts", {"business": fake_client.business_id})
+
+    async def unavailable(*args, **kwargs):
+        raise CircuitOpenError(("wave", "query"), 2.5)
+
+    monkeypatch.setattr(views.WaveBusiness, "get_accounts", unavailable)
+    response = await view(request)
+    assert response.status_code == 503
+    assert response["Retry-After"] == "3"
+
+    async def too_slow(*args, **kwargs):
+        raise DeadlineExceeded("Request deadline exceeded waiting for Wave")
+
+    monkeypatch.setattr(views.WaveBusiness, "get_accounts", too_slow)
+    assert (await view(request)).status_code == 504
+
+    request = factory.post("/accounts", "{", content_type="application/json")
+    assert (await get_view("create-account")(request)).status_code == 400
+    assert (await view(factory.get("/accounts"))).status_code == 400
+
+
+class RecordingDispatcher(WebhookDispatcher):
+    bodies: list = []
+
+    async def post(self, body):
+        self.bodies.append(body)
+        return type("Response", (), {"status_code": 200})
+
+
+@pytest.mark.asyncio
+async def test_wsgi_requests_finish_their_tasks(fake_client, monkeypatch):
+    monkeypatch.setattr(
+        views,
+        "build_dispatcher",
+        lambda retry_queue=None: RecordingDispatcher("http://hooks", backoff=0),
+    )
+    # WSGI requests, unlike ASGI ones, run on a loop closed with the response
+    request = RequestFactory().post(
+        "/create-transaction",
+        json.dumps(
+            {
+                "business": fake_client.business_id,
+                "order": "order-1",
+                "date": "2020-01-17",
+                "description": "Lessons",
+                "amount": 1000,
+                "kind": "income",
+                "currency": "ngn",
+                "accounts": {
+                    "from": "QWNjb3VudDo00000002",
+                    "to": "QWNjb3VudDo00000000",
+                },
+            }
+        ),
+        content_type="application/json",
+    )
+    response = await get_view("create-transaction")(request)
+    assert response.status_code == 200, response.content
+    assert len(fake_client.transactions) == 1
+    assert RecordingDispatcher.bodies[-1]["order"] == "order-1"
+    assert not views._background
+
+
+def test_token_cache_is_invalidated():
+    storage = urls.DjangoStorageInterface(businessId=None)
+    storage.cache_token(businessId="business", access_token="token")
+    assert set(urls._token_cache) == {None, "business"}
+    storage.invalidate()
+    assert urls._token_cache == {}
+
+
+def test_import_transactions_command(command_client, tmp_path):
+    payloads = tmp_path / "payloads.jsonl"
+    payloads.write_text(
+        "\n".join(
+            json.dumps(
+                {
+                    "order": "order-%s" % i,
+                    "date": "2020-01-17",
+                    "description": "Lessons",
+                    "amount": 100 * i,
+                    "kind": "income",
+                    "currency": "ngn",
+                    "accounts": {
+                        "from": "QWNjb3VudDo00000002",
+                        "to": "QWNjb3VudDo00000000",
+                    },
+                }
+                if i
+                else {"order": "order-0"}
+            )
+            for i in range(4)
+        )
+    )
+    state = str(tmp_path / "state.jsonl")
+    options = dict(
+        business=command_client.business_id, state=state, stdout=io.StringIO()
+    )
+    call_command("waveapps_import_transactions", str(payloads), **options)
+    assert len(command_client.transactions) == 3
+    assert "4 processed, 3 created, 1 failed, 0 skipped" in options["stdout"].getvalue()
+
+    options["stdout"] = io.StringIO()
+    call_command("waveapps_import_transactions", str(payloads), resume=True, **options)
+    assert len(command_client.transactions) == 3
+    assert "1 processed, 0 created, 1 failed, 3 skipped" in options["stdout"].getvalue()
+
+
+def test_sync_accounts_command(command_client, accounts_table):
+    business = command_client.business_id
+    out = io.StringIO()
+    call_command("waveapps_sync_accounts", business=business, stdout=out)
+    assert "Synced 4 accounts: 4 created, 0 updated, 0 removed" in out.getvalue()
+    assert accounts_table.objects.filter(businessId=business).count() == 4
+
+    command_client.accounts = command_client.accounts[1:]
+    call_command("waveapps_sync_accounts", business=business, stdout=out)
+    assert accounts_table.objects.count() == 4
+    call_command("waveapps_sync_accounts", business=business, prune=True, stdout=out)
+    assert "Synced 3 accounts: 0 created, 0 updated, 1 removed" in out.getvalue()
+    assert accounts_table.objects.count() == 3
+
+
+def test_save_accounts(accounts_table):
+    def account(i, name=None):
+        return {
+            "id": "account-%s" % i,
+            "name": name or "Account %s" % i,
+            "type": "CASH_AND_BANK",
+            "currency": "NGN",
+        }
+
+    accounts_table.save_accounts("other", [account(9)])
+    counts = accounts_table.save_accounts("business", [account(i) for i in range(3)])
+    assert counts == {"created": 3, "updated": 0, "removed": 0}
+    unchanged = accounts_table.objects.get(accountId="account-0").date_updated
+
+    accounts = [account(0), account(1, "Renamed")]
+    assert accounts_table.save_accounts("business", accounts) == {
+        "created": 0,
+        "updated": 1,
+        "removed": 0,
+    }
+    assert accounts_table.objects.get(accountId="account-1").name == "Renamed"
+    # unchanged accounts are not written
+    assert accounts_table.objects.get(accountId="account-0").date_updated == unchanged
+    assert accounts_table.objects.filter(businessId="business").count() == 3
+
+    assert accounts_table.save_accounts("business", accounts, prune=True) == {
+        "created": 0,
+        "updated": 0,
+        "removed": 1,
+    }
+    assert sorted(accounts_table.objects.values_list("accountId", flat=True)) == [
+        "account-0",
+        "account-1",
+        "account-9",
+    ]
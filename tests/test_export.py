@@ -0,0 +1,55 @@
+import csv
+
+import pytest
+
+from waveapps import models
+from waveapps.business import WaveBusiness
+from waveapps.export import RESULT_COLUMNS, ColumnarWriter, export_results
+from waveapps.fake import FakeWaveAPI
+
+from test_business import build_transaction
+
+
+@pytest.mark.asyncio
+async def test_export_accounts_csv(tmp_path):
+    client = FakeWaveAPI(accounts=25)
+    business = WaveBusiness(client.business_id, client)
+    path = str(tmp_path / "accounts.csv")
+    assert await business.export_accounts(path, "csv", page_size=10) == 25
+    with open(path) as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ["id", "name", "currency", "type"]
+    assert rows[1] == [
+        "QWNjb3VudDo00000000",
+        "Account 0",
+        "NGN",
+        models.AccountSubTypeValue.OTHER_CURRENT_ASSETS.value,
+    ]
+    assert len(rows) == 26
+
+
+@pytest.mark.asyncio
+async def test_export_results_parquet(tmp_path):
+    parquet = pytest.importorskip("pyarrow.parquet")
+    client = FakeWaveAPI(accounts=10)
+    business = WaveBusiness(client.business_id, client)
+    items = [build_transaction("order-%s" % i) for i in range(5)]
+    path = str(tmp_path / "results.parquet")
+    rows = await export_results(
+        business.create_transactions(items), path, "parquet", chunk_size=2
+    )
+    assert rows == 5
+    table = parquet.read_table(path)
+    assert table.column_names == [name for name, _ in RESULT_COLUMNS]
+    assert sorted(table.column("order").to_pylist()) == [x["orderId"] for x in items]
+    assert all(table.column("created").to_pylist())
+
+
+def test_empty_export_keeps_schema(tmp_path):
+    pyarrow = pytest.importorskip("pyarrow")
+    path = str(tmp_path / "results.arrow")
+    with ColumnarWriter(path, RESULT_COLUMNS, "arrow"):
+        pass
+    table = pyarrow.ipc.open_file(path).read_all()
+    assert table.num_rows == 0
+    assert str(table.schema.field("amount").type) == "double"
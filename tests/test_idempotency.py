@@ -0,0 +1,41 @@
+import pytest
+
+from waveapps.idempotency import TransactionIndex
+
+
+def test_index_persistence(tmp_path):
+    path = str(tmp_path / "index.jsonl")
+    index = TransactionIndex(path)
+    index.add("business", "order-1", "transaction-1")
+    index.add("business", "order-1", "transaction-1")
+    index.add("business", "order-1", "transaction-2")
+    index.add("other", "order-1", "transaction-3")
+    assert index.lines == 3
+
+    index = TransactionIndex(path)
+    assert index.get("business", "order-1") == "transaction-2"
+    assert index.get("other", "order-1") == "transaction-3"
+    index.compact()
+    assert index.lines == 2
+    assert len(TransactionIndex(path)) == 2
+
+    index.rebuild([("business", "order-2", "transaction-4")], businessId="business")
+    assert TransactionIndex(path).entries == {
+        ("business", "order-2"): "transaction-4",
+        ("other", "order-1"): "transaction-3",
+    }
+    index.rebuild([("business", "order-2", "transaction-4")])
+    assert TransactionIndex(path).entries == {
+        ("business", "order-2"): "transaction-4"
+    }
+
+
+@pytest.mark.asyncio
+async def test_index_records_off_the_loop(tmp_path):
+    path = str(tmp_path / "index.jsonl")
+    index = TransactionIndex(path)
+    await index.record("business", "order-1", "transaction-1")
+    await index.record("business", "order-1", "transaction-1")
+    assert index.lines == 1
+    assert TransactionIndex(path).get("business", "order-1") == "transaction-1"
+    index.close()
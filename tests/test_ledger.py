@@ -0,0 +1,115 @@
+import datetime
+import sqlite3
+
+import httpx
+import pytest
+
+from waveapps import WaveException, models
+from waveapps.business import TransactionAccounts, WaveBusiness
+from waveapps.fake import FakeWaveAPI
+from waveapps.frameworks.starlette import build_app
+from waveapps.ledger import Ledger
+
+
+def test_ledger_totals():
+    ledger = Ledger()
+    for i, day in enumerate((1, 1, 2)):
+        assert ledger.record(
+            "business",
+            "transaction-%s" % i,
+            "order",
+            datetime.date(2020, 1, day),
+            "ngn",
+            [("bank", "DEBIT", "100.10"), ("sales", "CREDIT", 100.1)],
+        )
+    # a transaction recorded again is ignored
+    assert not ledger.record(
+        "business",
+        "transaction-0",
+        "order",
+        "2020-01-01",
+        "ngn",
+        [("bank", "DEBIT", 1)],
+    )
+    assert ledger.totals(["account"]) == [
+        {"account": "bank", "debit": 300.3, "credit": 0, "net": 300.3, "entries": 3},
+        {"account": "sales", "debit": 0, "credit": 300.3, "net": -300.3, "entries": 3},
+    ]
+    assert ledger.totals(["day"], account="bank", since="2020-01-02") == [
+        {"day": "2020-01-02", "debit": 100.1, "credit": 0, "net": 100.1, "entries": 1}
+    ]
+    assert ledger.totals([], currency="usd") == []
+    with pytest.raises(WaveException):
+        ledger.totals(["amount"])
+
+
+@pytest.mark.asyncio
+async def test_posted_transactions_are_recorded():
+    upstream = FakeWaveAPI(accounts=4)
+    business = WaveBusiness(upstream.business_id, upstream, ledger=Ledger())
+    await business.create_transaction(
+        orderId="order-1",
+        date=datetime.datetime(2020, 1, 17),
+        description="Payment of lessons",
+        amount=20000,
+        kind=models.MoneyFlow.OUTFLOW,
+        accounts=TransactionAccounts(
+            _from="QWNjb3VudDo00000002",
+            to="QWNjb3VudDo00000000",
+            charges="QWNjb3VudDo00000003",
+        ),
+        charge_amount=400,
+        charge_description="Service fee",
+    )
+    _app = build_app(api_key="test-key", business_id=upstream.business_id)
+    _app.state.WAVE_BUSINESS = business
+    app = httpx.AsyncClient(app=_app, base_url="http://test-server")
+    response = await app.get("/ledger?by=account,day")
+    assert response.json()["data"] == [
+        {
+            "account": "QWNjb3VudDo00000000",
+            "day": "2020-01-17",
+            "debit": 0,
+            "credit": 19600,
+            "net": -19600,
+            "entries": 1,
+        },
+        {
+            "account": "QWNjb3VudDo00000002",
+            "day": "2020-01-17",
+            "debit": 20000,
+            "credit": 0,
+            "net": 20000,
+            "entries": 1,
+        },
+        {
+            "account": "QWNjb3VudDo00000003",
+            "day": "2020-01-17",
+            "debit": 0,
+            "credit": 400,
+            "net": -400,
+            "entries": 1,
+        },
+    ]
+
+
+@pytest.mark.asyncio
+async def test_ledger_errors_do_not_fail_posting():
+    class BrokenLedger(Ledger):
+        def record_transaction(self, *args, **kwargs):
+            raise sqlite3.OperationalError("database is locked")
+
+    upstream = FakeWaveAPI(accounts=4)
+    business = WaveBusiness(upstream.business_id, upstream, ledger=BrokenLedger())
+    result = await business.create_transaction(
+        orderId="order-1",
+        date=datetime.datetime(2020, 1, 17),
+        description="Payment of lessons",
+        amount=20000,
+        kind=models.MoneyFlow.OUTFLOW,
+        accounts=TransactionAccounts(
+            _from="QWNjb3VudDo00000002", to="QWNjb3VudDo00000000"
+        ),
+    )
+    assert result.transaction.id
+    assert len(upstream.transactions) == 1
@@ -0,0 +1,124 @@
+import asyncio
+import datetime
+
+import pytest
+
+from waveapps.app import WaveOauth, WaveStorageInterface
+
+
+class MemoryStorage(WaveStorageInterface):
+    async def get_token(self, view_url):
+        return self
+
+
+class CountingOauth(WaveOauth):
+    refreshes = 0
+
+    async def request_refresh(self, refresh_token):
+        self.refreshes += 1
+        await asyncio.sleep(0.01)
+        return {
+            "access_token": "new-token",
+            "refresh_token": "new-refresh-token",
+            "expires_in": 3600,
+            "userId": "user",
+            "businessId": "business",
+        }
+
+
+def build_hub(**token) -> CountingOauth:
+    storage = MemoryStorage()
+    for key, value in token.items():
+        setattr(storage, key, value)
+    return CountingOauth(
+        "http://test-server/auth-response",
+        "client-id",
+        "client-secret",
+        storage_interface=storage,
+    )
+
+
+def test_needs_refresh_before_expiry():
+    storage = MemoryStorage(expires_in=3600)
+    storage.access_token = "token"
+    storage.refresh_token = "refresh"
+    storage.date_added = datetime.datetime.now(
+        datetime.timezone.utc
+    ) - datetime.timedelta(minutes=58)
+    assert storage.needs_refresh(margin=300)
+    assert not storage.needs_refresh(margin=0)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_callers_share_one_refresh():
+    hub = build_hub(access_token=None, refresh_token="old-refresh-token")
+    tokens = await asyncio.gather(*[hub.get_access_token() for _ in range(10)])
+    assert tokens == ["new-token"] * 10
+    assert hub.refreshes == 1
+    # cached until close to expiry
+    assert await hub.get_access_token() == "new-token"
+    assert hub.refreshes == 1
+
+
+
+class FailingOauth(CountingOauth):
+    async def request_refresh(self, refresh_token):
+        if not self.refreshes:
+            self.refreshes += 1
+            raise RuntimeError("token endpoint unavailable")
+        return await super().request_refresh(refresh_token)
+
+
+@pytest.mark.asyncio
+async def test_refresher_loads_token_and_survives_errors():
+    storage = MemoryStorage()
+    storage.access_token = None
+    storage.refresh_token = "old-refresh-token"
+    loaded = []
+
+    async def get_token(view_url):
+        loaded.append(view_url)
+        return storage
+
+    storage.get_token = get_token
+    hub = FailingOauth(
+        "http://test-server/auth-response",
+        "client-id",
+        "client-secret",
+        storage_interface=storage,
+    )
+    hub.start_refresher(min_interval=0.01)
+    await asyncio.sleep(0)
+    # the stored token is read before the loop first sleeps
+    assert loaded == [None]
+    await asyncio.sleep(0.1)
+    # the first refresh failed, the loop backed off and retried
+    assert hub.refreshing
+    assert hub.refreshes == 2
+    assert storage.access_token == "new-token"
+    await hub.stop_refresher()
+    assert not hub.refreshing
+
+
+@pytest.mark.asyncio
+async def test_failed_refresh_rereads_storage():
+    storage = MemoryStorage()
+    storage.access_token = None
+    storage.refresh_token = "rotated-elsewhere"
+    reads = []
+
+    async def get_token(view_url):
+        reads.append(view_url)
+        return storage
+
+    storage.get_token = get_token
+    hub = FailingOauth(
+        "http://test-server/auth-response",
+        "client-id",
+        "client-secret",
+        storage_interface=storage,
+    )
+    with pytest.raises(RuntimeError):
+        await hub.get_access_token()
+    assert await hub.get_access_token() == "new-token"
+    assert len(reads) == 2
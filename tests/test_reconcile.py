@@ -0,0 +1,47 @@
+import pytest
+
+from waveapps.reconcile import Discrepancy, Reconciliation
+
+ORDERS = [
+    ("order-1", 100, "NGN"),
+    ("order-2", 200, "NGN"),
+    ("order-3", 300, "NGN"),
+    ("order-4", 400, "NGN"),
+    ("order-4", 400, "NGN"),
+]
+POSTED = [
+    ("order-1", "transaction-1", 100, "NGN"),
+    ("order-1", "transaction-1", 100, "NGN"),
+    ("order-2", "transaction-2", 200, "NGN"),
+    ("order-2", "transaction-3", 200, "NGN"),
+    ("order-4", "transaction-4", 401, "NGN"),
+    ("order-5", "transaction-5", 500, "NGN"),
+]
+
+
+@pytest.mark.parametrize("partitions", [1, 4])
+def test_reconcile(partitions):
+    reconciliation = Reconciliation(partitions)
+    result = sorted(reconciliation.run(iter(ORDERS), iter(POSTED)))
+    assert result == [
+        Discrepancy(
+            "duplicate", "order-2", expected=200, ids=("transaction-2", "transaction-3")
+        ),
+        Discrepancy("missing", "order-3", expected=300),
+        Discrepancy(
+            "recorded_mismatch",
+            "order-4",
+            expected=400,
+            recorded=401,
+            ids=("transaction-4",),
+        ),
+        Discrepancy("unexpected", "order-5", ids=("transaction-5",)),
+    ]
+    assert reconciliation.counts == {
+        "orders": 4,
+        "posted": 6,
+        "missing": 1,
+        "duplicate": 1,
+        "recorded_mismatch": 1,
+        "unexpected": 1,
+    }
@@ -0,0 +1,133 @@
+import httpx
+import pytest
+
+from waveapps import WaveBusiness
+from waveapps.app import remaining_time
+from waveapps.fake import FakeWaveAPI, generate_accounts
+from waveapps.frameworks.starlette import ViewMixin, build_app
+from waveapps.registry import AccountRegistry
+from waveapps.scheduler import INTERACTIVE, request_priority
+
+
+def build_registry(count=8):
+    return AccountRegistry(
+        [
+            {
+                "name": x["name"],
+                "id": x["id"],
+                "currency": x["currency"]["code"],
+                "type": x["subtype"]["value"],
+            }
+            for x in generate_accounts(count, currencies=["NGN", "USD"])
+        ]
+    )
+
+
+def test_registry_indexes_and_etags():
+    registry = build_registry()
+    assert len(registry.filter(type="expense")) == 2
+    assert len(registry.filter(currency="usd")) == 4
+    assert len(registry.filter(type="EXPENSE", currency="USD")) == 1
+    assert registry.select(fields=["id"])[0] == {"id": "QWNjb3VudDo00000000"}
+    assert registry.etag() == build_registry().etag()
+    assert registry.etag(type="expense") != registry.etag()
+    etag, body = registry.render(type="expense")
+    assert etag == registry.etag(type="EXPENSE")
+    assert registry.render(type="expense")[1] is body
+
+
+@pytest.mark.asyncio
+async def test_accounts_conditional_get():
+    upstream = FakeWaveAPI(accounts=8)
+    _app = build_app(api_key="test-key", business_id=upstream.business_id)
+    _app.state.WAVE_BUSINESS = WaveBusiness(upstream.business_id, upstream)
+    app = httpx.AsyncClient(app=_app, base_url="http://test-server")
+    response = await app.get("/accounts")
+    assert response.status_code == 200
+    assert len(response.json()["data"]) == 8
+    etag = response.headers["etag"]
+    assert response.headers["cache-control"] == "private, no-cache"
+
+    calls = upstream.calls
+    response = await app.get("/accounts", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    # served from the account snapshot while it is younger than the max age
+    assert upstream.calls == calls
+
+    response = await app.get(
+        "/accounts?fields=id,name&type=expense", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.json()["data"] == [
+        {"id": "QWNjb3VudDo00000001", "name": "Account 1"},
+        {"id": "QWNjb3VudDo00000005", "name": "Account 5"},
+    ]
+    response = await app.post(
+        "/create-account",
+        json={"name": "Deposits", "currency": "NGN", "type": "CASH_AND_BANK"},
+    )
+    assert response.status_code == 200
+    # new accounts are listed before the snapshot expires
+    response = await app.get("/accounts", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["data"][-1]["name"] == "Deposits"
+    response = await app.get("/accounts?fields=balance")
+    assert response.status_code == 400
+
+
+class RecordingWaveAPI(FakeWaveAPI):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.contexts = []
+
+    async def send(self, data, headers):
+        self.contexts.append((request_priority.get(), remaining_time() is not None))
+        return await super().send(data, headers)
+
+
+@pytest.mark.asyncio
+async def test_accounts_stream(monkeypatch):
+    from waveapps.frameworks.starlette import settings
+
+    monkeypatch.setattr(settings, "ACCOUNTS_PAGE_SIZE", 3)
+    monkeypatch.setattr(settings, "REQUEST_TIMEOUT", 30.0)
+    upstream = RecordingWaveAPI(accounts=8)
+    _app = build_app(api_key="test-key", business_id=upstream.business_id)
+    _app.state.WAVE_BUSINESS = WaveBusiness(upstream.business_id, upstream)
+    app = httpx.AsyncClient(app=_app, base_url="http://test-server")
+    response = await app.get("/accounts?stream=json")
+    assert response.status_code == 200
+    assert response.json() == (await app.get("/accounts")).json()
+    assert upstream.calls == 4
+    # pages streamed after the response started keep the request's context
+    assert upstream.contexts[:3] == [(INTERACTIVE, True)] * 3
+
+    response = await app.get("/accounts?stream=ndjson&fields=id&type=expense")
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert response.text.splitlines() == [
+        '{"id":"QWNjb3VudDo00000001"}',
+        '{"id":"QWNjb3VudDo00000005"}',
+    ]
+    response = await app.get("/accounts?stream=xml")
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_stream_stops_when_the_client_leaves():
+    produced, closed = [], []
+
+    class Request:
+        async def is_disconnected(self):
+            return True
+
+    async def stream():
+        try:
+            for i in range(3):
+                produced.append(i)
+                yield b"chunk"
+        finally:
+            closed.append(True)
+
+    chunks = [x async for x in ViewMixin({}).until_disconnect(Request(), stream())]
+    assert (chunks, produced, closed) == ([b"chunk"], [0], [True])
@@ -0,0 +1,140 @@
+import datetime
+
+import httpx
+import pytest
+
+from waveapps import WaveBusiness, models
+from waveapps.business import AccountRef
+from waveapps.fake import FakeWaveAPI
+from waveapps.frameworks.starlette import build_app
+from waveapps.frameworks.starlette.service_layer import build_transaction_kwargs
+from waveapps.schemas import ValidationError, decode_datetime, decode_transaction
+
+
+def test_decode_transaction():
+    payload = decode_transaction(
+        {
+            "order": "sample-order",
+            "date": "2020-01-17",
+            "description": "Payment of lessons",
+            "amount": 20000,
+            "kind": "income",
+            "accounts": {"from": "AccountFrom", "to": "AccountTo"},
+            "currency": "ngn",
+            "additional_items": [
+                {
+                    "account": "AccountCharges",
+                    "amount": 4000,
+                    "kind": "expense",
+                    "description": "Service fee",
+                }
+            ],
+        }
+    )
+    assert payload.date == datetime.datetime(2020, 1, 17)
+    assert payload.kind == models.MoneyFlow.INFlOW
+    assert payload.currency == models.CurrencyCode.NGN
+    assert payload.accounts.from_ == "AccountFrom"
+    assert payload.additional_items[0].taxes == []
+
+
+def test_decode_datetime():
+    assert decode_datetime("2020-01-17T10:30:00") == datetime.datetime(
+        2020, 1, 17, 10, 30
+    )
+    assert decode_datetime(datetime.date(2020, 1, 17)) == datetime.datetime(
+        2020, 1, 17
+    )
+    for value in (None, 20200117, "17/01/2020"):
+        with pytest.raises(ValueError, match="ISO 8601"):
+            decode_datetime(value)
+    # bulk sources may yield anything, it is validated like a request body
+    with pytest.raises(ValidationError):
+        build_transaction_kwargs(["sample-order"])
+
+
+def test_decode_transaction_errors():
+    with pytest.raises(ValidationError) as error:
+        decode_transaction(
+            {
+                "order": "sample-order",
+                "date": "17/01/2020",
+                "amount": "20000",
+                "kind": "income",
+                "accounts": {"to": "AccountTo"},
+                "currency": "ngn",
+                "additional_items": [{"account": "AccountCharges", "amount": 4000}],
+                "service_fee": 400,
+            }
+        )
+    assert error.value.errors == {
+        "date": "expected an ISO 8601 date or datetime",
+        "description": "field required",
+        "amount": "expected a number",
+        "accounts.from": "field required",
+        "additional_items.0.kind": "field required",
+        "additional_items.0.description": "field required",
+    }
+
+
+@pytest.mark.asyncio
+async def test_invalid_transaction_rejected():
+    upstream = FakeWaveAPI(accounts=4)
+    _app = build_app(api_key="test-key", business_id=upstream.business_id)
+    _app.state.WAVE_BUSINESS = WaveBusiness(upstream.business_id, upstream)
+    app = httpx.AsyncClient(app=_app, base_url="http://test-server")
+    response = await app.post("/create-transaction", json={"order": "sample-order"})
+    assert response.status_code == 400
+    assert response.json()["errors"]["date"] == "field required"
+    response = await app.post(
+        "/create-account", json={"name": "Temp", "currency": "ngn", "type": "cash"}
+    )
+    assert response.status_code == 400
+    assert list(response.json()["errors"]) == ["type"]
+    assert upstream.calls == 0
+
+
+def test_decode_account_names():
+    payload = decode_transaction(
+        {
+            "order": "sample-order",
+            "date": "2020-01-17",
+            "description": "Payment of lessons",
+            "amount": 20000,
+            "kind": "income",
+            "accounts": {
+                "from": "Cash",
+                "to": ["Lessons", "asset"],
+                "charges": {"name": "Fees", "type": "fee", "currency": "usd"},
+            },
+            "currency": "ngn",
+            "create_accounts": True,
+        }
+    )
+    assert payload.accounts.from_ == "Cash"
+    assert payload.accounts.to == AccountRef(
+        "Lessons", models.AccountSubTypeValue.OTHER_CURRENT_ASSETS
+    )
+    assert payload.accounts.charges == AccountRef(
+        "Fees",
+        models.AccountSubTypeValue.PAYMENT_PROCESSING_FEES,
+        models.CurrencyCode.USD,
+    )
+    assert payload.create_accounts
+
+
+def test_decode_taxes():
+    payload = {
+        "order": "sample-order",
+        "date": "2020-01-17",
+        "description": "Payment of lessons",
+        "amount": 20000,
+        "kind": "income",
+        "accounts": {"from": "AccountFrom", "to": "AccountTo"},
+        "currency": "ngn",
+        "taxes": ["VAT", {"salesTaxId": "U2FsZXNUYXg6MQ==", "amount": "1.50"}],
+    }
+    assert decode_transaction(payload).taxes == payload["taxes"]
+    with pytest.raises(ValidationError) as error:
+        decode_transaction({**payload, "taxes": [{"abbreviation": "VAT", "amount": "x"}]})
+    assert error.value.errors == {"taxes.0": "expected a numeric tax amount"}
@@ -28,7 +28,7 @@ async def test_create_transaction(create_and_test_transaction, mocker, create_fu
         "waveapps.frameworks.starlette.service_layer.WaveBusiness.create_transaction"
     )
     mocked_http = mocker.patch(
-        "waveapps.frameworks.starlette.service_layer.request_helper"
+        "waveapps.frameworks.starlette.service_layer.dispatcher.dispatch"
     )
     mocked_http.return_value = create_future(None)
     mocked.return_value = create_future(
@@ -61,9 +61,7 @@ async def test_create_transaction(create_and_test_transaction, mocker, create_fu
         ),
     )
     mocked_http.assert_called_with(
-        "http://the-main-site.com/hooks",
-        "POST",
-        json={"order": "sample-order", "created": True, "id": 23},
+        {"order": "sample-order", "created": True, "id": 23}
     )
     await create_and_test_transaction(
         {
@@ -142,9 +140,7 @@ async def test_create_transaction(create_and_test_transaction, mocker, create_fu
         charge_description="Service Fee",
     )
     mocked_http.assert_called_with(
-        "http://the-main-site.com/hooks",
-        "POST",
-        json={"order": "sample-order", "created": False, "id": None},
+        {"order": "sample-order", "created": False, "id": None}
     )
 
 
@@ -0,0 +1,24 @@
+import pytest
+
+from waveapps import WaveException, models
+from waveapps.fake import build_sales_tax_node
+from waveapps.taxes import TaxCatalog
+
+SALES_TAXES = [
+    build_sales_tax_node(0, "VAT", 0.075),
+    build_sales_tax_node(1, "GST", 0.05),
+    build_sales_tax_node(2, "QST", 0.1, isCompound=True),
+]
+
+
+def test_line_taxes():
+    catalog = TaxCatalog(models.SalesTax(**x) for x in SALES_TAXES)
+    assert catalog.line_taxes("100.00", ["gst", {"abbreviation": "QST"}]) == [
+        {"salesTaxId": SALES_TAXES[1]["id"], "amount": "5.00"},
+        {"salesTaxId": SALES_TAXES[2]["id"], "amount": "10.50"},
+    ]
+    assert catalog.line_taxes(33.33, ["VAT"])[0]["amount"] == "2.50"
+    explicit = {"salesTaxId": SALES_TAXES[0]["id"], "amount": "2.40"}
+    assert catalog.line_taxes(33.33, [explicit]) == [explicit]
+    with pytest.raises(WaveException):
+        catalog.line_taxes(100, ["HST"])
@@ -0,0 +1,131 @@
+import asyncio
+
+import pytest
+
+from waveapps.webhooks import WebhookDispatcher
+
+
+class Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class RecordingDispatcher(WebhookDispatcher):
+    def __init__(self, statuses, **kwargs):
+        super().__init__("http://the-main-site.com/hooks", backoff=0, **kwargs)
+        self.statuses = list(statuses)
+        self.bodies = []
+
+    async def post(self, body):
+        self.bodies.append(body)
+        status = self.statuses.pop(0) if self.statuses else 200
+        if isinstance(status, Exception):
+            raise status
+        return Response(status)
+
+
+@pytest.mark.asyncio
+async def test_single_payloads_are_posted_as_before():
+    dispatcher = RecordingDispatcher([])
+    await dispatcher.dispatch({"order": "a", "created": True, "id": 1})
+    assert dispatcher.bodies == [{"order": "a", "created": True, "id": 1}]
+    assert dispatcher.metrics()["delivered"] == 1
+
+
+@pytest.mark.asyncio
+async def test_payloads_are_batched_by_size():
+    dispatcher = RecordingDispatcher([], batch_size=3, batch_window=60)
+    for i in range(7):
+        await dispatcher.dispatch({"order": i})
+    assert dispatcher.bodies == [
+        [{"order": 0}, {"order": 1}, {"order": 2}],
+        [{"order": 3}, {"order": 4}, {"order": 5}],
+    ]
+    await dispatcher.close()
+    assert dispatcher.bodies[-1] == [{"order": 6}]
+
+
+@pytest.mark.asyncio
+async def test_failed_deliveries_are_retried_then_persisted(tmp_path):
+    retry_file = str(tmp_path / "retries.jsonl")
+    dispatcher = RecordingDispatcher(
+        [500, 502, 503], max_retries=2, retry_path=retry_file
+    )
+    await dispatcher.dispatch({"order": "a"})
+    assert len(dispatcher.bodies) == 3
+    assert dispatcher.metrics()["queued"] == 1
+
+    restarted = RecordingDispatcher([], retry_path=retry_file)
+    assert len(restarted.retry_queue) == 1
+    await restarted.retry_pending()
+    assert restarted.bodies == [{"order": "a"}]
+    assert len(RecordingDispatcher([], retry_path=retry_file).retry_queue) == 0
+
+
+@pytest.mark.asyncio
+async def test_rejected_deliveries_are_not_retried():
+    dispatcher = RecordingDispatcher([422], max_retries=2)
+    await dispatcher.dispatch({"order": "a"})
+    assert dispatcher.bodies == [{"order": "a"}]
+    metrics = dispatcher.metrics()
+    assert (metrics["rejected"], metrics["failed"], metrics["queued"]) == (1, 0, 0)
+    assert list(dispatcher.dead_letters)[0][1] == {"order": "a"}
+
+    dispatcher.statuses = [429, 200]
+    await dispatcher.dispatch({"order": "b"})
+    assert dispatcher.metrics()["delivered"] == 1
+
+
+@pytest.mark.asyncio
+async def test_unreachable_callbacks_are_queued(tmp_path):
+    retry_file = str(tmp_path / "retries.jsonl")
+    # nothing listens on port 1, httpx raises a bare ConnectionRefusedError
+    dispatcher = WebhookDispatcher(
+        "http://127.0.0.1:1/hooks", max_retries=1, backoff=0, retry_path=retry_file
+    )
+    await dispatcher.dispatch({"order": "a"})
+    metrics = dispatcher.metrics()
+    assert (metrics["failed"], metrics["queued"]) == (1, 1)
+    # the queue is drained without anyone calling start()
+    assert dispatcher._retrier is not None and not dispatcher._retrier.done()
+    await dispatcher.close()
+
+
+@pytest.mark.asyncio
+async def test_entries_stay_queued_until_delivered(tmp_path):
+    retry_file = str(tmp_path / "retries.jsonl")
+    dispatcher = RecordingDispatcher(
+        [OSError("refused")] * 2, max_retries=0, retry_path=retry_file
+    )
+    await dispatcher.deliver([(0.0, {"order": "a"})])
+    await dispatcher.deliver([(0.0, {"order": "b"})])
+    dispatcher.statuses = [200, ConnectionRefusedError()]
+    await dispatcher.retry_pending()
+    assert dispatcher.bodies[-2:] == [{"order": "a"}, {"order": "b"}]
+    remaining = RecordingDispatcher([], retry_path=retry_file).retry_queue
+    assert [x[1] for x in remaining.entries] == [{"order": "b"}]
+    assert len(dispatcher.retry_queue) == 1
+
+
+def test_clients_of_finished_loops_are_closed():
+    dispatcher = WebhookDispatcher("http://the-main-site.com/hooks")
+
+    async def get_client():
+        return dispatcher.client
+
+    first = asyncio.new_event_loop()
+    stale = first.run_until_complete(get_client())
+    first.close()
+    loop = asyncio.new_event_loop()
+    closed = []
+
+    async def aclose():
+        closed.append(True)
+
+    stale.aclose = aclose
+    try:
+        assert loop.run_until_complete(get_client()) is not stale
+        loop.run_until_complete(asyncio.sleep(0))
+    finally:
+        loop.close()
+    assert closed == [True]
@@ -1,3 +1,9 @@
+import asyncio
+import contextlib
+import contextvars
+import datetime
+import logging
+import time
 import typing
 from urllib.parse import quote
 
@@ -6,8 +12,174 @@ import httpx
 from accounting_oauth import AccountingOauth, StorageInterface, request_helper
 from graphql_client_utils import GQLKlass, GQLMutation, GQLQuery
 
+from waveapps.scheduler import RequestScheduler, SchedulerRegistry
+from waveapps.scheduler import schedulers as default_schedulers
+
 U = typing.TypeVar("U", bound=GQLKlass)
 
+TOKEN_URL = "https://api.waveapps.com/oauth2/token/"
+AUTHORIZE_URL = "https://api.waveapps.com/oauth2/authorize/"
+
+logger = logging.getLogger(__name__)
+
+
+class WaveException(Exception):
+    pass
+
+
+class DeadlineExceeded(WaveException):
+    pass
+
+
+request_deadline: "contextvars.ContextVar[typing.Optional[float]]" = (
+    contextvars.ContextVar("request_deadline", default=None)
+)
+
+
+def remaining_time() -> typing.Optional[float]:
+    """Seconds left before the current request's deadline, if one is set."""
+    value = request_deadline.get()
+    if value is None:
+        return None
+    return value - time.monotonic()
+
+
+@contextlib.contextmanager
+def deadline(timeout: typing.Optional[float]):
+    """Bound every Wave call made in this context to `timeout` seconds. A
+    deadline already in effect is only ever shortened."""
+    if not timeout:
+        yield
+        return
+    value = time.monotonic() + timeout
+    current = request_deadline.get()
+    if current is not None:
+        value = min(value, current)
+    token = request_deadline.set(value)
+    try:
+        yield
+    finally:
+        request_deadline.reset(token)
+
+
+class CircuitOpenError(WaveException):
+    def __init__(self, key: typing.Tuple[str, str], retry_after: float):
+        super().__init__(
+            "Wave upstream unavailable for %s %s, retry in %.1fs"
+            % (key[0], key[1], retry_after)
+        )
+        self.key = key
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        key: typing.Tuple[str, str],
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+    ):
+        self.key = key
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.half_open_calls = 0
+        self.counters = {"successes": 0, "failures": 0, "rejected": 0, "opened": 0}
+
+    def retry_after(self) -> float:
+        return max(self.opened_at + self.recovery_timeout - time.monotonic(), 0.0)
+
+    def check(self):
+        """Raise `CircuitOpenError` while open without taking a trial slot."""
+        if self.state == self.OPEN and self.retry_after() > 0:
+            self.counters["rejected"] += 1
+            raise CircuitOpenError(self.key, self.retry_after())
+
+    def before_call(self):
+        self.check()
+        if self.state == self.OPEN:
+            self.state = self.HALF_OPEN
+            self.half_open_calls = 0
+        if self.state == self.HALF_OPEN:
+            if self.half_open_calls >= self.half_open_max_calls:
+                self.counters["rejected"] += 1
+                raise CircuitOpenError(self.key, 0.0)
+            self.half_open_calls += 1
+
+    def release(self):
+        """Give back a half-open trial slot for a call that never finished."""
+        if self.state == self.HALF_OPEN and self.half_open_calls:
+            self.half_open_calls -= 1
+
+    def record_success(self):
+        self.counters["successes"] += 1
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def record_failure(self):
+        self.counters["failures"] += 1
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.counters["opened"] += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def metrics(self) -> typing.Dict[str, typing.Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "retry_after": self.retry_after() if self.state == self.OPEN else 0.0,
+            **self.counters,
+        }
+
+
+class CircuitBreakerRegistry:
+    """Breakers keyed by (endpoint, operation class), shared by every
+    `WaveAPI` using the registry."""
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+    ):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.breakers: typing.Dict[typing.Tuple[str, str], CircuitBreaker] = {}
+
+    def get(self, endpoint: str, operation: str) -> CircuitBreaker:
+        key = (endpoint, operation)
+        if key not in self.breakers:
+            self.breakers[key] = CircuitBreaker(
+                key,
+                failure_threshold=self.failure_threshold,
+                recovery_timeout=self.recovery_timeout,
+                half_open_max_calls=self.half_open_max_calls,
+            )
+        return self.breakers[key]
+
+    def metrics(self) -> typing.Dict[str, typing.Dict[str, typing.Any]]:
+        return {
+            "%s %s" % key: breaker.metrics() for key, breaker in self.breakers.items()
+        }
+
+
+circuit_breakers = CircuitBreakerRegistry()
+
+
+def operation_class(query: str) -> str:
+    return "mutation" if query.lstrip().startswith("mutation") else "query"
+
 
 class WaveStorageInterface(StorageInterface):
     def __init__(
@@ -28,13 +200,34 @@ class WaveStorageInterface(StorageInterface):
             in_hours = self.expires_in / 3600
         return {"access_token": in_hours, "refresh_token": 100 * 24}
 
+    def access_token_expires_at(self) -> typing.Optional[float]:
+        date_added = getattr(self, "date_added", None)
+        if not date_added:
+            return None
+        if isinstance(date_added, datetime.datetime):
+            date_added = date_added.timestamp()
+        return date_added + self.expiry_config()["access_token"] * 3600
+
+    def needs_refresh(self, margin: float = 0) -> bool:
+        expires_at = self.access_token_expires_at()
+        if not getattr(self, "access_token", None) or expires_at is None:
+            return bool(getattr(self, "refresh_token", None))
+        return expires_at - margin <= time.time()
+
     async def get_token(self, view_url):
         return await super().get_token(view_url)
 
+    def invalidate(self):
+        """Forget any cached copy of the token so the next `get_token` reads
+        storage again."""
+
     async def save_token(self, **token):
         self.userId = token.get("userId")
         self.businessId = token.get("businessId")
         self.expires_in = token.get("expires_in")
+        self.access_token = token.get("access_token")
+        self.refresh_token = token.get("refresh_token")
+        self.date_added = datetime.datetime.now(datetime.timezone.utc)
         return await super().save_token(**token)
 
 
@@ -48,6 +241,7 @@ class WaveOauth(AccountingOauth):
         scopes: typing.Optional[typing.List[str]] = None,
         storage_interface=WaveStorageInterface,
         businessId: str = "",
+        refresh_margin: float = 300,
     ):
         _scope = scopes
         if not _scope:
@@ -57,11 +251,21 @@ class WaveOauth(AccountingOauth):
             client_id,
             client_secret,
             _scope,
-            "https://api.waveapps.com/oauth2/token/",
-            "https://api.waveapps.com/oauth2/authorize/",
+            TOKEN_URL,
+            AUTHORIZE_URL,
             storage_interface=storage_interface,
             businessId=businessId,
         )
+        self.redirect_uri = redirect_uri
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.token_store: WaveStorageInterface = storage_interface
+        if isinstance(storage_interface, type):
+            self.token_store = storage_interface(businessId=businessId or None)
+        self.refresh_margin = refresh_margin
+        self._token_loaded = False
+        self._refresh: typing.Optional[asyncio.Future] = None
+        self._refresher: typing.Optional[asyncio.Future] = None
 
     def auth_params(self) -> typing.Dict[str, typing.Any]:
         result = super().auth_params()
@@ -76,34 +280,212 @@ class WaveOauth(AccountingOauth):
             result.update(scope=quote(" ".join(self.scopes)))
         return result
 
+    async def load_token(self, view_url: str = None) -> WaveStorageInterface:
+        """Read the stored token into the in-memory cache."""
+        await self.token_store.get_token(view_url)
+        self._token_loaded = True
+        return self.token_store
+
+    async def get_access_token(self, view_url: str = None) -> str:
+        """Cached access token, refreshed first when it is about to expire."""
+        if not self._token_loaded:
+            await self.load_token(view_url)
+        if self.token_store.needs_refresh(self.refresh_margin):
+            await self.refresh_access_token()
+        return self.token_store.access_token
+
+    async def refresh_access_token(self) -> WaveStorageInterface:
+        """Refresh the access token, sharing one in-flight refresh between
+        concurrent callers."""
+        if self._refresh is None or self._refresh.done():
+            self._refresh = asyncio.ensure_future(self._refresh_access_token())
+        return await asyncio.shield(self._refresh)
+
+    async def _refresh_access_token(self) -> WaveStorageInterface:
+        refresh_token = getattr(self.token_store, "refresh_token", None)
+        if not refresh_token:
+            raise WaveException("Missing refresh token")
+        try:
+            token = await self.request_refresh(refresh_token)
+        except Exception:
+            # another process may have refreshed, and rotated, the token
+            self.invalidate_token()
+            raise
+        await self.token_store.save_token(**token)
+        self._token_loaded = True
+        return self.token_store
+
+    def invalidate_token(self):
+        """Re-read the stored token on the next `get_access_token`, e.g.
+        after Wave rejected the cached one."""
+        self.token_store.invalidate()
+        self._token_loaded = False
+
+    async def request_refresh(self, refresh_token: str) -> typing.Dict[str, typing.Any]:
+        """Exchange `refresh_token` at the token url with the refresh params
+        from `token_params`, as `AccountingOauth` does."""
+        data = {
+            "grant_type": "refresh_token",
+            "refresh_token": refresh_token,
+            **self.token_params("refresh_token"),
+        }
+        if self.redirect_uri:
+            data["redirect_uri"] = self.redirect_uri
+        response = await request_helper(TOKEN_URL, "POST", data=data)
+        if response.status_code >= 400:
+            raise WaveException("Could not refresh access token: %s" % response.text)
+        return response.json()
+
+    @property
+    def refreshing(self) -> bool:
+        return self._refresher is not None and not self._refresher.done()
+
+    def start_refresher(self, min_interval: float = 5) -> asyncio.Future:
+        """Refresh the token on a background timer ahead of its expiry,
+        backing off from `min_interval` seconds while refreshes fail."""
+        if not self.refreshing:
+            self._refresher = asyncio.ensure_future(self._refresh_loop(min_interval))
+        return self._refresher
+
+    async def stop_refresher(self):
+        if self.refreshing:
+            self._refresher.cancel()
+            try:
+                await self._refresher
+            except asyncio.CancelledError:
+                pass
+        self._refresher = None
+
+    def next_refresh_in(self, min_interval: float) -> float:
+        expires_at = self.token_store.access_token_expires_at()
+        if not expires_at:
+            return self.refresh_margin
+        return max(expires_at - self.refresh_margin - time.time(), min_interval)
+
+    async def _refresh_loop(self, min_interval: float = 5, max_backoff: float = 300):
+        backoff = min_interval
+        while True:
+            try:
+                if not self._token_loaded:
+                    await self.load_token()
+                if self.token_store.needs_refresh(self.refresh_margin):
+                    await self.refresh_access_token()
+                delay, backoff = self.next_refresh_in(min_interval), min_interval
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Could not refresh the Wave access token")
+                delay, backoff = backoff, min(backoff * 2, max_backoff)
+            await asyncio.sleep(delay)
+
 
 class WaveAPI:
-    def __init__(self, api_key: str):
+    def __init__(
+        self,
+        api_key: str,
+        http_client: httpx.AsyncClient = None,
+        breakers: CircuitBreakerRegistry = None,
+        scheduler: RequestScheduler = None,
+        schedulers: SchedulerRegistry = None,
+    ):
         self.api_key = api_key
         self.base_url = "https://gql.waveapps.com/graphql/public"
+        self.http_client = http_client
+        self.breakers = breakers or circuit_breakers
+        self.schedulers = schedulers or default_schedulers
+        self._scheduler = scheduler
+
+    @property
+    def scheduler(self) -> RequestScheduler:
+        """The given scheduler, else the registry's one for the running loop."""
+        return self._scheduler or self.schedulers.get(self.api_key)
+
+    @classmethod
+    def pooled(cls, api_key: str, max_connections: int = 20, **kwargs) -> "WaveAPI":
+        """Client that reuses connections from one httpx pool between calls."""
+        return cls(
+            api_key,
+            http_client=httpx.AsyncClient(
+                pool_limits=httpx.PoolLimits(
+                    soft_limit=max_connections, hard_limit=max_connections * 2
+                )
+            ),
+            **kwargs,
+        )
+
+    async def close(self):
+        if self.http_client:
+            await self.http_client.aclose()
+
+    def breaker(self, operation: str) -> CircuitBreaker:
+        return self.breakers.get(self.base_url, operation)
+
+    def ensure_available(self, operation: str = "query"):
+        """Fail fast with `CircuitOpenError` when the upstream is known bad."""
+        self.breaker(operation).check()
+
+    async def send(self, data: typing.Dict[str, typing.Any], headers):
+        if self.http_client:
+            return await self.http_client.post(
+                self.base_url, json=data, headers=headers
+            )
+        return await request_helper(self.base_url, "POST", data=data, headers=headers)
+
+    async def scheduled_send(self, data: typing.Dict[str, typing.Any], headers):
+        """`send` once the scheduler admits the current priority lane."""
+        async with self.scheduler.slot():
+            return await self.send(data, headers)
 
     async def call_api(self, query: str, variables=None, operationName: str = None):
         headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_key}",
         }
-        return await request_helper(
-            self.base_url,
-            "POST",
-            data={
-                "query": query,
-                "variables": variables or {},
-                "operationName": operationName,
-            },
-            headers=headers,
-        )
+        data = {
+            "query": query,
+            "variables": variables or {},
+            "operationName": operationName,
+        }
+        budget = remaining_time()
+        if budget is not None and budget <= 0:
+            raise DeadlineExceeded("Request deadline exceeded before calling Wave")
+        breaker = self.breaker(operation_class(query))
+        breaker.before_call()
+        try:
+            if budget is None:
+                result = await self.scheduled_send(data, headers)
+            else:
+                result = await asyncio.wait_for(
+                    self.scheduled_send(data, headers), budget
+                )
+        except asyncio.TimeoutError:
+            # our own budget ran out, that says nothing about the upstream
+            breaker.release()
+            raise DeadlineExceeded("Request deadline exceeded waiting for Wave")
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except Exception:
+            breaker.record_failure()
+            raise
+        if result.status_code >= 500 or result.status_code == 429:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return result
 
     async def query_helper(
-        self, query_klass: typing.Type[typing.Union[GQLQuery, GQLMutation]]
+        self,
+        query_klass: typing.Type[typing.Union[GQLQuery, GQLMutation]],
+        variables: typing.Dict[str, typing.Any] = None,
+        query: str = None,
     ) -> typing.Union[GQLQuery, GQLMutation]:
-        query = query_klass.as_gql()
+        """Run `query_klass`. `variables` and an already rendered `query`
+        override the class' own."""
+        query = query or query_klass.as_gql()
         operationName = query_klass.get_operation_name()
-        variables = query_klass.get_variables()
+        if variables is None:
+            variables = query_klass.get_variables()
         result = await self.call_api(
             query, variables=variables, operationName=operationName
         )
@@ -1,16 +1,57 @@
+import asyncio
+import collections
 import datetime
+import functools
+import hashlib
+import logging
+import random
+import string
+import time
 import typing
 
-from waveapps import app, models
+from waveapps import app, export, models
+from waveapps.app import WaveException
+from waveapps.customers import CustomerIndex, customer_differs, normalize
+from waveapps.idempotency import TransactionIndex
+from waveapps.ledger import Ledger
+from waveapps.registry import AccountRegistry, dumps
+from waveapps.scheduler import BULK, priority
+from waveapps.taxes import TaxCatalog, TaxValue, is_resolved
 
 
-class WaveException(Exception):
-    pass
+logger = logging.getLogger(__name__)
+
+
+class AccountRef(typing.NamedTuple):
+    """An account named instead of identified, optionally narrowed down by
+    subtype and currency."""
+
+    name: str
+    subtype: typing.Optional[models.AccountSubTypeValue] = None
+    currency: typing.Optional[models.CurrencyCode] = None
+
+
+AccountValue = typing.Union[str, AccountRef, typing.Tuple]
+
+
+def is_account_id(registry: AccountRegistry, value: str) -> bool:
+    # ids missing from the snapshot (other pages, account types or accounts
+    # created since) are still ids, as long as no account has that name
+    return value in registry.by_id or not registry.find(value)
 
 
 class TransactionAccounts:
+    """Accounts of a transaction, each given as a Wave account id, an account
+    name or an `AccountRef` / (name, subtype, currency) tuple. Anything but
+    ids is resolved by `WaveBusiness.create_transaction`. Strings naming no
+    known account are taken for ids, accounts to create must be refs."""
+
     def __init__(
-        self, _from: str = None, to: str = None, charges: str = None, **kwargs
+        self,
+        _from: AccountValue = None,
+        to: AccountValue = None,
+        charges: AccountValue = None,
+        **kwargs
     ):
         self._from = _from or kwargs.get("from")
         self.to = to
@@ -19,6 +60,13 @@ class TransactionAccounts:
     def __eq__(self, b):
         return self._from == b._from and self.to == b.to and self.charges == b.charges
 
+    def resolved(self, registry: AccountRegistry) -> bool:
+        """Whether every account is given as an id."""
+        return all(
+            x is None or (isinstance(x, str) and is_account_id(registry, x))
+            for x in (self._from, self.to, self.charges)
+        )
+
 
 def build_query_class_helper(
     class_fields: typing.Dict[str, type],
@@ -49,16 +97,203 @@ def build_query_class_helper(
     return Mutation
 
 
+@functools.lru_cache(maxsize=None)
+def transaction_mutation() -> typing.Tuple[type, str]:
+    """The transaction mutation class and its query string. Both are the
+    same for every transaction, only the variables differ."""
+    Mutation = build_query_class_helper(
+        class_fields={"moneyTransactionCreate": models.MoneyTransactionCreateOutput},
+        input_fields={
+            "moneyTransactionCreate": {"params": {"input": "$input"}, "useQuote": False}
+        },
+        operation_name="createTransactionMutation",
+        query_params={"$input": "MoneyTransactionCreateInput!"},
+        kind="mutation",
+        variables={},
+    )
+    return Mutation, Mutation.as_gql()
+
+
+class AccountSnapshot(typing.NamedTuple):
+    """Accounts of a business at one point in time. `WaveBusiness` only ever
+    replaces its snapshot as a whole, so a reader holding one never sees a
+    half-applied refresh."""
+
+    generation: int
+    instance: typing.Optional[models.Business]
+    accounts: typing.Tuple[models.Account, ...]
+    registry: AccountRegistry
+
+
+EMPTY_SNAPSHOT = AccountSnapshot(0, None, (), AccountRegistry([]))
+
+
+class AccountChanges(typing.NamedTuple):
+    generation: int
+    added: typing.List[typing.Dict[str, str]]
+    removed: typing.List[typing.Dict[str, str]]
+    changed: typing.List[typing.Dict[str, str]]
+
+
+def diff_accounts(old: AccountRegistry, new: AccountRegistry, generation: int):
+    return AccountChanges(
+        generation,
+        added=[x for x in new.accounts if x["id"] not in old.by_id],
+        removed=[x for x in old.accounts if x["id"] not in new.by_id],
+        changed=[
+            x
+            for x in new.accounts
+            if x["id"] in old.by_id and old.by_id[x["id"]] != x
+        ],
+    )
+
+
+class TransactionTemplate:
+    """Transactions sharing their accounts, kind, currency and description,
+    differing only by order, date and amounts.
+
+    Everything but those is worked out once, so `payload()` only builds the
+    dicts that change. `description` may use {orderId}, {date} and {amount}
+    placeholders. Build one with `WaveBusiness.transaction_template()`.
+    """
+
+    placeholders = frozenset(["orderId", "date", "amount"])
+
+    def __init__(
+        self,
+        business: "WaveBusiness",
+        kind: models.MoneyFlow,
+        accounts: TransactionAccounts,
+        description: str,
+        currency: models.CurrencyCode = models.CurrencyCode.NGN,
+        charge_description: str = None,
+        additional_line_item: typing.List[typing.Dict[str, typing.Any]] = None,
+        taxes: typing.List[TaxValue] = None,
+    ):
+        if not accounts.resolved(business.registry):
+            raise WaveException("Template accounts must be resolved to ids")
+        self.business = business
+        self.businessId = business.businessId
+        self.currency = currency
+        if kind == models.MoneyFlow.INFlOW:
+            direction = models.TransactionDirection.WITHDRAWAL
+            balance = models.BalanceType.DEBIT
+        else:
+            direction = models.TransactionDirection.DEPOSIT
+            balance = models.BalanceType.CREDIT
+        self.direction = direction.value
+        self.balance = balance.value
+        self.accounts = accounts
+        self.description = description
+        self.formatted = self.check_description(description)
+        self.charge_description = charge_description
+        self.additional_line_item = list(additional_line_item or [])
+        self.taxes = taxes
+        if taxes and business.taxes is None:
+            raise WaveException("Load the sales taxes before templating taxes")
+
+    @classmethod
+    def check_description(cls, description: str) -> bool:
+        """Whether `description` needs formatting, raising for placeholders
+        `payload()` cannot fill. Literal braces are written {{ and }}."""
+        try:
+            fields = list(string.Formatter().parse(description))
+        except ValueError as e:
+            raise WaveException("Invalid template description: %s" % e)
+        for _, name, spec, _ in fields:
+            if name is None:
+                continue
+            if name not in cls.placeholders or "{" in (spec or ""):
+                raise WaveException(
+                    "Unknown template placeholder {%s}, use one of %s"
+                    % (name, ", ".join("{%s}" % x for x in sorted(cls.placeholders)))
+                )
+        return "{" in description or "}" in description
+
+    def payload(
+        self,
+        orderId: str,
+        date: typing.Union[datetime.date, str],
+        amount: float,
+        charge_amount: float = 0,
+    ) -> typing.Dict[str, typing.Any]:
+        """The `MoneyTransactionCreateInput` of one transaction."""
+        description = self.description
+        if self.formatted:
+            description = description.format(orderId=orderId, date=date, amount=amount)
+        line_amount = "%.2f" % (amount - charge_amount)
+        lineItems = [
+            {
+                "accountId": self.accounts.to,
+                "amount": line_amount,
+                "balance": self.balance,
+                "description": description,
+                "taxes": self.business.taxes.line_taxes(line_amount, self.taxes)
+                if self.taxes
+                else [],
+            }
+        ]
+        if charge_amount > 0:
+            lineItems.append(
+                {
+                    "accountId": self.accounts.charges,
+                    "amount": "%.2f" % charge_amount,
+                    "balance": models.BalanceType.CREDIT.value,
+                    "description": self.charge_description,
+                    "taxes": [],
+                }
+            )
+        if self.additional_line_item:
+            lineItems.extend(self.additional_line_item)
+        return {
+            "businessId": self.businessId,
+            "externalId": orderId,
+            "date": date if isinstance(date, str) else date.strftime("%Y-%m-%d"),
+            "description": description,
+            "anchor": {
+                "accountId": self.accounts._from,
+                "amount": "%.2f" % amount,
+                "direction": self.direction,
+            },
+            "lineItems": lineItems,
+        }
+
+    async def create(
+        self,
+        orderId: str,
+        date: typing.Union[datetime.date, str],
+        amount: float,
+        charge_amount: float = 0,
+    ) -> models.MoneyTransactionCreateOutput:
+        business = self.business
+        return await business.post_once(
+            orderId,
+            lambda: business.post_input(
+                self.payload(orderId, date, amount, charge_amount), self.currency
+            ),
+        )
+
+
 class WaveBusiness:
     def __init__(
         self,
         businessId: str,
         client: app.WaveAPI,
         accountTypes: typing.List[models.AccountSubTypeValue] = None,
+        index: TransactionIndex = None,
+        ledger: Ledger = None,
     ):
         self.businessId = businessId
-        self._accounts: typing.List[models.Account] = []
-        self._instance: models.Business = None
+        self.index = index
+        self.ledger = ledger
+        self._snapshot = EMPTY_SNAPSHOT
+        self._fetched_at = 0.0
+        self._subscribers: typing.List[typing.Callable] = []
+        self._refresher: typing.Optional[asyncio.Future] = None
+        self._first_page_digest: typing.Optional[str] = None
+        self._creating: typing.Dict[typing.Tuple, asyncio.Future] = {}
+        self.customers: typing.Optional[CustomerIndex] = None
+        self.taxes: typing.Optional[TaxCatalog] = None
         self.client = client
         self.accountTypes = accountTypes
         if not accountTypes:
@@ -113,28 +348,224 @@ class WaveBusiness:
             },
         )
 
+    def build_accounts_page_query(self, page: int, page_size: int):
+        return build_query_class_helper(
+            class_fields={"business": models.BusinessAccountsPage},
+            input_fields={
+                "business": {"params": {"id": "$businessId"}, "useQuote": False}
+            },
+            operation_name="BusinessQuery",
+            query_params={
+                "$businessId": "ID!",
+                "$subtypes": "[AccountSubtypeValue!]!",
+                "$page": "Int!",
+                "$pageSize": "Int!",
+            },
+            variables={
+                "businessId": self.businessId,
+                "subtypes": [x.value for x in self.accountTypes],
+                "page": page,
+                "pageSize": page_size,
+            },
+        )
+
+    @staticmethod
+    def account_values(account: models.Account) -> typing.Dict[str, str]:
+        return {
+            "name": account.name,
+            "id": account.id,
+            "currency": account.currency.code,
+            "type": account.subtype.value,
+        }
+
+    @property
+    def snapshot(self) -> AccountSnapshot:
+        return self._snapshot
+
+    @property
+    def accounts_age(self) -> float:
+        """Seconds since Wave last confirmed the snapshot's accounts."""
+        return time.monotonic() - self._fetched_at
+
+    @property
+    def _accounts(self) -> typing.Tuple[models.Account, ...]:
+        return self._snapshot.accounts
+
     @property
     def accounts(self) -> typing.List[typing.Dict[str, str]]:
-        return [
-            {
-                "name": x.name,
-                "id": x.id,
-                "currency": x.currency.code,
-                "type": x.subtype.value,
-            }
-            for x in self._accounts
-        ]
+        return [dict(x) for x in self._snapshot.registry.accounts]
+
+    async def get_accounts_page(
+        self, page: int = 1, page_size: int = 100
+    ) -> typing.Optional[models.BusinessAccountsPage]:
+        """The business with one page of its accounts."""
+        Query = self.build_accounts_page_query(page, page_size)
+        result = await self.client.query_helper(Query)
+        return result.business
+
+    async def iter_account_pages(
+        self, page_size: int = 100, first_page: typing.Awaitable = None
+    ) -> typing.AsyncIterator[typing.List[models.Account]]:
+        """Yield account pages as they arrive, fetching the next page while
+        the current one is consumed. Nothing is kept after a page is yielded.
+        `first_page` is an already started `get_accounts_page(1, page_size)`."""
+        current = asyncio.ensure_future(
+            first_page or self.get_accounts_page(1, page_size)
+        )
+        page = 1
+        try:
+            while current is not None:
+                business = await current
+                current = None
+                if not business:
+                    return
+                if page < business.accounts.pageInfo.totalPages:
+                    page += 1
+                    current = asyncio.ensure_future(
+                        self.get_accounts_page(page, page_size)
+                    )
+                yield business.accounts.get_node_values()
+        finally:
+            if current is not None:
+                current.cancel()
+
+    async def export_accounts(
+        self, path: str, format: str = None, page_size: int = 100
+    ) -> int:
+        """Write the accounts to `path` page by page, see `waveapps.export`.
+        Returns the number of accounts written."""
+        with export.ColumnarWriter(path, export.ACCOUNT_COLUMNS, format) as writer:
+            async for page in self.iter_account_pages(page_size):
+                writer.write(export.account_rows(page))
+        return writer.rows
+
+    @property
+    def registry(self) -> AccountRegistry:
+        return self._snapshot.registry
 
     @property
     def instance(self) -> models.Business:
-        return self._instance
+        return self._snapshot.instance
+
+    def replace_snapshot(
+        self, instance: models.Business, accounts: typing.Iterable[models.Account]
+    ) -> bool:
+        """Swap in a new snapshot unless the accounts hash to the current one.
+        Returns whether the snapshot changed."""
+        accounts = tuple(accounts)
+        registry = AccountRegistry([self.account_values(x) for x in accounts])
+        current = self._snapshot
+        if current.instance is not None and registry.digest == current.registry.digest:
+            return False
+        self._snapshot = AccountSnapshot(
+            current.generation + 1, instance, accounts, registry
+        )
+        return True
 
-    async def get_accounts(self):
+    async def get_accounts(self) -> bool:
         Query = self.build_accounts_query()
         result = await self.client.query_helper(Query)
-        self._instance = result.business
-        if self._instance:
-            self._accounts = result.business.accounts.get_node_values()
+        if not result.business:
+            return False
+        self._fetched_at = time.monotonic()
+        return self.replace_snapshot(
+            result.business, result.business.accounts.get_node_values()
+        )
+
+    def subscribe(self, callback: typing.Callable) -> typing.Callable:
+        """Call `callback(changes)`, sync or async, with the `AccountChanges`
+        of every refresh that alters the accounts. Returns an unsubscribe
+        function."""
+        self._subscribers.append(callback)
+        return lambda: self._subscribers.remove(callback)
+
+    async def refresh_accounts(
+        self, page_size: int = 100, force: bool = False
+    ) -> typing.Optional[AccountChanges]:
+        """Re-fetch the accounts page by page and notify subscribers of the
+        differences. Unless `force` is set, the remaining pages are skipped
+        when the first page hashes the same as on the previous refresh."""
+        first_page = await self.get_accounts_page(1, page_size)
+        if not first_page:
+            return None
+        nodes = first_page.accounts.get_node_values()
+        digest = hashlib.sha256(
+            dumps(
+                [first_page.accounts.pageInfo.totalCount]
+                + [self.account_values(x) for x in nodes]
+            )
+        ).hexdigest()
+        if digest == self._first_page_digest and not force:
+            self._fetched_at = time.monotonic()
+            return None
+        done = asyncio.get_event_loop().create_future()
+        done.set_result(first_page)
+        accounts: typing.List[models.Account] = []
+        async for page in self.iter_account_pages(page_size, done):
+            accounts.extend(page)
+        previous = self._snapshot
+        self._fetched_at = time.monotonic()
+        changed = self.replace_snapshot(first_page, accounts)
+        self._first_page_digest = digest
+        if not changed:
+            return None
+        changes = diff_accounts(
+            previous.registry, self._snapshot.registry, self._snapshot.generation
+        )
+        for callback in list(self._subscribers):
+            try:
+                result = callback(changes)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception:
+                logger.exception("Account change subscriber %r failed", callback)
+        return changes
+
+    @property
+    def refreshing(self) -> bool:
+        return self._refresher is not None and not self._refresher.done()
+
+    def start_refresher(
+        self,
+        interval: float = 60.0,
+        jitter: float = 0.1,
+        full_every: int = 10,
+        page_size: int = 100,
+    ) -> asyncio.Future:
+        """Keep the account snapshot fresh from a background task, polling
+        every `interval` seconds give or take `jitter` of it. Every
+        `full_every` polls all pages are fetched regardless of the first."""
+        if not self.refreshing:
+            self._refresher = asyncio.ensure_future(
+                self._refresh_loop(interval, jitter, full_every, page_size)
+            )
+        return self._refresher
+
+    async def stop_refresher(self):
+        if self.refreshing:
+            self._refresher.cancel()
+            try:
+                await self._refresher
+            except asyncio.CancelledError:
+                pass
+        self._refresher = None
+
+    async def _refresh_loop(
+        self, interval: float, jitter: float, full_every: int, page_size: int
+    ):
+        polls = 0
+        while True:
+            try:
+                await self.refresh_accounts(
+                    page_size, force=full_every > 0 and polls % full_every == 0
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # keep polling, the next refresh may well succeed
+                logger.exception("Could not refresh the Wave accounts")
+            polls += 1
+            await asyncio.sleep(interval * random.uniform(1 - jitter, 1 + jitter))
 
     async def create_new_account(
         self,
@@ -152,9 +583,97 @@ class WaveBusiness:
         result = await self.client.query_helper(Mutation)
         account = result.accountCreate.account
         if account:
+            self.add_to_snapshot(account)
             return account
         return None
 
+    def add_to_snapshot(self, account: models.Account):
+        """Serve a new account without waiting for the next refresh, so it
+        is listed and found by name right away."""
+        snapshot = self.snapshot
+        if snapshot.generation and account.id not in self.registry.by_id:
+            self.replace_snapshot(snapshot.instance, snapshot.accounts + (account,))
+
+    def find_account(
+        self, ref: AccountRef, currency: models.CurrencyCode = None
+    ) -> typing.Optional[str]:
+        """Id of the account `ref` names, defaulting to accounts in
+        `currency`. Raises `WaveException` when several accounts match."""
+        currency = ref.currency or currency
+        matches = self.registry.find(
+            ref.name,
+            type=ref.subtype.value if ref.subtype else None,
+            currency=currency.value if currency else None,
+        )
+        if len(matches) > 1:
+            raise WaveException("Ambiguous account name %s" % ref.name)
+        return matches[0]["id"] if matches else None
+
+    async def resolve_account(
+        self,
+        value: AccountValue,
+        currency: models.CurrencyCode = None,
+        create: bool = False,
+    ) -> typing.Optional[str]:
+        """Wave account id for an id, a name or an `AccountRef`. Strings that
+        name no account are passed through as ids. Unknown refs are created
+        when `create` is set, otherwise they raise `WaveException`."""
+        if value is None:
+            return value
+        if not self.snapshot.generation:
+            await self.get_accounts()
+        if isinstance(value, str):
+            if is_account_id(self.registry, value):
+                return value
+            value = AccountRef(value)
+        ref = value if isinstance(value, AccountRef) else AccountRef(*value)
+        if isinstance(ref.subtype, str):
+            ref = ref._replace(subtype=models.AccountSubTypeValue(ref.subtype.upper()))
+        if isinstance(ref.currency, str):
+            ref = ref._replace(currency=models.CurrencyCode(ref.currency.upper()))
+        found = self.find_account(ref, currency)
+        if found:
+            return found
+        if not create:
+            raise WaveException("Unknown account %s" % ref.name)
+        return await self.create_account_for(
+            ref._replace(currency=ref.currency or currency)
+        )
+
+    async def create_account_for(self, ref: AccountRef) -> str:
+        # concurrent transactions naming the same new account create it once
+        key = (ref.name.strip().lower(), ref.subtype, ref.currency)
+        if key not in self._creating:
+            self._creating[key] = asyncio.ensure_future(self._create_account_for(ref))
+            self._creating[key].add_done_callback(lambda _: self._creating.pop(key))
+        return await asyncio.shield(self._creating[key])
+
+    async def _create_account_for(self, ref: AccountRef) -> str:
+        account = await self.create_new_account(
+            ref.name,
+            accountType=ref.subtype or models.AccountSubTypeValue.OTHER_CURRENT_ASSETS,
+            currency=(ref.currency or models.CurrencyCode.NGN).value,
+        )
+        if not account:
+            raise WaveException("Could not create account %s" % ref.name)
+        return account.id
+
+    async def resolve_accounts(
+        self,
+        accounts: TransactionAccounts,
+        currency: models.CurrencyCode = None,
+        create: bool = False,
+    ) -> TransactionAccounts:
+        if not self.snapshot.generation:
+            await self.get_accounts()
+        if accounts.resolved(self.registry):
+            return accounts
+        return TransactionAccounts(
+            _from=await self.resolve_account(accounts._from, currency, create),
+            to=await self.resolve_account(accounts.to, currency, create),
+            charges=await self.resolve_account(accounts.charges, currency, create),
+        )
+
     def get_account(self, name) -> typing.Optional[typing.Dict[str, str]]:
         result = [x for x in self.accounts if name in x["name"].strip() == name]
         if result:
@@ -169,31 +688,32 @@ class WaveBusiness:
         currency: models.CurrencyCode = models.CurrencyCode.NGN,
     ) -> typing.Dict[str, typing.List[typing.Dict[str, typing.Any]]]:
         from_accounts: typing.List[typing.Any] = []
-
         to_accounts: typing.List[typing.Any] = []
+        # read one snapshot throughout, a refresh may swap it meanwhile
+        accounts = self._snapshot.registry.accounts
         if kind == models.TransactionDirection.DEPOSIT:
             from_accounts = [
                 x
-                for x in self.accounts
+                for x in accounts
                 if x["type"] == models.AccountSubTypeValue.CASH_AND_BANK.value
                 and x["currency"] == currency.value
             ]
             to_accounts = [
                 x
-                for x in self.accounts
+                for x in accounts
                 if x["type"] == models.AccountSubTypeValue.OTHER_CURRENT_ASSETS.value
                 and x["currency"] == currency.value
             ]
         else:
             from_accounts = [
                 x
-                for x in self.accounts
+                for x in accounts
                 if x["type"] == models.AccountSubTypeValue.OTHER_CURRENT_ASSETS.value
                 and x["currency"] == currency.value
             ]
             to_accounts = [
                 x
-                for x in self.accounts
+                for x in accounts
                 if x["type"] == models.AccountSubTypeValue.EXPENSE.value
                 and x["currency"] == currency.value
             ]
@@ -201,6 +721,53 @@ class WaveBusiness:
         to_accounts = [x for x in to_accounts if x["name"] == _to]
         return {"from": from_accounts, "to": to_accounts}
 
+    def build_sales_taxes_query(self, page: int, page_size: int):
+        return build_query_class_helper(
+            class_fields={"business": models.BusinessSalesTaxes},
+            input_fields={
+                "business": {"params": {"id": "$businessId"}, "useQuote": False}
+            },
+            operation_name="BusinessSalesTaxesQuery",
+            query_params={"$businessId": "ID!", "$page": "Int!", "$pageSize": "Int!"},
+            variables={
+                "businessId": self.businessId,
+                "page": page,
+                "pageSize": page_size,
+            },
+        )
+
+    async def get_sales_taxes(self, page_size: int = 100) -> TaxCatalog:
+        """Load every sales tax of the business into `self.taxes`."""
+        taxes: typing.List[models.SalesTax] = []
+        page, total_pages = 1, 1
+        while page <= total_pages:
+            Query = self.build_sales_taxes_query(page, page_size)
+            result = await self.client.query_helper(Query)
+            if not result.business:
+                break
+            taxes.extend(result.business.salesTaxes.get_node_values())
+            total_pages = result.business.salesTaxes.pageInfo.totalPages
+            page += 1
+        self.taxes = TaxCatalog(taxes)
+        return self.taxes
+
+    async def resolve_line_taxes(
+        self, line_items: typing.List[typing.Dict[str, typing.Any]]
+    ) -> typing.List[typing.Dict[str, typing.Any]]:
+        """Line items with taxes named by abbreviation or id, or missing an
+        amount, turned into {salesTaxId, amount} entries. The catalog is
+        loaded on first use only."""
+        if all(is_resolved(x.get("taxes") or []) for x in line_items):
+            return line_items
+        if self.taxes is None:
+            await self.get_sales_taxes()
+        return [
+            {**x, "taxes": self.taxes.line_taxes(x["amount"], x["taxes"])}
+            if x.get("taxes")
+            else x
+            for x in line_items
+        ]
+
     async def create_transaction(
         self,
         orderId: str,
@@ -213,7 +780,70 @@ class WaveBusiness:
         charge_amount: float = 0,
         charge_description: str = None,
         additional_line_item: typing.List[typing.Dict[str, typing.Any]] = None,
+        create_accounts: bool = False,
+        taxes: typing.List[TaxValue] = None,
+    ) -> models.MoneyTransactionCreateOutput:
+        """Post a transaction. With an `index`, orders already posted are
+        answered locally and concurrent posts of one order share a call."""
+        kwargs = dict(
+            orderId=orderId,
+            date=date,
+            description=description,
+            amount=amount,
+            kind=kind,
+            accounts=accounts,
+            currency=currency,
+            charge_amount=charge_amount,
+            charge_description=charge_description,
+            additional_line_item=additional_line_item,
+            create_accounts=create_accounts,
+            taxes=taxes,
+        )
+        return await self.post_once(orderId, lambda: self.post_transaction(**kwargs))
+
+    async def post_once(
+        self,
+        orderId: str,
+        post: typing.Callable[
+            [], typing.Awaitable[models.MoneyTransactionCreateOutput]
+        ],
     ) -> models.MoneyTransactionCreateOutput:
+        """Run `post()` for `orderId` unless the index already knows it or
+        another post of it is in flight."""
+        if self.index is None:
+            return await post()
+        known = self.index.get(self.businessId, orderId)
+        if known:
+            return models.MoneyTransactionCreateOutput(
+                transaction={"id": known}, didSucceed=True, inputErrors=[]
+            )
+        key = (self.businessId, orderId)
+        if key not in self.index.pending:
+            self.index.pending[key] = asyncio.ensure_future(post())
+            self.index.pending[key].add_done_callback(
+                lambda _: self.index.pending.pop(key)
+            )
+        result = await asyncio.shield(self.index.pending[key])
+        if result.transaction:
+            await self.index.record(self.businessId, orderId, result.transaction.id)
+        return result
+
+    async def post_transaction(
+        self,
+        orderId: str,
+        date: datetime.datetime,
+        description: str,
+        amount: float,
+        kind: models.MoneyFlow,
+        accounts: TransactionAccounts,
+        currency: models.CurrencyCode = models.CurrencyCode.NGN,
+        charge_amount: float = 0,
+        charge_description: str = None,
+        additional_line_item: typing.List[typing.Dict[str, typing.Any]] = None,
+        create_accounts: bool = False,
+        taxes: typing.List[TaxValue] = None,
+    ) -> models.MoneyTransactionCreateOutput:
+        accounts = await self.resolve_accounts(accounts, currency, create_accounts)
         if kind == models.MoneyFlow.INFlOW:
             _kind = models.TransactionDirection.WITHDRAWAL
         else:
@@ -229,7 +859,7 @@ class WaveBusiness:
                 "amount": "%.2f" % (amount - charge_amount),
                 "balance": balance.value,
                 "description": description,
-                "taxes": [],
+                "taxes": taxes or [],
             }
         ]
         if charge_amount > 0:
@@ -244,33 +874,328 @@ class WaveBusiness:
             )
         if additional_line_item:
             lineItems.extend(additional_line_item)
-        Mutation = build_query_class_helper(
-            class_fields={
-                "moneyTransactionCreate": models.MoneyTransactionCreateOutput
+        lineItems = await self.resolve_line_taxes(lineItems)
+        _input = {
+            "businessId": self.businessId,
+            "externalId": orderId,
+            "date": date.strftime("%Y-%m-%d"),
+            "description": description,
+            "anchor": {
+                "accountId": accounts._from,
+                "amount": "%.2f" % amount,
+                "direction": _kind.value,
             },
+            "lineItems": lineItems,
+        }
+        return await self.post_input(_input, currency)
+
+    async def post_input(
+        self, _input: typing.Dict[str, typing.Any], currency: models.CurrencyCode
+    ) -> models.MoneyTransactionCreateOutput:
+        """Send a ready `MoneyTransactionCreateInput` and record the result in
+        the ledger. The transaction is posted by then, so ledger errors are
+        logged rather than raised."""
+        Mutation, query = transaction_mutation()
+        result = await self.client.query_helper(
+            Mutation, variables={"input": _input}, query=query
+        )
+        output = result.moneyTransactionCreate
+        if self.ledger is not None and output and output.transaction:
+            try:
+                await self.ledger.run(
+                    self.ledger.record_transaction,
+                    output.transaction.id,
+                    _input,
+                    currency.value,
+                )
+            except Exception:
+                logger.exception(
+                    "Could not record transaction %s in the ledger",
+                    output.transaction.id,
+                )
+        return output
+
+    async def transaction_template(
+        self,
+        kind: models.MoneyFlow,
+        accounts: TransactionAccounts,
+        description: str,
+        currency: models.CurrencyCode = models.CurrencyCode.NGN,
+        charge_description: str = None,
+        additional_line_item: typing.List[typing.Dict[str, typing.Any]] = None,
+        taxes: typing.List[TaxValue] = None,
+        create_accounts: bool = False,
+    ) -> "TransactionTemplate":
+        """A `TransactionTemplate` with its accounts and taxes resolved."""
+        accounts = await self.resolve_accounts(accounts, currency, create_accounts)
+        if additional_line_item:
+            additional_line_item = await self.resolve_line_taxes(additional_line_item)
+        if taxes:
+            if self.taxes is None:
+                await self.get_sales_taxes()
+            # unknown taxes fail here rather than on the first transaction
+            self.taxes.line_taxes(0, taxes)
+        return TransactionTemplate(
+            self,
+            kind,
+            accounts,
+            description,
+            currency=currency,
+            charge_description=charge_description,
+            additional_line_item=additional_line_item,
+            taxes=taxes,
+        )
+
+    async def create_transactions(
+        self,
+        transactions: typing.Union[
+            typing.Iterable[typing.Dict[str, typing.Any]],
+            typing.AsyncIterable[typing.Dict[str, typing.Any]],
+        ],
+        concurrency: int = 10,
+        lane: str = BULK,
+        template: TransactionTemplate = None,
+    ) -> typing.AsyncIterator[
+        typing.Tuple[
+            typing.Dict[str, typing.Any],
+            typing.Optional[models.MoneyTransactionCreateOutput],
+            typing.Optional[Exception],
+        ]
+    ]:
+        """Run `create_transaction` for every kwargs dict with at most
+        `concurrency` requests in flight, yielding (kwargs, result, error) in
+        completion order. Input is consumed lazily so memory stays bounded.
+        Calls are scheduled in the `lane` priority, bulk by default. With a
+        `template` the dicts are `TransactionTemplate.create` arguments."""
+        pending: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+        done: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+        failure: typing.List[BaseException] = []
+
+        async def produce():
+            try:
+                if hasattr(transactions, "__aiter__"):
+                    async for item in transactions:
+                        await pending.put(item)
+                else:
+                    for item in transactions:
+                        await pending.put(item)
+            except Exception as e:
+                failure.append(e)
+            finally:
+                for _ in range(concurrency):
+                    await pending.put(None)
+
+        async def work():
+            with priority(lane):
+                await _work()
+
+        async def _work():
+            while True:
+                item = await pending.get()
+                if item is None:
+                    await done.put(None)
+                    return
+                try:
+                    if template is None:
+                        result = await self.create_transaction(**item)
+                    else:
+                        result = await template.create(**item)
+                    await done.put((item, result, None))
+                except Exception as e:
+                    await done.put((item, None, e))
+
+        tasks = [asyncio.ensure_future(produce())] + [
+            asyncio.ensure_future(work()) for _ in range(concurrency)
+        ]
+        finished = 0
+        try:
+            while finished < concurrency:
+                entry = await done.get()
+                if entry is None:
+                    finished += 1
+                    continue
+                yield entry
+        finally:
+            for task in tasks:
+                task.cancel()
+        if failure:
+            raise failure[0]
+
+    def build_customers_page_query(self, page: int, page_size: int):
+        return build_query_class_helper(
+            class_fields={"business": models.BusinessCustomersPage},
             input_fields={
-                "moneyTransactionCreate": {
-                    "params": {"input": "$input"},
-                    "useQuote": False,
-                }
+                "business": {"params": {"id": "$businessId"}, "useQuote": False}
             },
-            operation_name="createTransactionMutation",
-            query_params={"$input": "MoneyTransactionCreateInput!"},
-            kind="mutation",
+            operation_name="BusinessCustomersQuery",
+            query_params={"$businessId": "ID!", "$page": "Int!", "$pageSize": "Int!"},
             variables={
-                "input": {
-                    "businessId": self.businessId,
-                    "externalId": orderId,
-                    "date": date.strftime("%Y-%m-%d"),
-                    "description": description,
-                    "anchor": {
-                        "accountId": accounts._from,
-                        "amount": "%.2f" % amount,
-                        "direction": _kind.value,
-                    },
-                    "lineItems": lineItems,
-                }
+                "businessId": self.businessId,
+                "page": page,
+                "pageSize": page_size,
             },
         )
+
+    def build_customer_mutation(self, operation: str, _input: typing.Dict):
+        """`customerCreate` or `customerPatch` mutation for `_input`."""
+        field = "customer%s" % operation.title()
+        output = {
+            "create": models.CustomerCreateOutput,
+            "patch": models.CustomerPatchOutput,
+        }[operation]
+        return build_query_class_helper(
+            class_fields={field: output},
+            input_fields={field: {"params": {"input": "$input"}, "useQuote": False}},
+            operation_name="%sCustomerMutation" % operation,
+            query_params={"$input": "Customer%sInput!" % operation.title()},
+            variables={"input": _input},
+            kind="mutation",
+        )
+
+    async def get_customers_page(
+        self, page: int = 1, page_size: int = 100
+    ) -> typing.Optional[models.BusinessCustomersPage]:
+        Query = self.build_customers_page_query(page, page_size)
+        result = await self.client.query_helper(Query)
+        return result.business
+
+    async def iter_customer_pages(
+        self, page_size: int = 100, concurrency: int = 4
+    ) -> typing.AsyncIterator[typing.List[models.Customer]]:
+        """Yield customer pages in order as they arrive, keeping up to
+        `concurrency` of the following pages in flight. Nothing is kept after
+        a page is yielded."""
+        first_page = await self.get_customers_page(1, page_size)
+        if not first_page:
+            return
+        total_pages = first_page.customers.pageInfo.totalPages
+        pages = iter(range(2, total_pages + 1))
+        pending: typing.Deque[asyncio.Future] = collections.deque()
+
+        def fill():
+            while len(pending) < concurrency:
+                page = next(pages, None)
+                if page is None:
+                    return
+                pending.append(
+                    asyncio.ensure_future(self.get_customers_page(page, page_size))
+                )
+
+        try:
+            fill()
+            yield first_page.customers.get_node_values()
+            while pending:
+                business = await pending.popleft()
+                fill()
+                yield business.customers.get_node_values() if business else []
+        finally:
+            for future in pending:
+                future.cancel()
+
+    async def get_customers(
+        self, page_size: int = 100, concurrency: int = 4
+    ) -> CustomerIndex:
+        """Fetch every customer and index them in `self.customers`, adding
+        each page to the index as it arrives. The pages after the first are
+        requested `concurrency` at a time."""
+        customers = CustomerIndex()
+        async for page in self.iter_customer_pages(page_size, concurrency):
+            customers.update(page)
+        self.customers = customers
+        return self.customers
+
+    async def create_customer(
+        self, data: typing.Dict[str, typing.Any]
+    ) -> models.CustomerCreateOutput:
+        """Create a customer from `CustomerCreateInput` fields and add it to
+        the index."""
+        Mutation = self.build_customer_mutation(
+            "create", {"businessId": self.businessId, **data}
+        )
+        result = await self.client.query_helper(Mutation)
+        output = result.customerCreate
+        if output.customer and self.customers is not None:
+            self.customers.add(output.customer)
+        return output
+
+    async def patch_customer(
+        self, _id: str, data: typing.Dict[str, typing.Any]
+    ) -> models.CustomerPatchOutput:
+        Mutation = self.build_customer_mutation("patch", {**data, "id": _id})
         result = await self.client.query_helper(Mutation)
-        return result.moneyTransactionCreate
+        output = result.customerPatch
+        if output.customer and self.customers is not None:
+            self.customers.add(output.customer)
+        return output
+
+    async def upsert_customer(
+        self, data: typing.Dict[str, typing.Any]
+    ) -> models.Customer:
+        """Create the customer `data` describes, or patch the one with the
+        same id or email when anything differs. Concurrent upserts of one new
+        email create a single customer."""
+        if self.customers is None:
+            await self.get_customers()
+        existing = self.customers.get(data["id"]) if data.get("id") else None
+        if existing is None and data.get("email"):
+            existing = self.customers.find_email(data["email"])
+        if existing is not None:
+            if not customer_differs(existing, data):
+                return existing
+            fields = {k: v for k, v in data.items() if k != "id"}
+            output = await self.patch_customer(existing.id, fields)
+        else:
+            output = await self.create_customer_once(data)
+        if not output.customer:
+            raise WaveException(
+                "Could not save customer %s: %s"
+                % (
+                    data.get("name"),
+                    ", ".join(x.message for x in output.inputErrors or []),
+                )
+            )
+        return output.customer
+
+    async def create_customer_once(
+        self, data: typing.Dict[str, typing.Any]
+    ) -> models.CustomerCreateOutput:
+        email = normalize(data.get("email"))
+        if not email:
+            return await self.create_customer(data)
+        key = ("customer", email)
+        if key not in self._creating:
+            self._creating[key] = asyncio.ensure_future(self.create_customer(data))
+            self._creating[key].add_done_callback(lambda _: self._creating.pop(key))
+        return await asyncio.shield(self._creating[key])
+
+    async def upsert_customers(
+        self,
+        customers: typing.Iterable[typing.Dict[str, typing.Any]],
+        concurrency: int = 10,
+        lane: str = BULK,
+    ) -> typing.List[
+        typing.Tuple[
+            typing.Dict[str, typing.Any],
+            typing.Optional[models.Customer],
+            typing.Optional[Exception],
+        ]
+    ]:
+        """Upsert every customer with at most `concurrency` mutations in
+        flight, returning (data, customer, error) in input order. Customers
+        are fetched once up front, so unchanged ones cost no request. Input
+        is consumed lazily, one customer per free worker."""
+        if self.customers is None:
+            await self.get_customers(concurrency=concurrency)
+        items = enumerate(customers)
+        results: typing.Dict[int, typing.Tuple] = {}
+
+        async def work():
+            for i, data in items:
+                try:
+                    results[i] = data, await self.upsert_customer(data), None
+                except Exception as e:
+                    results[i] = data, None, e
+
+        with priority(lane):
+            await asyncio.gather(*[work() for _ in range(concurrency)])
+        return [results[i] for i in range(len(results))]
@@ -0,0 +1,135 @@
+import bisect
+import typing
+
+from waveapps import models
+
+# CustomerCreateInput / CustomerPatchInput scalar fields compared on upsert
+CUSTOMER_FIELDS = (
+    "name",
+    "firstName",
+    "lastName",
+    "displayId",
+    "email",
+    "mobile",
+    "phone",
+    "fax",
+)
+ADDRESS_FIELDS = ("addressLine1", "addressLine2", "city", "postalCode")
+
+
+def normalize(value: typing.Optional[str]) -> str:
+    return (value or "").strip().casefold()
+
+
+def customer_differs(customer: models.Customer, data: typing.Dict[str, typing.Any]):
+    """Whether upserting `data` would change `customer`."""
+    for field in CUSTOMER_FIELDS:
+        if field in data and (data[field] or None) != (
+            getattr(customer, field, None) or None
+        ):
+            return True
+    currency = data.get("currency")
+    if currency and currency != getattr(customer.currency, "code", None):
+        return True
+    address = data.get("address")
+    if address:
+        current = customer.address
+        if current is None:
+            return True
+        for field in ADDRESS_FIELDS:
+            if field in address and address[field] != getattr(current, field, None):
+                return True
+        country = getattr(current.country, "code", None)
+        province = getattr(current.province, "code", None)
+        if address.get("countryCode", country) != country:
+            return True
+        if address.get("provinceCode", province) != province:
+            return True
+    return False
+
+
+class CustomerIndex:
+    """Customers of a business indexed by id, email and name, so orders can
+    be matched to customers without querying Wave. Emails and names are
+    compared ignoring case and surrounding spaces."""
+
+    def __init__(self, customers: typing.Iterable[models.Customer] = ()):
+        self.by_id: typing.Dict[str, models.Customer] = {}
+        self.by_email: typing.Dict[str, models.Customer] = {}
+        # sorted (normalized name, id) pairs for prefix searches
+        self.names: typing.List[typing.Tuple[str, str]] = []
+        self.update(customers)
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def __iter__(self):
+        return iter(self.by_id.values())
+
+    def get(self, _id: str) -> typing.Optional[models.Customer]:
+        return self.by_id.get(_id)
+
+    def find_email(self, email: str) -> typing.Optional[models.Customer]:
+        return self.by_email.get(normalize(email))
+
+    def search(self, prefix: str, limit: int = None) -> typing.List[models.Customer]:
+        """Customers whose name starts with `prefix`, in name order."""
+        prefix = normalize(prefix)
+        result = []
+        for i in range(bisect.bisect_left(self.names, (prefix, "")), len(self.names)):
+            name, _id = self.names[i]
+            if not name.startswith(prefix) or (limit and len(result) >= limit):
+                break
+            result.append(self.by_id[_id])
+        return result
+
+    def match(
+        self, email: str = None, name: str = None
+    ) -> typing.Optional[models.Customer]:
+        """The customer with `email`, else the only customer called `name`."""
+        if email:
+            customer = self.find_email(email)
+            if customer:
+                return customer
+        if name:
+            name = normalize(name)
+            found = [x for x in self.search(name, limit=2) if normalize(x.name) == name]
+            if len(found) == 1:
+                return found[0]
+        return None
+
+    def add(self, customer: models.Customer):
+        """Insert or replace a customer, e.g. after creating or patching it."""
+        previous = self.by_id.get(customer.id)
+        if previous is not None:
+            self.names.remove((normalize(previous.name), previous.id))
+            email = normalize(previous.email)
+            if email and self.by_email.get(email) is previous:
+                del self.by_email[email]
+        self.by_id[customer.id] = customer
+        if customer.email:
+            self.by_email[normalize(customer.email)] = customer
+        bisect.insort(self.names, (normalize(customer.name), customer.id))
+
+    def update(self, customers: typing.Iterable[models.Customer]):
+        """Insert or replace a batch of customers, e.g. one fetched page.
+        Pages fetched while customers are added may overlap, keep the last."""
+        stale = set()
+        added = []
+        for customer in customers:
+            previous = self.by_id.get(customer.id)
+            if previous is not None:
+                stale.add((normalize(previous.name), previous.id))
+                email = normalize(previous.email)
+                if email and self.by_email.get(email) is previous:
+                    del self.by_email[email]
+            self.by_id[customer.id] = customer
+            added.append(customer)
+        added = [x for x in added if self.by_id[x.id] is x]
+        for customer in added:
+            if customer.email:
+                self.by_email.setdefault(normalize(customer.email), customer)
+        if stale:
+            self.names = [x for x in self.names if x not in stale]
+        self.names.extend((normalize(x.name), x.id) for x in added)
+        self.names.sort()
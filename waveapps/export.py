@@ -0,0 +1,173 @@
+"""Columnar exports of accounts and transaction results.
+
+Rows are buffered column by column and written in chunks, as Parquet or
+Arrow IPC when pyarrow is installed and as CSV otherwise. Every export of a
+kind has the same columns, whatever the content.
+"""
+import csv
+import json
+import typing
+
+from waveapps.app import WaveException
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# (name, type) where type is one of string, bool, float64
+Columns = typing.Sequence[typing.Tuple[str, str]]
+
+ACCOUNT_COLUMNS: Columns = (
+    ("id", "string"),
+    ("name", "string"),
+    ("currency", "string"),
+    ("type", "string"),
+)
+RESULT_COLUMNS: Columns = (
+    ("order", "string"),
+    ("created", "bool"),
+    ("id", "string"),
+    ("amount", "float64"),
+    ("currency", "string"),
+    ("error", "string"),
+)
+FORMATS = ("parquet", "arrow", "csv")
+
+
+def default_format() -> str:
+    return "parquet" if pyarrow is not None else "csv"
+
+
+class ColumnarWriter:
+    """Write rows, tuples in `columns` order, `chunk_size` at a time.
+
+    Use as a context manager, or call `close()` to flush the last chunk.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        columns: Columns,
+        format: str = None,
+        chunk_size: int = 50000,
+    ):
+        self.format = format or default_format()
+        if self.format not in FORMATS:
+            raise WaveException("Unknown export format %s" % self.format)
+        if self.format != "csv" and pyarrow is None:
+            raise WaveException("pyarrow is required for %s exports" % self.format)
+        self.path = path
+        self.columns = columns
+        self.chunk_size = chunk_size
+        self.buffers: typing.List[typing.List] = [[] for _ in columns]
+        self.rows = 0
+        if self.format == "csv":
+            self.file = open(path, "w", newline="")
+            self.csv = csv.writer(self.file)
+            self.csv.writerow([name for name, _ in columns])
+        else:
+            self.schema = pyarrow.schema(
+                [(name, pyarrow.type_for_alias(kind)) for name, kind in columns]
+            )
+            if self.format == "parquet":
+                self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+            else:
+                self.writer = pyarrow.ipc.new_file(path, self.schema)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, rows: typing.Iterable[typing.Sequence]):
+        buffers = self.buffers
+        appends = [x.append for x in buffers]
+        for row in rows:
+            for append, value in zip(appends, row):
+                append(value)
+            if len(buffers[0]) >= self.chunk_size:
+                self.flush()
+
+    def flush(self):
+        count = len(self.buffers[0])
+        if not count:
+            return
+        if self.format == "csv":
+            self.csv.writerows(zip(*self.buffers))
+        else:
+            batch = pyarrow.RecordBatch.from_arrays(
+                [
+                    pyarrow.array(values, type=field.type)
+                    for values, field in zip(self.buffers, self.schema)
+                ],
+                schema=self.schema,
+            )
+            self.writer.write_batch(batch)
+        self.rows += count
+        for values in self.buffers:
+            values.clear()
+
+    def close(self):
+        self.flush()
+        if self.format == "csv":
+            self.file.close()
+        else:
+            self.writer.close()
+
+
+def account_rows(accounts: typing.Iterable[typing.Any]) -> typing.Iterator[tuple]:
+    """`ACCOUNT_COLUMNS` rows from `models.Account` objects."""
+    for x in accounts:
+        yield x.id, x.name, x.currency.code, x.subtype.value
+
+
+def result_row(
+    kwargs: typing.Dict[str, typing.Any], result: typing.Any, error: typing.Any
+) -> tuple:
+    """A `RESULT_COLUMNS` row from a `WaveBusiness.create_transactions`
+    entry."""
+    transaction = result.transaction if result else None
+    currency = kwargs.get("currency")
+    return (
+        kwargs["orderId"],
+        bool(transaction),
+        transaction.id if transaction else None,
+        kwargs.get("amount"),
+        getattr(currency, "value", currency),
+        str(error) if error else None,
+    )
+
+
+async def export_results(
+    results: typing.AsyncIterable,
+    path: str,
+    format: str = None,
+    chunk_size: int = 50000,
+) -> int:
+    """Consume `WaveBusiness.create_transactions` and export its results.
+    Returns the number of rows written."""
+    with ColumnarWriter(path, RESULT_COLUMNS, format, chunk_size) as writer:
+        async for kwargs, result, error in results:
+            writer.write([result_row(kwargs, result, error)])
+    return writer.rows
+
+
+def export_state(
+    state: str, path: str, format: str = None, chunk_size: int = 50000
+) -> int:
+    """Export a `waveapps_import_transactions --state` file."""
+
+    def rows():
+        with open(state) as f:
+            for line in f:
+                if line.strip():
+                    row = json.loads(line)
+                    yield tuple(row.get(name) for name, _ in RESULT_COLUMNS)
+
+    with ColumnarWriter(path, RESULT_COLUMNS, format, chunk_size) as writer:
+        writer.write(rows())
+    return writer.rows
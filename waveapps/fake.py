@@ -0,0 +1,271 @@
+import asyncio
+import typing
+
+import httpx
+
+from waveapps import models
+from waveapps.app import WaveAPI
+
+DEFAULT_SUBTYPES = [
+    models.AccountSubTypeValue.OTHER_CURRENT_ASSETS,
+    models.AccountSubTypeValue.EXPENSE,
+    models.AccountSubTypeValue.CASH_AND_BANK,
+    models.AccountSubTypeValue.PAYMENT_PROCESSING_FEES,
+]
+
+
+class FakeResponse:
+    def __init__(self, data: typing.Dict[str, typing.Any], status_code: int = 200):
+        self._data = data
+        self.status_code = status_code
+
+    def json(self):
+        return self._data
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise httpx.HTTPError(
+                "Fake upstream returned status %s" % self.status_code
+            )
+
+
+def build_account_node(
+    index: int,
+    name: str = None,
+    subtype: models.AccountSubTypeValue = models.AccountSubTypeValue.OTHER_CURRENT_ASSETS,
+    currency: str = "NGN",
+) -> typing.Dict[str, typing.Any]:
+    name = name or "Account %s" % index
+    return {
+        "id": "QWNjb3VudDo%08d" % index,
+        "name": name,
+        "description": name,
+        "subtype": {
+            "name": subtype.name.replace("_", " ").title(),
+            "value": subtype.value,
+            "type": {"name": "Asset", "normalBalanceType": "DEBIT", "value": "ASSET"},
+        },
+        "currency": {
+            "code": currency,
+            "symbol": currency,
+            "name": currency,
+            "plural": currency,
+            "exponent": 2,
+        },
+        "type": {"name": "Asset", "normalBalanceType": "DEBIT", "value": "ASSET"},
+        "normalBalanceType": "DEBIT",
+        "isArchived": False,
+    }
+
+
+def generate_accounts(
+    count: int,
+    subtypes: typing.List[models.AccountSubTypeValue] = None,
+    currencies: typing.List[str] = None,
+) -> typing.List[typing.Dict[str, typing.Any]]:
+    """Deterministic account nodes cycling through subtypes and currencies."""
+    subtypes = subtypes or DEFAULT_SUBTYPES
+    currencies = currencies or ["NGN"]
+    return [
+        build_account_node(
+            i,
+            subtype=subtypes[i % len(subtypes)],
+            currency=currencies[(i // len(subtypes)) % len(currencies)],
+        )
+        for i in range(count)
+    ]
+
+
+def build_customer_node(
+    index: int, _input: typing.Dict[str, typing.Any] = None
+) -> typing.Dict[str, typing.Any]:
+    _input = _input or {}
+    currency = _input.get("currency", "NGN")
+    return {
+        "id": "QnVzaW5lc3M6Q3VzdG9tZXI6%08d" % index,
+        "name": _input.get("name", "Customer %s" % index),
+        "email": _input.get("email", "customer%s@example.com" % index),
+        "firstName": _input.get("firstName"),
+        "lastName": _input.get("lastName"),
+        "displayId": _input.get("displayId"),
+        "mobile": _input.get("mobile"),
+        "phone": _input.get("phone"),
+        "fax": _input.get("fax"),
+        "address": None,
+        "currency": {
+            "code": currency,
+            "symbol": currency,
+            "name": currency,
+            "plural": currency,
+            "exponent": 2,
+        },
+    }
+
+
+def build_sales_tax_node(
+    index: int, abbreviation: str, rate: float, isCompound: bool = False
+) -> typing.Dict[str, typing.Any]:
+    return {
+        "id": "U2FsZXNUYXg6%08d" % index,
+        "name": abbreviation,
+        "abbreviation": abbreviation,
+        "description": abbreviation,
+        "taxNumber": None,
+        "rate": rate,
+        "isCompound": isCompound,
+        "isRecoverable": False,
+        "isArchived": False,
+    }
+
+
+def paginate(
+    nodes: typing.List[typing.Dict[str, typing.Any]],
+    variables: typing.Dict[str, typing.Any],
+) -> typing.Dict[str, typing.Any]:
+    page = variables.get("page") or 1
+    page_size = variables.get("pageSize") or max(len(nodes), 1)
+    start = (page - 1) * page_size
+    return {
+        "pageInfo": {
+            "currentPage": page,
+            "totalPages": max(-(-len(nodes) // page_size), 1),
+            "totalCount": len(nodes),
+        },
+        "edges": [{"node": x} for x in nodes[start : start + page_size]],
+    }
+
+
+class FakeWaveAPI(WaveAPI):
+    """In-memory stand-in for the Wave GraphQL endpoint.
+
+    Answers the operations issued by `WaveBusiness` so benchmarks, load tests
+    and examples can run fully offline.
+    """
+
+    def __init__(
+        self,
+        api_key: str = "fake-api-key",
+        accounts: typing.Union[int, typing.List[typing.Dict[str, typing.Any]]] = 100,
+        business_id: str = "QnVzaW5lc3M6ZmFrZQ==",
+        business_name: str = "Fake Business",
+        latency: float = 0.0,
+        customers: typing.Union[int, typing.List[typing.Dict[str, typing.Any]]] = 0,
+        sales_taxes: typing.List[typing.Dict[str, typing.Any]] = None,
+        **kwargs,
+    ):
+        super().__init__(api_key, **kwargs)
+        if isinstance(accounts, int):
+            accounts = generate_accounts(accounts)
+        self.accounts = accounts
+        if isinstance(customers, int):
+            customers = [build_customer_node(i) for i in range(customers)]
+        self.customers = customers
+        self.sales_taxes = sales_taxes or []
+        self.business_id = business_id
+        self.business_name = business_name
+        self.latency = latency
+        self.transactions: typing.List[typing.Dict[str, typing.Any]] = []
+        self.calls = 0
+        self.in_flight = 0
+        self.handlers: typing.Dict[str, typing.Callable] = {
+            "BusinessQuery": self.business_query,
+            "createAccountMutation": self.create_account,
+            "createTransactionMutation": self.create_transaction,
+            "BusinessCustomersQuery": self.customers_query,
+            "createCustomerMutation": self.create_customer,
+            "patchCustomerMutation": self.patch_customer,
+            "BusinessSalesTaxesQuery": self.sales_taxes_query,
+        }
+
+    async def send(self, data: typing.Dict[str, typing.Any], headers):
+        self.calls += 1
+        self.in_flight += 1
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            operationName = data.get("operationName")
+            handler = self.handlers.get(operationName)
+            if not handler:
+                return FakeResponse(
+                    {"errors": [{"message": "Unknown operation %s" % operationName}]},
+                    status_code=400,
+                )
+            return FakeResponse({"data": handler(data.get("variables") or {})})
+        finally:
+            self.in_flight -= 1
+
+    def business_query(self, variables):
+        return {
+            "business": {
+                "id": self.business_id,
+                "name": self.business_name,
+                "accounts": paginate(self.accounts, variables),
+            }
+        }
+
+    def customers_query(self, variables):
+        return {
+            "business": {
+                "id": self.business_id,
+                "name": self.business_name,
+                "customers": paginate(self.customers, variables),
+            }
+        }
+
+    def sales_taxes_query(self, variables):
+        return {
+            "business": {
+                "id": self.business_id,
+                "name": self.business_name,
+                "salesTaxes": paginate(self.sales_taxes, variables),
+            }
+        }
+
+    def create_account(self, variables):
+        _input = variables["input"]
+        account = build_account_node(
+            len(self.accounts),
+            name=_input["name"],
+            subtype=models.AccountSubTypeValue(_input["subtype"]),
+            currency=_input["currency"],
+        )
+        self.accounts.append(account)
+        return {
+            "accountCreate": {"didSucceed": True, "inputErrors": [], "account": account}
+        }
+
+    def create_transaction(self, variables):
+        self.transactions.append(variables["input"])
+        return {
+            "moneyTransactionCreate": {
+                "didSucceed": True,
+                "inputErrors": [],
+                "transaction": {"id": "VHJhbnNhY3Rpb246%08d" % len(self.transactions)},
+            }
+        }
+
+    def create_customer(self, variables):
+        _input = {k: v for k, v in variables["input"].items() if k != "businessId"}
+        customer = build_customer_node(len(self.customers), _input)
+        self.customers.append(customer)
+        return {
+            "customerCreate": {
+                "didSucceed": True,
+                "inputErrors": [],
+                "customer": customer,
+            }
+        }
+
+    def patch_customer(self, variables):
+        _input = dict(variables["input"])
+        customer = next(x for x in self.customers if x["id"] == _input["id"])
+        if "currency" in _input:
+            customer["currency"]["code"] = _input.pop("currency")
+        customer.update(_input)
+        return {
+            "customerPatch": {
+                "didSucceed": True,
+                "inputErrors": [],
+                "customer": customer,
+            }
+        }
@@ -5,6 +5,7 @@ CURRENT_DIRECTOR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 
 class WaveAppsConfig(AppConfig):
-    name = "waveapps"
+    name = "waveapps.frameworks.django"
+    label = "waveapps"
     path = os.path.join(CURRENT_DIRECTOR, "django")
 
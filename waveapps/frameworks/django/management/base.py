@@ -0,0 +1,52 @@
+import asyncio
+import concurrent.futures
+import itertools
+import typing
+
+from django.core.management.base import BaseCommand, CommandError
+
+from waveapps import WaveAPI, WaveBusiness
+from waveapps.idempotency import TransactionIndex
+from waveapps.ledger import Ledger
+
+from .. import settings as django_settings
+
+
+async def iterate_in_thread(
+    iterable: typing.Iterable, chunk_size: int = 500
+) -> typing.AsyncIterator:
+    """Consume a sync iterable (e.g. a queryset) from one worker thread so
+    database access stays off the event loop and on a single connection."""
+    loop = asyncio.get_event_loop()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        iterator = await loop.run_in_executor(executor, iter, iterable)
+        while True:
+            chunk = await loop.run_in_executor(
+                executor, lambda: list(itertools.islice(iterator, chunk_size))
+            )
+            if not chunk:
+                return
+            for item in chunk:
+                yield item
+
+
+class WaveCommand(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--business",
+            default=django_settings.WAVEAPPS_BUSINESS_ID,
+            help="Wave business id, defaults to WAVEAPPS_BUSINESS_ID",
+        )
+        parser.add_argument(
+            "--api-key",
+            default=django_settings.WAVEAPPS_API_KEY,
+            help="Wave API key, defaults to WAVEAPPS_API_KEY",
+        )
+
+    def build_business(self, options, max_connections: int = 20) -> WaveBusiness:
+        if not options["business"] or not options["api_key"]:
+            raise CommandError("Missing --business or --api-key")
+        client = WaveAPI.pooled(options["api_key"], max_connections=max_connections)
+        index = TransactionIndex(options["index"]) if options.get("index") else None
+        ledger = Ledger(options["ledger"]) if options.get("ledger") else None
+        return WaveBusiness(options["business"], client, index=index, ledger=ledger)
@@ -0,0 +1,48 @@
+import asyncio
+
+from django.core.management.base import CommandError
+
+from waveapps import export
+
+from ..base import WaveCommand
+
+
+class Command(WaveCommand):
+    help = (
+        "Export the business accounts, or the results recorded by "
+        "waveapps_import_transactions --state, as Parquet, Arrow or CSV"
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument("kind", choices=["accounts", "results"])
+        parser.add_argument("path", help="file to write")
+        parser.add_argument(
+            "--state", help="results: waveapps_import_transactions --state file"
+        )
+        parser.add_argument(
+            "--format",
+            choices=export.FORMATS,
+            help="defaults to parquet when pyarrow is installed, csv otherwise",
+        )
+        parser.add_argument("--page-size", type=int, default=100)
+
+    def handle(self, *args, **options):
+        if options["kind"] == "results":
+            if not options["state"]:
+                raise CommandError("Exporting results requires --state")
+            rows = export.export_state(
+                options["state"], options["path"], options["format"]
+            )
+        else:
+            rows = asyncio.run(self.export_accounts(options))
+        self.stdout.write("%d rows written to %s" % (rows, options["path"]))
+
+    async def export_accounts(self, options) -> int:
+        business = self.build_business(options)
+        try:
+            return await business.export_accounts(
+                options["path"], options["format"], options["page_size"]
+            )
+        finally:
+            await business.client.close()
@@ -0,0 +1,167 @@
+import asyncio
+import json
+import sys
+import time
+import typing
+
+from django.core.management.base import CommandError
+from django.utils.module_loading import import_string
+
+from waveapps.frameworks.starlette.service_layer import build_transaction_kwargs
+from waveapps.schemas import ValidationError
+
+from ... import settings as django_settings
+from ..base import WaveCommand, iterate_in_thread
+
+
+def read_payloads(path: str) -> typing.Iterator[typing.Dict[str, typing.Any]]:
+    f = sys.stdin if path == "-" else open(path)
+    with f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def read_queryset(dotted_path: str) -> typing.Iterator[typing.Dict[str, typing.Any]]:
+    source = import_string(dotted_path)
+    if callable(source):
+        source = source()
+    if hasattr(source, "iterator"):
+        source = source.iterator()
+    for item in source:
+        if hasattr(item, "to_waveapps_transaction"):
+            item = item.to_waveapps_transaction()
+        yield item
+
+
+def payload_order(payload: typing.Any) -> typing.Optional[str]:
+    if isinstance(payload, dict):
+        return payload.get("order")
+    return getattr(payload, "order", None)
+
+
+def read_state(path: str) -> typing.Set[str]:
+    completed = set()
+    try:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    row = json.loads(line)
+                    if row.get("created"):
+                        completed.add(row["order"])
+    except FileNotFoundError:
+        pass
+    return completed
+
+
+class Command(WaveCommand):
+    help = (
+        "Bulk-create Wave transactions from a JSON lines file of /create-transaction "
+        "payloads or from a queryset"
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "path", nargs="?", help="JSON lines file of payloads, - for stdin"
+        )
+        parser.add_argument(
+            "--queryset",
+            help="dotted path to a queryset, iterable or callable returning payloads "
+            "or objects with a to_waveapps_transaction() method",
+        )
+        parser.add_argument("--concurrency", type=int, default=10)
+        parser.add_argument(
+            "--state", help="JSON lines file recording the result of every order"
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="skip orders already recorded as created in --state",
+        )
+        parser.add_argument("--progress-every", type=int, default=100)
+        parser.add_argument(
+            "--index",
+            default=django_settings.WAVEAPPS_TRANSACTION_INDEX,
+            help="transaction index file, defaults to WAVEAPPS_TRANSACTION_INDEX",
+        )
+        parser.add_argument(
+            "--ledger",
+            default=django_settings.WAVEAPPS_LEDGER,
+            help="SQLite ledger of posted transactions, defaults to WAVEAPPS_LEDGER",
+        )
+
+    def handle(self, *args, **options):
+        if bool(options["path"]) == bool(options["queryset"]):
+            raise CommandError("Pass either a file path or --queryset")
+        if options["resume"] and not options["state"]:
+            raise CommandError("--resume requires --state")
+        asyncio.run(self.run(options))
+
+    async def run(self, options):
+        business = self.build_business(options, max_connections=options["concurrency"])
+        completed = read_state(options["state"]) if options["resume"] else set()
+        if options["path"]:
+            source = read_payloads(options["path"])
+        else:
+            source = read_queryset(options["queryset"])
+        state = open(options["state"], "a") if options["state"] else None
+        counts = {"processed": 0, "created": 0, "failed": 0, "skipped": 0}
+        started = time.perf_counter()
+
+        def record(row):
+            counts["processed"] += 1
+            counts["created" if row["created"] else "failed"] += 1
+            if state:
+                state.write(json.dumps(row) + "\n")
+                state.flush()
+            if counts["processed"] % options["progress_every"] == 0:
+                self.report(counts, started)
+
+        async def transactions():
+            async for payload in iterate_in_thread(source):
+                if payload_order(payload) in completed:
+                    counts["skipped"] += 1
+                    continue
+                try:
+                    yield build_transaction_kwargs(payload)
+                except ValidationError as e:
+                    record(
+                        {
+                            "order": payload_order(payload),
+                            "created": False,
+                            "id": None,
+                            "error": str(e),
+                            "errors": e.errors,
+                        }
+                    )
+
+        try:
+            async for kwargs, result, error in business.create_transactions(
+                transactions(), concurrency=options["concurrency"]
+            ):
+                transaction = result.transaction if result else None
+                record(
+                    {
+                        "order": kwargs["orderId"],
+                        "created": bool(transaction),
+                        "id": transaction.id if transaction else None,
+                        "amount": kwargs["amount"],
+                        "currency": kwargs["currency"].value,
+                        "error": str(error) if error else None,
+                    }
+                )
+        finally:
+            if state:
+                state.close()
+            await business.client.close()
+        self.report(counts, started)
+
+    def report(self, counts, started):
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            "%(processed)d processed, %(created)d created, %(failed)d failed, "
+            "%(skipped)d skipped" % counts
+            + " (%.1f/s)" % (counts["processed"] / elapsed if elapsed else 0)
+        )
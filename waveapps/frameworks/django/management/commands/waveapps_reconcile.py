@@ -0,0 +1,56 @@
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from waveapps.reconcile import Reconciliation, read_orders, read_posted
+
+
+class Command(BaseCommand):
+    help = (
+        "Check a JSON lines file of /create-transaction payloads against "
+        "waveapps_import_transactions --state results and report missing and "
+        "duplicate orders, and orders recorded with another amount or currency"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="JSON lines file of payloads")
+        parser.add_argument(
+            "state", nargs="+", help="waveapps_import_transactions --state files"
+        )
+        parser.add_argument(
+            "--output", default="-", help="JSON lines report, - for stdout"
+        )
+        parser.add_argument(
+            "--partitions",
+            type=int,
+            default=64,
+            help="number of spill files; 1 joins everything in memory",
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.005,
+            help="largest amount difference that is not a recorded_mismatch",
+        )
+
+    def handle(self, *args, **options):
+        reconciliation = Reconciliation(options["partitions"], options["tolerance"])
+        posted = (row for path in options["state"] for row in read_posted(path))
+        output = sys.stdout
+        if options["output"] != "-":
+            output = open(options["output"], "w")
+        started = time.perf_counter()
+        try:
+            for item in reconciliation.run(read_orders(options["path"]), posted):
+                output.write(json.dumps(item._asdict()) + "\n")
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        self.stderr.write(
+            "%(orders)d orders, %(posted)d posted, %(missing)d missing, "
+            "%(duplicate)d duplicate, %(recorded_mismatch)d recorded mismatch, "
+            "%(unexpected)d unexpected" % reconciliation.counts
+            + " (%.1fs)" % (time.perf_counter() - started)
+        )
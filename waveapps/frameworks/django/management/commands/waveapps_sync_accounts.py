@@ -0,0 +1,55 @@
+import asyncio
+import time
+
+from django.core.management.base import CommandError
+
+from ...models import get_account_class
+from ..base import WaveCommand
+
+
+class Command(WaveCommand):
+    help = "Fetch the business accounts from Wave and mirror them locally"
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--prune",
+            action="store_true",
+            help="delete mirrored accounts that Wave no longer returns",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0,
+            help="keep running and refresh every N seconds",
+        )
+
+    def handle(self, *args, **options):
+        klass = get_account_class()
+        if not klass:
+            raise CommandError("Missing WAVEAPPS_ACCOUNT_CLASS in settings")
+        while True:
+            accounts = asyncio.run(self.fetch(options))
+            counts = klass.save_accounts(
+                options["business"], accounts, prune=options["prune"]
+            )
+            self.stdout.write(
+                "Synced %s accounts: %s created, %s updated, %s removed"
+                % (
+                    len(accounts),
+                    counts["created"],
+                    counts["updated"],
+                    counts["removed"],
+                )
+            )
+            if not options["interval"]:
+                return
+            time.sleep(options["interval"])
+
+    async def fetch(self, options):
+        business = self.build_business(options)
+        try:
+            await business.get_accounts()
+        finally:
+            await business.client.close()
+        return business.accounts
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from waveapps.idempotency import TransactionIndex, read_results
+
+from ... import settings as django_settings
+
+
+class Command(BaseCommand):
+    help = "Compact the local transaction index or rebuild it from import results"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--index",
+            default=django_settings.WAVEAPPS_TRANSACTION_INDEX,
+            help="transaction index file, defaults to WAVEAPPS_TRANSACTION_INDEX",
+        )
+        parser.add_argument(
+            "--rebuild",
+            nargs="+",
+            metavar="STATE",
+            help="replace the --business entries with the orders created in "
+            "these waveapps_import_transactions --state files",
+        )
+        parser.add_argument(
+            "--business",
+            default=django_settings.WAVEAPPS_BUSINESS_ID,
+            help="business the --rebuild results belong to",
+        )
+
+    def handle(self, *args, **options):
+        if not options["index"]:
+            raise CommandError("Missing --index or WAVEAPPS_TRANSACTION_INDEX")
+        index = TransactionIndex(options["index"])
+        before = index.lines
+        if options["rebuild"]:
+            if not options["business"]:
+                raise CommandError("--rebuild requires --business")
+            index.rebuild(
+                (
+                    row
+                    for path in options["rebuild"]
+                    for row in read_results(path, options["business"])
+                ),
+                businessId=options["business"],
+            )
+        else:
+            index.compact()
+        self.stdout.write(
+            "%d orders indexed, %d lines before, %d after"
+            % (len(index), before, index.lines)
+        )
@@ -0,0 +1,96 @@
+import typing
+
+from django.db import models, transaction
+from django.utils import timezone
+
+from . import settings as django_settings
+
+
+def get_account_class():
+    account_klass = django_settings.WAVEAPPS_ACCOUNT_CLASS
+    return account_klass() if account_klass else None
+
+
+class AbstractWaveAccount(models.Model):
+    """Local mirror of a business's Wave accounts.
+
+    Subclass it and point `WAVEAPPS_ACCOUNT_CLASS` at the subclass to have
+    `waveapps_sync_accounts` and the create-account view keep it current.
+    """
+
+    businessId = models.CharField(max_length=200)
+    accountId = models.CharField(max_length=200)
+    name = models.CharField(max_length=200, db_index=True)
+    subtype = models.CharField(max_length=100, db_index=True)
+    currency = models.CharField(max_length=3, db_index=True)
+    date_updated = models.DateTimeField(default=timezone.now)
+
+    mirrored_fields = ["name", "subtype", "currency"]
+
+    class Meta:
+        abstract = True
+        unique_together = [("businessId", "accountId")]
+
+    @staticmethod
+    def account_values(account: typing.Dict[str, str]) -> typing.Dict[str, str]:
+        return {
+            "name": account["name"],
+            "subtype": account["type"],
+            "currency": account["currency"],
+        }
+
+    @classmethod
+    def save_accounts(
+        cls,
+        businessId: str,
+        accounts: typing.Iterable[typing.Dict[str, str]],
+        prune: bool = False,
+        batch_size: int = 500,
+    ) -> typing.Dict[str, int]:
+        """Upsert `WaveBusiness.accounts` rows, writing only new or changed
+        accounts. With `prune`, rows missing from `accounts` are deleted."""
+        existing = {
+            x.accountId: x for x in cls.objects.filter(businessId=businessId)
+        }
+        now = timezone.now()
+        created, updated, seen = [], [], set()
+        for account in accounts:
+            seen.add(account["id"])
+            values = cls.account_values(account)
+            instance = existing.get(account["id"])
+            if not instance:
+                created.append(
+                    cls(
+                        businessId=businessId,
+                        accountId=account["id"],
+                        date_updated=now,
+                        **values
+                    )
+                )
+            elif any(getattr(instance, k) != v for k, v in values.items()):
+                for k, v in values.items():
+                    setattr(instance, k, v)
+                instance.date_updated = now
+                updated.append(instance)
+        removed = [k for k in existing if k not in seen] if prune else []
+        with transaction.atomic():
+            cls.objects.bulk_create(created, batch_size=batch_size)
+            cls.objects.bulk_update(
+                updated, cls.mirrored_fields + ["date_updated"], batch_size=batch_size
+            )
+            if removed:
+                cls.objects.filter(businessId=businessId, accountId__in=removed).delete()
+        return {
+            "created": len(created),
+            "updated": len(updated),
+            "removed": len(removed),
+        }
+
+    @classmethod
+    def upsert_account(cls, businessId: str, account: typing.Dict[str, str]):
+        instance, _ = cls.objects.update_or_create(
+            businessId=businessId,
+            accountId=account["id"],
+            defaults={**cls.account_values(account), "date_updated": timezone.now()},
+        )
+        return instance
@@ -21,3 +21,21 @@ WAVEAPPS_BUSINESS_ID = getattr(
     settings, "WAVEAPPS_BUSINESS_ID", os.getenv("WAVEAPPS_BUSINESS_ID")
 )
 
+WAVEAPPS_API_KEY = getattr(
+    settings, "WAVEAPPS_API_KEY", os.getenv("WAVEAPPS_API_KEY")
+)
+WAVEAPPS_MAX_CONNECTIONS = getattr(settings, "WAVEAPPS_MAX_CONNECTIONS", 20)
+WAVEAPPS_ACCOUNT_CLASS = getattr(settings, "WAVEAPPS_ACCOUNT_CLASS", lambda: None)
+WAVEAPPS_REQUEST_TIMEOUT = getattr(settings, "WAVEAPPS_REQUEST_TIMEOUT", 0.0)
+WAVEAPPS_TRANSACTION_INDEX = getattr(settings, "WAVEAPPS_TRANSACTION_INDEX", "")
+WAVEAPPS_LEDGER = getattr(settings, "WAVEAPPS_LEDGER", "")
+WAVEAPPS_WEBHOOK_CALLBACK = getattr(
+    settings, "WAVEAPPS_WEBHOOK_CALLBACK", os.getenv("WAVEAPPS_WEBHOOK_CALLBACK", "")
+)
+WAVEAPPS_WEBHOOK_BATCH_SIZE = getattr(settings, "WAVEAPPS_WEBHOOK_BATCH_SIZE", 1)
+WAVEAPPS_WEBHOOK_BATCH_WINDOW = getattr(settings, "WAVEAPPS_WEBHOOK_BATCH_WINDOW", 0.5)
+WAVEAPPS_WEBHOOK_MAX_RETRIES = getattr(settings, "WAVEAPPS_WEBHOOK_MAX_RETRIES", 3)
+WAVEAPPS_WEBHOOK_RETRY_FILE = getattr(settings, "WAVEAPPS_WEBHOOK_RETRY_FILE", "")
+WAVEAPPS_WEBHOOK_RETRY_QUEUE_SIZE = getattr(
+    settings, "WAVEAPPS_WEBHOOK_RETRY_QUEUE_SIZE", 10000
+)
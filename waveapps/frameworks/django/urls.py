@@ -1,3 +1,5 @@
+import functools
+import time
 import typing
 from django.urls import path
 from django.http import JsonResponse, HttpResponse, HttpResponseBadRequest
@@ -5,37 +7,89 @@ from django.shortcuts import reverse
 from django.views.decorators.csrf import csrf_exempt
 from waveapps.app import WaveStorageInterface as StorageInterface, WaveOauth
 from waveapps import WaveException, sync_to_async, async_to_sync
-from . import settings as django_settings
+from . import settings as django_settings, views
+
+
+@functools.lru_cache(maxsize=None)
+def get_storage_class():
+    storage_klass = django_settings.WAVEAPPS_STORAGE_CLASS
+    klass = storage_klass() if storage_klass else None
+    if not klass:
+        raise WaveException("Missing storage class in settings")
+    return klass
+
+
+# per-process token cache keyed by businessId, holding (expires_at, token fields)
+_token_cache: typing.Dict[typing.Optional[str], typing.Tuple[float, dict]] = {}
 
 
 class DjangoStorageInterface(StorageInterface):
+    token_fields = [
+        "userId",
+        "businessId",
+        "access_token",
+        "expires_in",
+        "refresh_token",
+        "date_added",
+    ]
+
     @property
     def klass(self):
-        storage_klass = django_settings.WAVEAPPS_STORAGE_CLASS
-        if not storage_klass:
-            raise WaveException("Missing storage class in settings")
-        klass = storage_klass()
-        return klass
-
-    @sync_to_async
-    def get_token(self, view_url):
-        result: typing.Optional[typing.Any] = self.klass.get_token()
-        if result:
-            self.userId = result.userId
-            self.businessId = result.businessId
-            self.access_token = result.access_token
-            self.expires_in = result.expires_in
-            self.refresh_token = result.refresh_token
-            self.date_added = result.date_added
+        return get_storage_class()
+
+    @property
+    def cache_key(self) -> typing.Optional[str]:
+        return self.businessId
+
+    def cache_token(self, **fields):
+        # cached under both the lookup key and the token's own businessId
+        keys = {self.cache_key}
+        for field in self.token_fields:
+            setattr(self, field, fields.get(field))
+        keys.add(self.cache_key)
+        expires_at = self.access_token_expires_at() or 0
+        for key in keys:
+            _token_cache[key] = (expires_at, fields)
+
+    def invalidate(self):
+        for key, (_, fields) in list(_token_cache.items()):
+            if key == self.cache_key or fields.get("businessId") == self.businessId:
+                del _token_cache[key]
+
+    def load_token(self) -> typing.Optional[dict]:
+        result: typing.Optional[typing.Any] = self.klass.get_token(
+            businessId=self.businessId
+        )
+        if not result:
+            return None
+        return {key: getattr(result, key) for key in self.token_fields}
+
+    async def get_token(self, view_url):
+        cached = _token_cache.get(self.cache_key)
+        if cached and cached[0] > time.time():
+            for field, value in cached[1].items():
+                setattr(self, field, value)
+            return self
+        fields = await sync_to_async(self.load_token)()
+        if fields:
+            self.cache_token(**fields)
         return self
 
-    @sync_to_async
-    def save_token(self, **token):
-        super().save_token(**token)
+    async def save_token(self, **token):
         businessId = token.pop("businessId", None)
         if not businessId:
             businessId = self.businessId
-        self.klass.save_token(businessId=businessId, **token)
+        result = await sync_to_async(self.klass.save_token)(
+            businessId=businessId, **token
+        )
+        self.cache_token(
+            **{
+                **token,
+                "businessId": businessId,
+                "date_added": getattr(result, "date_added", None),
+            }
+        )
+        return result
 
 
 def get_redirect_uri(request):
@@ -45,19 +99,28 @@ def get_redirect_uri(request):
     return url
 
 
-credentials = {
-    "client_id": django_settings.WAVEAPPS_CLIENT_ID,
-    "client_secret": django_settings.WAVEAPPS_CLIENT_SECRET,
-    "storage_interface": DjangoStorageInterface(),
-    "state": django_settings.WAVEAPPS_STATE,
-    "scopes": django_settings.WAVEAPPS_SCOPES,
-}
-if django_settings.WAVEAPPS_BUSINESS_ID:
-    credentials["businessId"] = django_settings.WAVEAPPS_BUSINESS_ID
+def get_credentials(business: str = None) -> typing.Dict[str, typing.Any]:
+    business = business or django_settings.WAVEAPPS_BUSINESS_ID
+    credentials = {
+        "client_id": django_settings.WAVEAPPS_CLIENT_ID,
+        "client_secret": django_settings.WAVEAPPS_CLIENT_SECRET,
+        "storage_interface": DjangoStorageInterface(businessId=business),
+        "state": django_settings.WAVEAPPS_STATE,
+        "scopes": django_settings.WAVEAPPS_SCOPES,
+    }
+    if business:
+        credentials["businessId"] = business
+        credentials["state"] = "%s:%s" % (django_settings.WAVEAPPS_STATE, business)
+    return credentials
 
 
 def waveapps_auth_response(request):
-    hub = WaveOauth(redirect_uri=get_redirect_uri(request), **credentials)
+    state, _, business = request.GET.get("state", "").partition(":")
+    if state != django_settings.WAVEAPPS_STATE:
+        return HttpResponseBadRequest("This is a bad request")
+    hub = WaveOauth(
+        redirect_uri=get_redirect_uri(request), **get_credentials(business)
+    )
     try:
         response = async_to_sync(hub.on_auth_response)(**request.GET.dict())
     except WaveException:
@@ -66,11 +129,14 @@ def waveapps_auth_response(request):
 
 
 def wave_authorize(request):
-    hub = WaveOauth(redirect_uri=get_redirect_uri(request), **credentials)
+    hub = WaveOauth(
+        redirect_uri=get_redirect_uri(request),
+        **get_credentials(request.GET.get("business"))
+    )
     return HttpResponse(hub.auth_button())
 
 
 urlpatterns = [
     path("auth-response", waveapps_auth_response, name="code"),
     path("authorize", wave_authorize, name="authorize"),
-]
+] + views.urlpatterns
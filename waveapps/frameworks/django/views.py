@@ -0,0 +1,290 @@
+"""Native async views for the service layer endpoints.
+
+Served from an ASGI deployment these run on the server's event loop without
+thread hops. Background tasks returned by the services are scheduled on the
+same loop once the response has been built, and webhooks go through one
+dispatcher that drains its retry queue on that loop.
+
+Under WSGI every request runs on a throwaway event loop that is closed as
+soon as the view returns, taking any task left on it along. So WSGI requests
+get an unpooled client, run the background tasks before responding and
+deliver their webhooks through a dispatcher of their own that is flushed and
+closed with the request. The retry queue is shared and drained by WSGI
+requests at most once per retry interval.
+"""
+import asyncio
+import functools
+import json
+import logging
+import math
+import time
+import typing
+import weakref
+
+import httpx
+from django.core.handlers.asgi import ASGIRequest
+from django.http import (
+    HttpResponse,
+    HttpResponseNotAllowed,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.urls import path
+
+from waveapps import WaveAPI, WaveBusiness, sync_to_async
+from waveapps.app import (
+    CircuitOpenError,
+    DeadlineExceeded,
+    WaveException,
+    WaveOauth,
+    deadline,
+)
+from waveapps.idempotency import TransactionIndex
+from waveapps.ledger import Ledger
+from waveapps.scheduler import INTERACTIVE, priority
+from waveapps.webhooks import RetryQueue, WebhookDispatcher
+from waveapps.frameworks.starlette import service_layer
+
+from . import settings as django_settings
+from .models import get_account_class
+
+logger = logging.getLogger(__name__)
+
+# pooled clients and shared businesses are bound to the loop they were made on
+_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_businesses: typing.Dict[typing.Tuple[str, str], WaveBusiness] = {}
+_background: typing.Set[asyncio.Future] = set()
+_hubs: typing.Dict[typing.Optional[str], WaveOauth] = {}
+transaction_index = (
+    TransactionIndex(django_settings.WAVEAPPS_TRANSACTION_INDEX)
+    if django_settings.WAVEAPPS_TRANSACTION_INDEX
+    else None
+)
+ledger = (
+    Ledger(django_settings.WAVEAPPS_LEDGER) if django_settings.WAVEAPPS_LEDGER else None
+)
+
+
+
+def build_dispatcher(retry_queue: RetryQueue = None) -> WebhookDispatcher:
+    return WebhookDispatcher(
+        django_settings.WAVEAPPS_WEBHOOK_CALLBACK,
+        batch_size=django_settings.WAVEAPPS_WEBHOOK_BATCH_SIZE,
+        batch_window=django_settings.WAVEAPPS_WEBHOOK_BATCH_WINDOW,
+        max_retries=django_settings.WAVEAPPS_WEBHOOK_MAX_RETRIES,
+        retry_path=django_settings.WAVEAPPS_WEBHOOK_RETRY_FILE or None,
+        retry_queue_size=django_settings.WAVEAPPS_WEBHOOK_RETRY_QUEUE_SIZE,
+        retry_queue=retry_queue,
+    )
+
+
+# used by ASGI requests, WSGI requests share its retry queue
+dispatcher = build_dispatcher()
+_drained_at = time.time()
+
+
+def get_client(api_key: str, pooled: bool = True) -> WaveAPI:
+    if not pooled:
+        return WaveAPI(api_key)
+    clients = _clients.setdefault(asyncio.get_event_loop(), {})
+    if api_key not in clients:
+        clients[api_key] = WaveAPI.pooled(
+            api_key, max_connections=django_settings.WAVEAPPS_MAX_CONNECTIONS
+        )
+    return clients[api_key]
+
+
+def get_business(
+    data, api_key: str, pooled: bool = True
+) -> typing.Optional[WaveBusiness]:
+    business_id = django_settings.WAVEAPPS_BUSINESS_ID
+    if business_id and pooled:
+        client = get_client(api_key)
+        business = _businesses.get((business_id, api_key))
+        if not business or business.client is not client:
+            business = WaveBusiness(
+                business_id, client, index=transaction_index, ledger=ledger
+            )
+            _businesses[(business_id, api_key)] = business
+        return business
+    business_id = business_id or (data and data.get("business"))
+    if business_id:
+        return WaveBusiness(
+            business_id,
+            get_client(api_key, pooled),
+            index=transaction_index,
+            ledger=ledger,
+        )
+    return None
+
+
+def get_oauth(business_id: str = None) -> typing.Optional[WaveOauth]:
+    """Per-process hub serving the stored OAuth token of `business_id`."""
+    client_id = django_settings.WAVEAPPS_CLIENT_ID
+    if not client_id or not django_settings.WAVEAPPS_CLIENT_SECRET:
+        return None
+    if business_id not in _hubs:
+        from .urls import get_credentials  # urls imports this module
+
+        _hubs[business_id] = WaveOauth("", **get_credentials(business_id))
+    return _hubs[business_id]
+
+
+async def get_api_key(request) -> typing.Optional[str]:
+    auth = request.headers.get("Authorization")
+    if auth:
+        return auth.replace("Bearer", "").strip()
+    if django_settings.WAVEAPPS_API_KEY:
+        return django_settings.WAVEAPPS_API_KEY
+    hub = get_oauth(django_settings.WAVEAPPS_BUSINESS_ID)
+    if hub:
+        return await hub.get_access_token()
+    return None
+
+
+def run_in_background(func: typing.Callable, *args, **kwargs):
+    if asyncio.iscoroutinefunction(func):
+        future = asyncio.ensure_future(func(*args, **kwargs))
+    else:
+        future = asyncio.get_event_loop().run_in_executor(
+            None, functools.partial(func, *args, **kwargs)
+        )
+    _background.add(future)
+    future.add_done_callback(_background.discard)
+
+
+async def run_tasks(result: service_layer.WaveResult, webhooks: WebhookDispatcher):
+    """Run the background tasks of `result` before responding, for WSGI
+    requests whose loop won't outlive the response."""
+    global _drained_at
+    for task in result.tasks or []:
+        func, args, kwargs = service_layer.split_task(task)
+        try:
+            if asyncio.iscoroutinefunction(func):
+                await func(*args, **kwargs)
+            else:
+                await sync_to_async(func)(*args, **kwargs)
+        except Exception:
+            logger.exception("Background task %r failed", func)
+    result.tasks = None
+    due = time.time() - _drained_at >= webhooks.retry_interval
+    if len(webhooks.retry_queue) and due:
+        _drained_at = time.time()
+        await webhooks.retry_pending()
+    await webhooks.close()
+
+
+async def mirror_account(business: WaveBusiness, result: service_layer.WaveResult):
+    klass = get_account_class()
+    if klass and result.data and not result.errors:
+        await sync_to_async(klass.upsert_account)(business.businessId, result.data)
+
+
+def build_response(result: service_layer.WaveResult) -> HttpResponse:
+    if result.errors:
+        return JsonResponse({"status": False, **result.errors}, status=400)
+    for task in result.tasks or []:
+        func, args, kwargs = service_layer.split_task(task)
+        run_in_background(func, *args, **kwargs)
+    if result.stream is not None:
+        response = StreamingHttpResponse(
+            result.stream, status=result.status_code, content_type=result.media_type
+        )
+    elif result.status_code == 304:
+        response = HttpResponse(status=304)
+    elif result.raw is not None:
+        response = HttpResponse(
+            result.raw, status=result.status_code, content_type="application/json"
+        )
+    else:
+        _result: typing.Dict[str, typing.Any] = {"status": True}
+        if result.data:
+            _result.update(data=result.data)
+        response = JsonResponse(_result, status=result.status_code)
+    for key, value in (result.headers or {}).items():
+        response[key] = value
+    return response
+
+
+def build_view(
+    func: typing.Callable,
+    methods: typing.List[str] = ["POST"],
+    on_result: typing.Callable = None,
+    business: bool = True,
+) -> typing.Callable:
+    requires_business = business
+
+    async def view(request, **path_params):
+        if request.method not in methods:
+            return HttpResponseNotAllowed(methods)
+        try:
+            api_key = await get_api_key(request)
+        except WaveException as e:
+            return JsonResponse({"status": False, "msg": str(e)}, status=403)
+        if not api_key:
+            return JsonResponse(
+                {"status": False, "msg": "Missing WAVEAPPS_API_KEY or OAUTH_TOKEN "},
+                status=403,
+            )
+        post_data = None
+        query_params = request.GET.dict()
+        if request.method == "POST":
+            try:
+                post_data = json.loads(request.body or b"{}")
+            except ValueError:
+                return JsonResponse(
+                    {"status": False, "msg": "Invalid JSON body"}, status=400
+                )
+        asgi = isinstance(request, ASGIRequest)
+        business = get_business(post_data or query_params, api_key, asgi)
+        if not business and requires_business:
+            return JsonResponse(
+                {"status": False, "msg": "Missing business"}, status=400
+            )
+        webhooks = dispatcher if asgi else build_dispatcher(dispatcher.retry_queue)
+        timeout = service_layer.get_request_timeout(
+            request.headers, django_settings.WAVEAPPS_REQUEST_TIMEOUT
+        )
+        try:
+            with deadline(timeout), priority(INTERACTIVE):
+                result = await func(
+                    data=post_data,
+                    business=business,
+                    query_params=query_params,
+                    headers=request.headers,
+                    path_params=path_params,
+                    webhooks=webhooks,
+                )
+        except CircuitOpenError as e:
+            response = JsonResponse({"status": False, "msg": str(e)}, status=503)
+            response["Retry-After"] = str(math.ceil(e.retry_after) or 1)
+            return response
+        except DeadlineExceeded as e:
+            return JsonResponse({"status": False, "msg": str(e)}, status=504)
+        except httpx.HTTPError as e:
+            hub = _hubs.get(django_settings.WAVEAPPS_BUSINESS_ID)
+            if hub and getattr(e.response, "status_code", None) == 401:
+                # the stored token may have been replaced by another process
+                hub.invalidate_token()
+            raise
+        if on_result:
+            await on_result(business, result)
+        if not asgi:
+            await run_tasks(result, webhooks)
+        return build_response(result)
+
+    # csrf_exempt wraps views in a sync function, flag the coroutine instead
+    view.csrf_exempt = True
+    return view
+
+
+result_hooks = {"/create-account": mirror_account}
+
+urlpatterns = [
+    path(
+        key.lstrip("/"),
+        build_view(on_result=result_hooks.get(key), **value),
+        name=key.strip("/"),
+    )
+    for key, value in service_layer.service.items()
+]
@@ -1,3 +1,5 @@
+import asyncio
+import math
 import typing
 
 from starlette import requests
@@ -14,10 +16,20 @@ from starlette.middleware import Middleware
 from starlette.middleware.authentication import AuthenticationMiddleware
 from starlette.middleware.trustedhost import TrustedHostMiddleware
 from starlette.requests import HTTPConnection, Request
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, Response, StreamingResponse
 from starlette.routing import Route
 
 from waveapps import WaveAPI, WaveBusiness
+from waveapps.scheduler import INTERACTIVE, SchedulerRegistry, priority
+from waveapps.app import (
+    CircuitBreakerRegistry,
+    CircuitOpenError,
+    DeadlineExceeded,
+    WaveException,
+    WaveOauth,
+    WaveStorageInterface,
+    deadline,
+)
 
 from . import service_layer, settings
 
@@ -26,25 +38,73 @@ def on_auth_error(request: Request, exc: Exception):
     return JSONResponse({"status": False, "msg": str(exc)}, status_code=403)
 
 
-def get_business(state, data, token) -> WaveBusiness:
-    if hasattr(state, "WAVE_BUSINESS"):
+def get_business(state, data, token) -> typing.Optional[WaveBusiness]:
+    if getattr(state, "WAVE_BUSINESS", None):
         business = state.WAVE_BUSINESS
+    elif not data or not data.get("business"):
+        return None
     else:
-        business = WaveBusiness(data["business"], WaveAPI(token))
+        business = WaveBusiness(
+            data["business"],
+            WaveAPI(
+                token,
+                breakers=getattr(state, "CIRCUIT_BREAKERS", None),
+                schedulers=getattr(state, "SCHEDULERS", None),
+            ),
+            index=service_layer.transaction_index,
+            ledger=service_layer.ledger,
+        )
     return business
 
 
+def build_oauth(business_id: str = None) -> typing.Optional[WaveOauth]:
+    """Hub refreshing the access token from WAVEAPPS_REFRESH_TOKEN, when the
+    client credentials are configured."""
+    if not (
+        str(settings.WAVEAPPS_CLIENT_ID)
+        and str(settings.WAVEAPPS_CLIENT_SECRET)
+        and str(settings.WAVEAPPS_REFRESH_TOKEN)
+    ):
+        return None
+    storage = WaveStorageInterface(businessId=business_id or None)
+    storage.access_token = None
+    storage.refresh_token = str(settings.WAVEAPPS_REFRESH_TOKEN)
+    return WaveOauth(
+        "",
+        str(settings.WAVEAPPS_CLIENT_ID),
+        str(settings.WAVEAPPS_CLIENT_SECRET),
+        state=settings.WAVEAPPS_STATE,
+        storage_interface=storage,
+        businessId=business_id or "",
+    )
+
+
+async def run_with_deadline(coroutine: typing.Awaitable, timeout: float):
+    with deadline(timeout), priority(INTERACTIVE):
+        return await coroutine
+
+
 class ViewMixin:
+    disconnect_poll_interval = 0.5
+
     def __init__(
         self,
         service: typing.Dict[str, typing.Dict[str, typing.Any]],
         api_key: typing.Optional[str] = None,
         business_id: typing.Optional[str] = None,
         serverless_function: typing.Callable = None,
+        oauth: WaveOauth = None,
+        breakers: CircuitBreakerRegistry = None,
+        schedulers: SchedulerRegistry = None,
     ):
         self.api_key = api_key
         self.business_id = business_id
-        self.client = WaveAPI(self.api_key)
+        self.oauth = oauth
+        self.breakers = breakers or CircuitBreakerRegistry()
+        self.schedulers = schedulers or SchedulerRegistry()
+        self.client = WaveAPI(
+            self.api_key, breakers=self.breakers, schedulers=self.schedulers
+        )
         self.serverless_function = serverless_function
         self.routes: typing.List[Route] = [
             self.build_routes(key, **value) for key, value in service.items()
@@ -53,17 +113,29 @@ class ViewMixin:
     @property
     def business(self) -> typing.Optional[WaveBusiness]:
         if self.business_id:
-            return WaveBusiness(self.business_id, self.client)
+            return WaveBusiness(
+                self.business_id,
+                self.client,
+                index=service_layer.transaction_index,
+                ledger=service_layer.ledger,
+            )
         return None
 
     def build_token_backend(_self):
         class TokenBackend(AuthenticationBackend):
             async def authenticate(self, request: HTTPConnection):
-                if "Authorization" not in request.headers:
-                    bearer_token = _self.api_key
-                else:
+                if "Authorization" in request.headers:
                     auth = request.headers["Authorization"]
                     bearer_token = auth.replace("Bearer", "").strip()
+                elif _self.oauth:
+                    # keep the shared client on the current token
+                    try:
+                        bearer_token = await _self.oauth.get_access_token()
+                    except WaveException as e:
+                        raise AuthenticationError(str(e))
+                    _self.client.api_key = bearer_token
+                else:
+                    bearer_token = _self.api_key
                 if not bearer_token:
                     raise AuthenticationError(
                         "Missing WAVEAPPS_API_KEY or OAUTH_TOKEN "
@@ -78,7 +150,10 @@ class ViewMixin:
         return JSONResponse(data, status_code=status_code, background=tasks)
 
     async def build_response(
-        self, coroutine: typing.Awaitable, status_code: int = 400
+        self,
+        coroutine: typing.Awaitable,
+        status_code: int = 400,
+        request: Request = None,
     ) -> typing.Union[JSONResponse]:
         result: service_layer.WaveResult = await coroutine
         tasks = BackgroundTasks()
@@ -88,27 +163,89 @@ class ViewMixin:
             )
         if result.tasks:
             for i in result.tasks:
-                if type(i) in [list, tuple]:
-                    try:
-                        dict_index = [type(o) for o in i].index(dict)
-                        kwarg_props = i[dict_index]
-                        args_props = i[0:dict_index]
-                        tasks.add_task(*args_props, **kwarg_props)
-                    except ValueError:
-                        tasks.add_task(*i)
-                else:
-                    tasks.add_task(i)
+                func, args, kwargs = service_layer.split_task(i)
+                tasks.add_task(func, *args, **kwargs)
+        if result.stream is not None:
+            stream = result.stream
+            if request is not None:
+                stream = self.until_disconnect(request, stream)
+            return StreamingResponse(
+                stream,
+                status_code=result.status_code,
+                headers=result.headers,
+                media_type=result.media_type,
+                background=tasks,
+            )
+        if result.status_code == 304:
+            return Response(status_code=304, headers=result.headers, background=tasks)
+        if result.raw is not None:
+            return Response(
+                result.raw,
+                status_code=result.status_code,
+                headers=result.headers,
+                media_type=JSONResponse.media_type,
+                background=tasks,
+            )
         _result: typing.Dict[str, typing.Any] = {"status": True}
         if result.data:
             _result.update(data=result.data)
-        return self.json_response(_result, tasks=tasks)
+        response = self.json_response(_result, result.status_code, tasks=tasks)
+        response.headers.update(result.headers or {})
+        return response
+
+    async def until_disconnect(
+        self, request: Request, stream: typing.AsyncIterator[bytes]
+    ) -> typing.AsyncIterator[bytes]:
+        """Stop producing a streamed body, and its upstream calls, once the
+        client has gone away."""
+        try:
+            async for chunk in stream:
+                yield chunk
+                if await request.is_disconnected():
+                    return
+        finally:
+            close = getattr(stream, "aclose", None)
+            if close:
+                await close()
+
+    async def watch_disconnect(self, request: Request, task: asyncio.Future):
+        while not task.done():
+            await asyncio.sleep(self.disconnect_poll_interval)
+            if await request.is_disconnected():
+                task.cancel()
+                return
+
+    async def run_service(
+        self, request: Request, coroutine: typing.Awaitable
+    ) -> typing.Union[JSONResponse]:
+        """Run the service under the request's deadline, cancelling the
+        upstream work if the client goes away first."""
+        timeout = service_layer.get_request_timeout(
+            request.headers, settings.REQUEST_TIMEOUT
+        )
+        task = asyncio.ensure_future(run_with_deadline(coroutine, timeout))
+        watcher = asyncio.ensure_future(self.watch_disconnect(request, task))
+        try:
+            return await self.build_response(task, request=request)
+        except asyncio.CancelledError:
+            if not await request.is_disconnected():
+                raise
+            return JSONResponse(
+                {"status": False, "msg": "Client disconnected"}, status_code=499
+            )
+        finally:
+            watcher.cancel()
 
     def build_view(
         self,
         func: typing.Callable,
         methods: typing.List[str] = ["POST"],
         auth: str = "authenticated",
+        business: bool = True,
     ) -> typing.Callable:
+        """`business` is whether the service needs one."""
+        requires_business = business
+
         async def f(request: Request):
             post_data = None
             business = None
@@ -121,15 +258,31 @@ class ViewMixin:
                 business = get_business(
                     request.app.state, request.query_params, request.user.username
                 )
-            return await self.build_response(
-                func(
-                    data=post_data,
-                    business=business,
-                    query_params=request.query_params,
-                    headers=request.headers,
-                    path_params=request.path_params,
+            if business is None and requires_business:
+                return JSONResponse(
+                    {"status": False, "msg": "Missing business"}, status_code=400
                 )
-            )
+            try:
+                return await self.run_service(
+                    request,
+                    func(
+                        data=post_data,
+                        business=business,
+                        query_params=request.query_params,
+                        headers=request.headers,
+                        path_params=request.path_params,
+                        breakers=getattr(request.app.state, "CIRCUIT_BREAKERS", None),
+                        schedulers=getattr(request.app.state, "SCHEDULERS", None),
+                    ),
+                )
+            except CircuitOpenError as e:
+                return JSONResponse(
+                    {"status": False, "msg": str(e)},
+                    status_code=503,
+                    headers={"Retry-After": str(math.ceil(e.retry_after) or 1)},
+                )
+            except DeadlineExceeded as e:
+                return JSONResponse({"status": False, "msg": str(e)}, status_code=504)
 
         function = f
         if auth:
@@ -139,18 +292,31 @@ class ViewMixin:
         return function
 
     def build_routes(
-        self, path: str, func: typing.Callable, methods: typing.List[str] = ["POST"]
+        self,
+        path: str,
+        func: typing.Callable,
+        methods: typing.List[str] = ["POST"],
+        business: bool = True,
     ) -> Route:
-        function = self.build_view(func, methods)
+        function = self.build_view(func, methods, business=business)
         return Route(path, function, methods=methods)
 
 
 def build_app(api_key=None, business_id=None, serverless_function=None):
+    business_id = business_id or settings.WAVE_BUSINESS_ID
     app_views = ViewMixin(
         service_layer.service,
         api_key=api_key or str(settings.WAVEAPPS_API_KEY),
-        business_id=business_id or settings.WAVE_BUSINESS_ID,
+        business_id=business_id,
         serverless_function=serverless_function,
+        oauth=None if api_key else build_oauth(business_id),
+        breakers=CircuitBreakerRegistry(
+            failure_threshold=settings.CIRCUIT_FAILURE_THRESHOLD,
+            recovery_timeout=settings.CIRCUIT_RECOVERY_TIMEOUT,
+        ),
+        schedulers=SchedulerRegistry(
+            settings.MAX_CONCURRENCY, settings.RESERVED_INTERACTIVE
+        ),
     )
     token_backend = app_views.build_token_backend()
     app = Starlette(
@@ -163,6 +329,31 @@ def build_app(api_key=None, business_id=None, serverless_function=None):
             ),
             Middleware(TrustedHostMiddleware, allowed_hosts=settings.ALLOWED_HOSTS),
         ],
+        on_startup=[service_layer.dispatcher.start],
+        on_shutdown=[service_layer.dispatcher.close],
     )
     app.state.WAVE_BUSINESS = app_views.business
+
+    app.state.WAVE_OAUTH = app_views.oauth
+    app.state.CIRCUIT_BREAKERS = app_views.breakers
+    app.state.SCHEDULERS = app_views.schedulers
+
+    @app.on_event("startup")
+    async def start_refresher():
+        if app.state.WAVE_OAUTH:
+            app.state.WAVE_OAUTH.start_refresher()
+        business = app.state.WAVE_BUSINESS
+        if business and settings.ACCOUNTS_REFRESH_INTERVAL:
+            business.start_refresher(
+                settings.ACCOUNTS_REFRESH_INTERVAL,
+                page_size=settings.ACCOUNTS_PAGE_SIZE,
+            )
+
+    @app.on_event("shutdown")
+    async def stop_refresher():
+        if app.state.WAVE_OAUTH:
+            await app.state.WAVE_OAUTH.stop_refresher()
+        if app.state.WAVE_BUSINESS:
+            await app.state.WAVE_BUSINESS.stop_refresher()
+
     return app
@@ -1,8 +1,35 @@
-import datetime
+import asyncio
+import time
 import typing
-from waveapps import models, WaveBusiness, TransactionAccounts, request_helper
+from waveapps import models, WaveBusiness, TransactionAccounts, WaveException
+from waveapps.app import circuit_breakers, deadline, request_deadline
+from waveapps.idempotency import TransactionIndex
+from waveapps.ledger import Ledger
+from waveapps.registry import ACCOUNT_FIELDS, dumps, matches, project
+from waveapps.schemas import (
+    TransactionPayload,
+    ValidationError,
+    decode_account,
+    decode_transaction,
+)
+from waveapps.scheduler import priority, request_priority, schedulers
+from waveapps.webhooks import WebhookDispatcher
 from . import settings
 
+dispatcher = WebhookDispatcher(
+    settings.WEBHOOK_CALLBACK,
+    batch_size=settings.WEBHOOK_BATCH_SIZE,
+    batch_window=settings.WEBHOOK_BATCH_WINDOW,
+    max_retries=settings.WEBHOOK_MAX_RETRIES,
+    retry_path=settings.WEBHOOK_RETRY_FILE or None,
+    retry_queue_size=settings.WEBHOOK_RETRY_QUEUE_SIZE,
+)
+
+transaction_index = (
+    TransactionIndex(settings.TRANSACTION_INDEX) if settings.TRANSACTION_INDEX else None
+)
+ledger = Ledger(settings.LEDGER) if settings.LEDGER else None
+
 
 class WaveResult:
     def __init__(
@@ -10,24 +37,64 @@ class WaveResult:
         errors: dict = None,
         data: dict = None,
         tasks: typing.List[typing.Any] = None,
+        headers: typing.Dict[str, str] = None,
+        status_code: int = 200,
+        raw: bytes = None,
+        stream: typing.AsyncIterator[bytes] = None,
+        media_type: str = "application/json",
     ):
         self.errors = errors
         self.tasks = tasks
         self.data = data
+        self.headers = headers
+        self.status_code = status_code
+        # pre-rendered JSON body, sent as is
+        self.raw = raw
+        # body chunks streamed as they are produced
+        self.stream = stream
+        self.media_type = media_type
+
+
+def split_task(
+    task: typing.Any,
+) -> typing.Tuple[typing.Callable, typing.Tuple, typing.Dict[str, typing.Any]]:
+    """Split a WaveResult task, either a callable or a (func, *args, kwargs)
+    sequence, into the function and its arguments."""
+    if type(task) in [list, tuple]:
+        try:
+            dict_index = [type(o) for o in task].index(dict)
+            return task[0], tuple(task[1:dict_index]), task[dict_index]
+        except ValueError:
+            return task[0], tuple(task[1:]), {}
+    return task, (), {}
+
+
+def get_request_timeout(headers, default: float = 0.0) -> float:
+    """Deadline budget for a request: the `X-Request-Timeout` header in
+    seconds, capped by the configured default when there is one."""
+    try:
+        value = float(headers.get("X-Request-Timeout") or 0)
+    except ValueError:
+        value = 0.0
+    if value <= 0:
+        return default
+    return min(value, default) if default else value
+
+
+def invalid(e: ValidationError) -> WaveResult:
+    return WaveResult(errors={"msg": "Invalid payload", "errors": e.errors})
 
 
 async def create_account(data, business: WaveBusiness, **kwargs) -> WaveResult:
-    mapping = {
-        "asset": models.AccountSubTypeValue.OTHER_CURRENT_ASSETS,
-        "liability": models.AccountSubTypeValue.OTHER_CURRENT_LIABILITY,
-        "expense": models.AccountSubTypeValue.EXPENSE,
-        "fee": models.AccountSubTypeValue.PAYMENT_PROCESSING_FEES,
-    }
+    try:
+        payload = decode_account(data)
+    except ValidationError as e:
+        return invalid(e)
     result = await business.create_new_account(
-        data["name"],
-        data.get("description"),
-        currency=data["currency"].lower(),
-        accountType=mapping[data["type"]],
+        payload.name,
+        payload.description,
+        currency=payload.currency.value.lower(),
+        accountType=payload.type,
     )
     if not result:
         return WaveResult(errors={"msg": "Could not create account"})
@@ -41,57 +108,181 @@ async def create_account(data, business: WaveBusiness, **kwargs) -> WaveResult:
     )
 
 
+def etag_matches(if_none_match: typing.Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [x.strip() for x in if_none_match.split(",")]
+    return "*" in tags or etag in tags or "W/" + etag in tags
+
+
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "json": "application/json"}
+
+
+async def stream_accounts(
+    business: WaveBusiness,
+    output: str,
+    fields: typing.List[str] = None,
+    type: str = None,
+    currency: str = None,
+) -> WaveResult:
+    """Stream accounts page by page, as NDJSON lines or as the usual
+    `{"status": true, "data": [...]}` body written incrementally."""
+    if output not in STREAM_MEDIA_TYPES:
+        return WaveResult(errors={"msg": "Unknown stream format %s" % output})
+    # fetch the first page up front so upstream errors still get a status code
+    first_page = asyncio.ensure_future(
+        business.get_accounts_page(1, settings.ACCOUNTS_PAGE_SIZE)
+    )
+    await first_page
+    pages = business.iter_account_pages(settings.ACCOUNTS_PAGE_SIZE, first_page)
+    # the body is produced after the service returns, outside of the
+    # request's deadline and lane, so carry them over to the later pages
+    expires, lane = request_deadline.get(), request_priority.get()
+
+    async def generate() -> typing.AsyncIterator[bytes]:
+        timeout = None
+        if expires is not None:
+            timeout = max(expires - time.monotonic(), 1e-6)
+        chunks = generate_chunks()
+        try:
+            with deadline(timeout), priority(lane):
+                async for chunk in chunks:
+                    yield chunk
+        finally:
+            # cancel the prefetched page when the body is abandoned
+            await chunks.aclose()
+            await pages.aclose()
+
+    async def generate_chunks() -> typing.AsyncIterator[bytes]:
+        separator = b""
+        if output == "json":
+            yield b'{"status":true,"data":['
+        async for page in pages:
+            chunk = [
+                dumps(project(x, fields))
+                for x in map(business.account_values, page)
+                if matches(x, type, currency)
+            ]
+            if not chunk:
+                continue
+            if output == "ndjson":
+                yield b"\n".join(chunk) + b"\n"
+            else:
+                yield separator + b",".join(chunk)
+                separator = b","
+        if output == "json":
+            yield b"]}"
+
+    return WaveResult(stream=generate(), media_type=STREAM_MEDIA_TYPES[output])
+
+
 async def get_accounts(**kwargs) -> WaveResult:
     business: WaveBusiness = kwargs.get("business")
-    await business.get_accounts()
-    return WaveResult(data=business.accounts)
+    query_params = kwargs.get("query_params") or {}
+    headers = kwargs.get("headers") or {}
+    fields = [x.strip() for x in (query_params.get("fields") or "").split(",")]
+    fields = [x for x in fields if x]
+    unknown = [x for x in fields if x not in ACCOUNT_FIELDS]
+    if unknown:
+        return WaveResult(errors={"msg": "Unknown fields %s" % ",".join(unknown)})
+    view = dict(
+        fields=fields,
+        type=query_params.get("type"),
+        currency=query_params.get("currency"),
+    )
+    if query_params.get("stream"):
+        return await stream_accounts(business, query_params["stream"], **view)
+    # the snapshot is served while fresh, or while a refresher keeps it current
+    if not business.snapshot.generation or (
+        not business.refreshing and business.accounts_age >= settings.ACCOUNTS_MAX_AGE
+    ):
+        await business.get_accounts()
+    registry = business.registry
+    response_headers = {
+        "ETag": registry.etag(**view),
+        "Cache-Control": settings.ACCOUNTS_CACHE_CONTROL,
+    }
+    if etag_matches(headers.get("If-None-Match"), response_headers["ETag"]):
+        return WaveResult(headers=response_headers, status_code=304)
+    _, body = registry.render(**view)
+    return WaveResult(headers=response_headers, raw=body)
+
+
+def build_transaction_kwargs(
+    data: typing.Union[typing.Dict[str, typing.Any], TransactionPayload]
+) -> typing.Dict[str, typing.Any]:
+    """Map a `/create-transaction` payload to `WaveBusiness.create_transaction`
+    keyword arguments. Anything but a decoded `TransactionPayload` goes
+    through `decode_transaction` and raises `ValidationError` when invalid."""
+    payload = data
+    if not isinstance(data, TransactionPayload):
+        payload = decode_transaction(data)
+    kwargs = dict(
+        orderId=payload.order,
+        date=payload.date,
+        description=payload.description,
+        amount=payload.amount,
+        kind=payload.kind,
+        accounts=TransactionAccounts(
+            _from=payload.accounts.from_,
+            to=payload.accounts.to,
+            charges=payload.accounts.charges,
+        ),
+        currency=payload.currency,
+    )
+    if payload.create_accounts:
+        kwargs["create_accounts"] = True
+    if payload.taxes:
+        kwargs["taxes"] = payload.taxes
+    if payload.service_fee:
+        kwargs["charge_amount"] = payload.service_fee
+        kwargs["charge_description"] = payload.service_fee_description
+    if payload.additional_items:
+        kwargs["additional_line_item"] = [
+            {
+                "accountId": x.account,
+                "amount": "%.2f" % x.amount,
+                "balance": models.BalanceType.CREDIT.value
+                if x.kind == "expense"
+                else models.BalanceType.DEBIT.value,
+                "description": x.description,
+                "taxes": x.taxes,
+            }
+            for x in payload.additional_items
+        ]
+    return kwargs
 
 
 async def create_transaction(data, business, **kwargs):
+    # frameworks with their own webhook settings pass their dispatcher
+    webhooks: WebhookDispatcher = kwargs.get("webhooks") or dispatcher
+    try:
+        transaction = build_transaction_kwargs(data)
+    except ValidationError as e:
+        return invalid(e)
+    # refuse up front rather than accepting work the upstream can't take
+    business.client.ensure_available("mutation")
+
     async def _create_transaction():
-        kwargs = dict(
-            orderId=data["order"],
-            date=datetime.datetime.strptime(data["date"], "%Y-%m-%d"),
-            description=data["description"],
-            amount=data["amount"],
-            kind=models.MoneyFlow.INFlOW
-            if data["kind"].lower() == "income"
-            else models.MoneyFlow.OUTFLOW,
-            accounts=TransactionAccounts(**data["accounts"]),
-            currency=models.CurrencyCode(data["currency"].upper()),
-        )
-        if data.get("service_fee"):
-            kwargs["charge_amount"] = data["service_fee"]
-            kwargs["charge_description"] = data["service_fee_description"]
-        if data.get("additional_items"):
-            kwargs["additional_line_item"] = [
-                {
-                    "accountId": x["account"],
-                    "amount": "%.2f" % x["amount"],
-                    "balance": models.BalanceType.CREDIT.value
-                    if x["kind"] == "expense"
-                    else models.BalanceType.DEBIT.value,
-                    "description": x["description"],
-                    "taxes": x.get("taxes") or [],
-                }
-                for x in data["additional_items"]
-            ]
-        result = await business.create_transaction(**kwargs)
+        try:
+            result = await business.create_transaction(**transaction)
+        except WaveException as e:
+            await webhooks.dispatch(
+                {"order": data["order"], "created": False, "id": None, "error": str(e)}
+            )
+            return
         created = bool(result.transaction)
         _id = None
         if created:
             _id = result.transaction.id
-        if settings.WEBHOOK_CALLBACK:
-            result = await request_helper(
-                settings.WEBHOOK_CALLBACK,
-                "POST",
-                json={"order": data["order"], "created": created, "id": _id},
-            )
+        await webhooks.dispatch(
+            {"order": data["order"], "created": created, "id": _id}
+        )
 
     return WaveResult(
         data={
             "msg": "creating transaction. listen to {} to update".format(
-                settings.WEBHOOK_CALLBACK
+                webhooks.url
             )
         },
         tasks=[_create_transaction],
@@ -99,8 +290,50 @@ async def create_transaction(data, business, **kwargs):
     tasks.add_task(_create_transaction)
 
 
+async def get_metrics(**kwargs) -> WaveResult:
+    """Metrics of the registries the app passes in, else of the business's
+    client, else of the process wide ones."""
+    business: typing.Optional[WaveBusiness] = kwargs.get("business")
+    webhooks: WebhookDispatcher = kwargs.get("webhooks") or dispatcher
+    breakers, _schedulers = circuit_breakers, schedulers
+    if business:
+        breakers, _schedulers = business.client.breakers, business.client.schedulers
+    breakers = kwargs.get("breakers") or breakers
+    _schedulers = kwargs.get("schedulers") or _schedulers
+    return WaveResult(
+        data={
+            "webhooks": webhooks.metrics(),
+            "circuit_breakers": breakers.metrics(),
+            "schedulers": _schedulers.metrics(),
+        }
+    )
+
+
+async def get_ledger(**kwargs) -> WaveResult:
+    business: WaveBusiness = kwargs.get("business")
+    query_params = kwargs.get("query_params") or {}
+    if business.ledger is None:
+        return WaveResult(errors={"msg": "The ledger is not enabled"})
+    by = (query_params.get("by") or "account,day,currency").split(",")
+    try:
+        totals = await business.ledger.run(
+            business.ledger.totals,
+            [x.strip() for x in by if x.strip()],
+            businessId=business.businessId,
+            account=query_params.get("account"),
+            currency=query_params.get("currency"),
+            since=query_params.get("since"),
+            until=query_params.get("until"),
+        )
+    except WaveException as e:
+        return WaveResult(errors={"msg": str(e)})
+    return WaveResult(data=totals)
+
+
 service = {
     "/create-transaction": {"func": create_transaction, "methods": ["POST"]},
     "/create-account": {"func": create_account, "methods": ["POST"]},
     "/accounts": {"func": get_accounts, "methods": ["GET"]},
+    "/metrics": {"func": get_metrics, "methods": ["GET"], "business": False},
+    "/ledger": {"func": get_ledger, "methods": ["GET"]},
 }
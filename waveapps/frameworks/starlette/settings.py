@@ -6,9 +6,36 @@ config = Config(".env")
 WAVEAPPS_API_KEY = config("WAVEAPPS_API_KEY", cast=Secret, default="")
 WAVEAPPS_CLIENT_ID = config("WAVEAPPS_CLIENT_ID", cast=Secret, default="")
 WAVEAPPS_CLIENT_SECRET = config("WAVEAPPS_CLIENT_SECRET", cast=Secret, default="")
+WAVEAPPS_REFRESH_TOKEN = config("WAVEAPPS_REFRESH_TOKEN", cast=Secret, default="")
 WAVEAPPS_STATE = config("WAVEAPPS_STATE", default="starlette-server")
 WAVE_BUSINESS_ID = config("WAVEAPPS_BUSINESS_ID", default="")
 WEBHOOK_CALLBACK = config("WAVEAPPS_WEBHOOK_CALLBACK", default="")
+WEBHOOK_BATCH_SIZE = config("WAVEAPPS_WEBHOOK_BATCH_SIZE", cast=int, default=1)
+WEBHOOK_BATCH_WINDOW = config("WAVEAPPS_WEBHOOK_BATCH_WINDOW", cast=float, default=0.5)
+WEBHOOK_MAX_RETRIES = config("WAVEAPPS_WEBHOOK_MAX_RETRIES", cast=int, default=3)
+WEBHOOK_RETRY_FILE = config("WAVEAPPS_WEBHOOK_RETRY_FILE", default="")
+WEBHOOK_RETRY_QUEUE_SIZE = config(
+    "WAVEAPPS_WEBHOOK_RETRY_QUEUE_SIZE", cast=int, default=10000
+)
+CIRCUIT_FAILURE_THRESHOLD = config(
+    "WAVEAPPS_CIRCUIT_FAILURE_THRESHOLD", cast=int, default=5
+)
+CIRCUIT_RECOVERY_TIMEOUT = config(
+    "WAVEAPPS_CIRCUIT_RECOVERY_TIMEOUT", cast=float, default=30.0
+)
+REQUEST_TIMEOUT = config("WAVEAPPS_REQUEST_TIMEOUT", cast=float, default=0.0)
+MAX_CONCURRENCY = config("WAVEAPPS_MAX_CONCURRENCY", cast=int, default=20)
+RESERVED_INTERACTIVE = config("WAVEAPPS_RESERVED_INTERACTIVE", cast=int, default=2)
+ACCOUNTS_CACHE_CONTROL = config(
+    "WAVEAPPS_ACCOUNTS_CACHE_CONTROL", default="private, no-cache"
+)
+ACCOUNTS_MAX_AGE = config("WAVEAPPS_ACCOUNTS_MAX_AGE", cast=float, default=30.0)
+ACCOUNTS_PAGE_SIZE = config("WAVEAPPS_ACCOUNTS_PAGE_SIZE", cast=int, default=100)
+ACCOUNTS_REFRESH_INTERVAL = config(
+    "WAVEAPPS_ACCOUNTS_REFRESH_INTERVAL", cast=float, default=0.0
+)
+TRANSACTION_INDEX = config("WAVEAPPS_TRANSACTION_INDEX", default="")
+LEDGER = config("WAVEAPPS_LEDGER", default="")
 ALLOWED_HOSTS = config(
     "ALLOWED_HOSTS", cast=CommaSeparatedStrings, default="localhost,127.0.0.1"
 )
@@ -0,0 +1,130 @@
+import asyncio
+import concurrent.futures
+import functools
+import json
+import os
+import time
+import typing
+
+Key = typing.Tuple[str, str]
+
+
+class TransactionIndex:
+    """Wave transaction ids by (businessId, externalId).
+
+    Lookups are served from a dict. When `path` is set every new entry is
+    appended to a JSON lines file that is replayed on startup, so orders
+    posted before a restart are still known. `compact()` rewrites the file
+    with one line per key. On the event loop use `record()`, which appends on
+    the index's worker thread.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self.entries: typing.Dict[Key, str] = {}
+        # posts in flight, shared by every business using this index
+        self.pending: typing.Dict[Key, asyncio.Future] = {}
+        self.lines = 0
+        if path and os.path.exists(path):
+            self.load()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    def close(self):
+        self.executor.shutdown()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key: Key):
+        return key in self.entries
+
+    def load(self):
+        self.entries.clear()
+        self.lines = 0
+        with open(self.path) as f:
+            for line in f:
+                if line.strip():
+                    row = json.loads(line)
+                    self.entries[(row["business"], row["externalId"])] = row["id"]
+                    self.lines += 1
+
+    def get(self, businessId: str, externalId: str) -> typing.Optional[str]:
+        return self.entries.get((businessId, externalId))
+
+    def add(self, businessId: str, externalId: str, transaction_id: str):
+        key = (businessId, externalId)
+        if self.remember(key, transaction_id) and self.path:
+            self.append(key, transaction_id)
+
+    async def record(self, businessId: str, externalId: str, transaction_id: str):
+        """`add()` without blocking the event loop. The entry can be looked
+        up right away, only the file write is left to the worker thread."""
+        key = (businessId, externalId)
+        if self.remember(key, transaction_id) and self.path:
+            await asyncio.get_event_loop().run_in_executor(
+                self.executor, functools.partial(self.append, key, transaction_id)
+            )
+
+    def remember(self, key: Key, transaction_id: str) -> bool:
+        if self.entries.get(key) == transaction_id:
+            return False
+        self.entries[key] = transaction_id
+        return True
+
+    def append(self, key: Key, transaction_id: str):
+        with open(self.path, "a") as f:
+            f.write(self.dump(key, transaction_id))
+        self.lines += 1
+
+    def compact(self):
+        """Rewrite the file without superseded lines."""
+        if not self.path:
+            return
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            f.writelines(self.dump(key, value) for key, value in self.entries.items())
+        os.replace(tmp, self.path)
+        self.lines = len(self.entries)
+
+    def rebuild(
+        self,
+        rows: typing.Iterable[typing.Tuple[str, str, str]],
+        businessId: str = None,
+    ):
+        """Replace the entries of `businessId`, or the whole index, with
+        (businessId, externalId, transaction id) rows, e.g. from import
+        results, and compact it. Other businesses keep their entries."""
+        entries = {
+            key: value
+            for key, value in self.entries.items()
+            if businessId is not None and key[0] != businessId
+        }
+        entries.update(((business, order), _id) for business, order, _id in rows)
+        self.entries = entries
+        self.compact()
+
+    @staticmethod
+    def dump(key: Key, transaction_id: str) -> str:
+        return (
+            json.dumps(
+                {
+                    "business": key[0],
+                    "externalId": key[1],
+                    "id": transaction_id,
+                    "at": time.time(),
+                }
+            )
+            + "\n"
+        )
+
+
+def read_results(
+    path: str, businessId: str
+) -> typing.Iterator[typing.Tuple[str, str, str]]:
+    """Index rows from a `waveapps_import_transactions --state` file."""
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                if row.get("created") and row.get("id"):
+                    yield businessId, row["order"], row["id"]
@@ -0,0 +1,232 @@
+"""Local ledger of the transactions posted to Wave.
+
+Every anchor and line item is appended to an SQLite `entries` table in
+cents. A trigger keeps `daily_totals` (one row per business, account, day
+and currency) up to date, so aggregations read the rollup instead of
+scanning every entry. `transactions` holds each recorded transaction once,
+so recording the same one again is a no-op.
+"""
+import asyncio
+import concurrent.futures
+import datetime
+import decimal
+import functools
+import sqlite3
+import typing
+
+from waveapps import models
+from waveapps.app import WaveException
+
+GROUPS = ("business", "account", "day", "currency")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    business TEXT NOT NULL,
+    transaction_id TEXT,
+    external_id TEXT,
+    UNIQUE (business, transaction_id)
+);
+CREATE TABLE IF NOT EXISTS entries (
+    business TEXT NOT NULL,
+    transaction_id TEXT,
+    external_id TEXT,
+    account TEXT NOT NULL,
+    day TEXT NOT NULL,
+    currency TEXT NOT NULL,
+    balance TEXT NOT NULL,
+    amount INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS daily_totals (
+    business TEXT NOT NULL,
+    account TEXT NOT NULL,
+    day TEXT NOT NULL,
+    currency TEXT NOT NULL,
+    debit INTEGER NOT NULL DEFAULT 0,
+    credit INTEGER NOT NULL DEFAULT 0,
+    entries INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (business, account, day, currency)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS daily_totals_day ON daily_totals (business, day);
+CREATE TRIGGER IF NOT EXISTS entries_rollup AFTER INSERT ON entries
+BEGIN
+    INSERT INTO daily_totals
+        (business, account, day, currency, debit, credit, entries)
+    VALUES (
+        NEW.business, NEW.account, NEW.day, NEW.currency,
+        CASE NEW.balance WHEN 'DEBIT' THEN NEW.amount ELSE 0 END,
+        CASE NEW.balance WHEN 'CREDIT' THEN NEW.amount ELSE 0 END,
+        1
+    )
+    ON CONFLICT (business, account, day, currency) DO UPDATE SET
+        debit = debit + excluded.debit,
+        credit = credit + excluded.credit,
+        entries = entries + 1;
+END;
+"""
+
+# (account id, DEBIT | CREDIT, amount)
+Entry = typing.Tuple[str, str, typing.Union[str, float]]
+
+
+def to_cents(amount: typing.Union[str, float]) -> int:
+    return int(
+        (decimal.Decimal(str(amount)) * 100).to_integral_value(decimal.ROUND_HALF_UP)
+    )
+
+
+def transaction_entries(_input: typing.Dict[str, typing.Any]) -> typing.List[Entry]:
+    """Entries of a `MoneyTransactionCreateInput`: its anchor, debited on a
+    deposit and credited on a withdrawal, then its line items."""
+    anchor = _input["anchor"]
+    direction = anchor["direction"]
+    entries = [
+        (
+            anchor["accountId"],
+            models.BalanceType.DEBIT.value
+            if direction == models.TransactionDirection.DEPOSIT.value
+            else models.BalanceType.CREDIT.value,
+            anchor["amount"],
+        )
+    ]
+    entries.extend(
+        (x["accountId"], x["balance"], x["amount"]) for x in _input["lineItems"]
+    )
+    return entries
+
+
+class Ledger:
+    """Append-only ledger with per-day totals. `path` defaults to an
+    in-memory database. Async callers go through `run`, which uses the
+    ledger's single worker thread so SQLite stays off the event loop."""
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        backfill = not self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'transactions'"
+        ).fetchone()
+        self.connection.executescript(SCHEMA)
+        if backfill:
+            # ledgers written before `transactions` existed
+            with self.connection:
+                self.connection.execute(
+                    "INSERT OR IGNORE INTO transactions "
+                    "SELECT DISTINCT business, transaction_id, external_id FROM entries"
+                )
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    def close(self):
+        self.executor.shutdown()
+        self.connection.close()
+
+    async def run(self, func: typing.Callable, *args, **kwargs):
+        """Call one of the ledger's methods on its worker thread."""
+        return await asyncio.get_event_loop().run_in_executor(
+            self.executor, functools.partial(func, *args, **kwargs)
+        )
+
+    def record(
+        self,
+        businessId: str,
+        transaction_id: str,
+        externalId: str,
+        date: typing.Union[str, datetime.date],
+        currency: str,
+        entries: typing.Iterable[Entry],
+    ) -> bool:
+        """Record the entries of a transaction, unless it already is.
+        Returns whether anything was written."""
+        day = date if isinstance(date, str) else date.strftime("%Y-%m-%d")
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT OR IGNORE INTO transactions VALUES (?, ?, ?)",
+                (businessId, transaction_id, externalId),
+            )
+            if not cursor.rowcount:
+                return False
+            self.connection.executemany(
+                "INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        businessId,
+                        transaction_id,
+                        externalId,
+                        account,
+                        day,
+                        currency.upper(),
+                        balance,
+                        to_cents(amount),
+                    )
+                    for account, balance, amount in entries
+                ],
+            )
+        return True
+
+    def record_transaction(
+        self,
+        transaction_id: str,
+        _input: typing.Dict[str, typing.Any],
+        currency: str,
+    ) -> bool:
+        """Record a posted `MoneyTransactionCreateInput`."""
+        return self.record(
+            _input["businessId"],
+            transaction_id,
+            _input.get("externalId"),
+            _input["date"],
+            currency,
+            transaction_entries(_input),
+        )
+
+    def totals(
+        self,
+        by: typing.Sequence[str] = ("account", "day", "currency"),
+        businessId: str = None,
+        account: str = None,
+        currency: str = None,
+        since: str = None,
+        until: str = None,
+    ) -> typing.List[typing.Dict[str, typing.Any]]:
+        """Debit (inflow), credit (outflow) and net totals grouped by any of
+        business, account, day and currency. `since` and `until` are
+        inclusive YYYY-MM-DD days."""
+        by = list(by)
+        unknown = [x for x in by if x not in GROUPS]
+        if unknown:
+            raise WaveException("Cannot group ledger totals by %s" % ", ".join(unknown))
+        conditions, params = [], []
+        for column, operator, value in (
+            ("business", "=", businessId),
+            ("account", "=", account),
+            ("currency", "=", currency.upper() if currency else None),
+            ("day", ">=", since),
+            ("day", "<=", until),
+        ):
+            if value:
+                conditions.append("%s %s ?" % (column, operator))
+                params.append(value)
+        columns = ", ".join(by)
+        query = "SELECT %s SUM(debit), SUM(credit), SUM(entries) FROM daily_totals" % (
+            columns + "," if by else ""
+        )
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        if by:
+            query += " GROUP BY %s ORDER BY %s" % (columns, columns)
+        result = []
+        for row in self.connection.execute(query, params):
+            *keys, debit, credit, entries = row
+            if not entries:
+                continue
+            result.append(
+                {
+                    **dict(zip(by, keys)),
+                    "debit": debit / 100,
+                    "credit": credit / 100,
+                    "net": (debit - credit) / 100,
+                    "entries": entries,
+                }
+            )
+        return result
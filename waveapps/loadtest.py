@@ -0,0 +1,322 @@
+"""Load generator for the Starlette service.
+
+Runs in-process against `build_app` backed by `waveapps.fake.FakeWaveAPI`
+unless `--url` is given:
+
+    python -m waveapps.loadtest --concurrency 20 --rate 200 --duration 30
+    python -m waveapps.loadtest --url http://localhost:8000 --api-key KEY
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import random
+import sys
+import time
+import typing
+
+import httpx
+
+from waveapps import WaveBusiness
+from waveapps.fake import FakeWaveAPI
+from waveapps.webhooks import WebhookDispatcher
+
+DEFAULT_MIX = "accounts=6,create-transaction=3,create-account=1"
+BUSINESS_ID = "QnVzaW5lc3M6ZmFrZQ=="
+
+
+def percentile(values: typing.List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    index = max(int(round(pct / 100.0 * len(values) + 0.5)) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+def parse_mix(value: str) -> typing.Dict[str, int]:
+    result = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in REQUESTS:
+            raise argparse.ArgumentTypeError("unknown request kind %s" % name)
+        result[name.strip()] = int(weight or 1)
+    return result
+
+
+def accounts_request(counter: int):
+    return "GET", "/accounts", None
+
+
+def create_transaction_request(counter: int):
+    return (
+        "POST",
+        "/create-transaction",
+        {
+            "order": "loadtest-%s" % counter,
+            "date": "2020-01-17",
+            "description": "Load test transaction %s" % counter,
+            "amount": 20000,
+            "kind": "income" if counter % 2 else "expense",
+            "accounts": {
+                "from": "QWNjb3VudDo00000002",
+                "to": "QWNjb3VudDo00000000",
+                "charges": "QWNjb3VudDo00000003",
+            },
+            "currency": "ngn",
+            "service_fee": 400,
+            "service_fee_description": "Service Fee",
+        },
+    )
+
+
+def create_account_request(counter: int):
+    return (
+        "POST",
+        "/create-account",
+        {
+            "name": "Load Account %s" % counter,
+            "description": "Created by waveapps.loadtest",
+            "currency": "ngn",
+            "type": "asset",
+        },
+    )
+
+
+REQUESTS = {
+    "accounts": accounts_request,
+    "create-transaction": create_transaction_request,
+    "create-account": create_account_request,
+}
+
+
+class Stats:
+    def __init__(self):
+        self.latencies: typing.Dict[str, typing.List[float]] = {}
+        self.errors: typing.Dict[str, int] = {}
+        self.completed = 0
+        self.in_flight = 0
+        self.samples: typing.List[typing.Dict[str, typing.Any]] = []
+
+    def record(self, kind: str, latency: float, ok: bool):
+        self.completed += 1
+        self.latencies.setdefault(kind, []).append(latency)
+        if not ok:
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def summary(self, elapsed: float) -> typing.Dict[str, typing.Any]:
+        kinds = {}
+        everything: typing.List[float] = []
+        for kind, values in self.latencies.items():
+            values.sort()
+            everything.extend(values)
+            kinds[kind] = self.describe(values, self.errors.get(kind, 0))
+        everything.sort()
+        total = self.describe(everything, sum(self.errors.values()))
+        total["throughput"] = len(everything) / elapsed if elapsed else 0.0
+        return {
+            "elapsed": elapsed,
+            "total": total,
+            "requests": kinds,
+            "samples": self.samples,
+        }
+
+    @staticmethod
+    def describe(values: typing.List[float], errors: int) -> typing.Dict[str, float]:
+        count = len(values)
+        return {
+            "count": count,
+            "errors": errors,
+            "error_rate": errors / count if count else 0.0,
+            "p50": percentile(values, 50) * 1000,
+            "p95": percentile(values, 95) * 1000,
+            "p99": percentile(values, 99) * 1000,
+        }
+
+
+def build_client(
+    args,
+) -> typing.Tuple[httpx.AsyncClient, typing.Optional[FakeWaveAPI]]:
+    headers = {}
+    if args.api_key:
+        headers["Authorization"] = "Bearer %s" % args.api_key
+    if args.url:
+        return httpx.AsyncClient(base_url=args.url, headers=headers), None
+
+    from waveapps.frameworks.starlette import build_app
+
+    upstream = FakeWaveAPI(
+        accounts=args.accounts, business_id=BUSINESS_ID, latency=args.latency
+    )
+    app = build_app(api_key=args.api_key or "fake-api-key", business_id=BUSINESS_ID)
+    app.state.WAVE_BUSINESS = WaveBusiness(BUSINESS_ID, upstream)
+    return httpx.AsyncClient(app=app, base_url="http://localhost"), upstream
+
+
+@contextlib.contextmanager
+def offline_webhooks():
+    """Swap in a dispatcher without callback for in-process runs, the
+    service's one was built from WAVEAPPS_WEBHOOK_CALLBACK on import."""
+    from waveapps.frameworks.starlette import service_layer
+
+    dispatcher = service_layer.dispatcher
+    service_layer.dispatcher = WebhookDispatcher("")
+    try:
+        yield
+    finally:
+        service_layer.dispatcher = dispatcher
+
+
+async def run(args) -> typing.Dict[str, typing.Any]:
+    if args.url:
+        return await run_requests(args)
+    with offline_webhooks():
+        return await run_requests(args)
+
+
+async def run_requests(args) -> typing.Dict[str, typing.Any]:
+    client, upstream = build_client(args)
+    stats = Stats()
+    rng = random.Random(args.seed)
+    kinds = list(args.mix.keys())
+    weights = list(args.mix.values())
+    tickets: asyncio.Queue = asyncio.Queue(maxsize=args.concurrency * 2)
+    started = time.perf_counter()
+    deadline = started + args.duration
+
+    async def produce():
+        counter = 0
+        interval = 1.0 / args.rate if args.rate else 0
+        next_at = time.perf_counter()
+        while time.perf_counter() < deadline:
+            if args.requests and counter >= args.requests:
+                break
+            if interval:
+                next_at += interval
+                delay = next_at - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            counter += 1
+            await tickets.put((rng.choices(kinds, weights)[0], counter))
+        for _ in range(args.concurrency):
+            await tickets.put(None)
+
+    async def work():
+        while True:
+            ticket = await tickets.get()
+            if ticket is None:
+                return
+            kind, counter = ticket
+            method, path, body = REQUESTS[kind](counter)
+            stats.in_flight += 1
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+                ok = response.status_code < 400
+            except Exception:
+                ok = False
+            stats.in_flight -= 1
+            stats.record(kind, time.perf_counter() - start, ok)
+
+    async def sample():
+        while True:
+            await asyncio.sleep(args.interval)
+            stats.samples.append(
+                {
+                    "elapsed": round(time.perf_counter() - started, 3),
+                    "completed": stats.completed,
+                    "in_flight": stats.in_flight,
+                    "pending": tickets.qsize(),
+                    "upstream_in_flight": upstream.in_flight if upstream else None,
+                }
+            )
+
+    sampler = asyncio.ensure_future(sample())
+    try:
+        await asyncio.gather(produce(), *[work() for _ in range(args.concurrency)])
+    finally:
+        sampler.cancel()
+        await client.aclose()
+    return stats.summary(time.perf_counter() - started)
+
+
+def format_report(summary: typing.Dict[str, typing.Any]) -> str:
+    lines = [
+        "%-20s %8s %8s %8s %10s %10s %10s"
+        % ("request", "count", "errors", "err%", "p50 ms", "p95 ms", "p99 ms")
+    ]
+    rows = list(summary["requests"].items()) + [("total", summary["total"])]
+    for kind, row in rows:
+        lines.append(
+            "%-20s %8d %8d %7.2f%% %10.2f %10.2f %10.2f"
+            % (
+                kind,
+                row["count"],
+                row["errors"],
+                row["error_rate"] * 100,
+                row["p50"],
+                row["p95"],
+                row["p99"],
+            )
+        )
+    lines.append(
+        "throughput: %.1f req/s over %.1fs"
+        % (summary["total"]["throughput"], summary["elapsed"])
+    )
+    lines.append("")
+    lines.append(
+        "%8s %10s %10s %10s %10s"
+        % ("t", "completed", "in_flight", "pending", "upstream")
+    )
+    for x in summary["samples"]:
+        lines.append(
+            "%8.1f %10d %10d %10d %10s"
+            % (
+                x["elapsed"],
+                x["completed"],
+                x["in_flight"],
+                x["pending"],
+                "-" if x["upstream_in_flight"] is None else x["upstream_in_flight"],
+            )
+        )
+    return "\n".join(lines)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m waveapps.loadtest",
+        description="Drive the waveapps Starlette service and report latency percentiles.",
+    )
+    parser.add_argument("--url", help="target a running service instead of build_app")
+    parser.add_argument("--api-key", default="", help="bearer token sent with requests")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument(
+        "--rate", type=float, default=0, help="requests per second, 0 for unbounded"
+    )
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run")
+    parser.add_argument("--requests", type=int, default=0, help="stop after N requests")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX))
+    parser.add_argument(
+        "--accounts", type=int, default=100, help="accounts in the fake upstream"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="fake upstream latency in seconds"
+    )
+    parser.add_argument(
+        "--interval", type=float, default=1.0, help="queue depth sampling interval"
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", dest="json_output", help="write the report as JSON")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    summary = asyncio.run(run(args))
+    print(format_report(summary))
+    if args.json_output:
+        with open(args.json_output, "w") as f:
+            json.dump(summary, f, indent=2)
+    return 1 if summary["total"]["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -215,6 +215,48 @@ class Business(GQLKlass):
         }
 
 
+# a Business, so account snapshots hold the same type whichever query filled them
+class BusinessAccountsPage(Business):
+    name: str
+    id: str
+    accounts: create_connection_class(Account, pageInfo=PageInfo)
+
+    class Input:
+        accounts = {
+            "params": {
+                "subtypes": "$subtypes",
+                "page": "$page",
+                "pageSize": "$pageSize",
+                "isArchived": "false",
+            },
+            "useQuote": False,
+        }
+
+
+class BusinessCustomersPage(GQLKlass):
+    name: str
+    id: str
+    customers: create_connection_class(Customer, pageInfo=PageInfo)
+
+    class Input:
+        customers = {
+            "params": {"page": "$page", "pageSize": "$pageSize"},
+            "useQuote": False,
+        }
+
+
+class BusinessSalesTaxes(GQLKlass):
+    name: str
+    id: str
+    salesTaxes: create_connection_class(SalesTax, pageInfo=PageInfo)
+
+    class Input:
+        salesTaxes = {
+            "params": {"page": "$page", "pageSize": "$pageSize"},
+            "useQuote": False,
+        }
+
+
 # class MoneyTransactionCreateOutput(GQLKlass):
 #     transaction: Transaction
 #     didSucceed: bool
@@ -237,6 +279,7 @@ MoneyTransactionCreateOutput = create_output_class(
 AccountCreateOutput = create_output_class("AccountCreateOutput", salesTax=AccountType)
 SalesTaxCreateOutput = create_output_class("SalesTaxCreateOutput", salesTax=SalesTax)
 CustomerCreateOutput = create_output_class("CustomerCreateOutput", customer=Customer)
+CustomerPatchOutput = create_output_class("CustomerPatchOutput", customer=Customer)
 # class CustomerCreateOutput(GQLKlass):
 #     customer: Customer
 #     didSucceed: bool
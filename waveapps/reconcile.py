@@ -0,0 +1,173 @@
+"""Check that every local order was posted to Wave exactly once.
+
+Local orders and recorded results (`waveapps_import_transactions --state`
+rows) are joined on the order id with a partitioned hash join: both streams
+are first spread over `partitions` temporary files by the hash of the order
+id, then each partition is joined in memory. Memory is bounded by the
+largest partition rather than by the size of the inputs.
+
+Wave's public API only returns the id of a created transaction, so amounts
+are checked against the amount recorded with the result when the order was
+posted (`RECORDED_MISMATCH`), not against what Wave stored.
+"""
+import json
+import os
+import shutil
+import tempfile
+import typing
+
+MISSING = "missing"
+DUPLICATE = "duplicate"
+RECORDED_MISMATCH = "recorded_mismatch"
+UNEXPECTED = "unexpected"
+
+# (order, amount, currency)
+Order = typing.Tuple[str, typing.Optional[float], typing.Optional[str]]
+# (order, transaction id, amount, currency)
+Posted = typing.Tuple[str, str, typing.Optional[float], typing.Optional[str]]
+
+
+class Discrepancy(typing.NamedTuple):
+    kind: str
+    order: str
+    expected: typing.Optional[float] = None
+    recorded: typing.Optional[float] = None
+    ids: typing.Tuple[str, ...] = ()
+
+
+def read_json_lines(path: str) -> typing.Iterator[typing.Dict[str, typing.Any]]:
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_orders(path: str) -> typing.Iterator[Order]:
+    """Orders from a JSON lines file of /create-transaction payloads."""
+    for row in read_json_lines(path):
+        yield row["order"], row.get("amount"), row.get("currency")
+
+
+def read_posted(path: str) -> typing.Iterator[Posted]:
+    """Created transactions from a `waveapps_import_transactions --state`
+    file. Failed attempts are skipped, so an order that never succeeded is
+    reported as missing."""
+    for row in read_json_lines(path):
+        if row.get("created") and row.get("id"):
+            yield row["order"], row["id"], row.get("amount"), row.get("currency")
+
+
+def same_currency(expected: typing.Optional[str], actual: typing.Optional[str]):
+    return not expected or not actual or expected.upper() == actual.upper()
+
+
+class Reconciliation:
+    """Join orders against posted transactions and yield discrepancies.
+
+    `counts` holds the number of orders checked and of each kind of
+    discrepancy once `run` has been consumed.
+    """
+
+    def __init__(self, partitions: int = 64, tolerance: float = 0.005):
+        self.partitions = max(1, partitions)
+        self.tolerance = tolerance
+        self.counts = {
+            "orders": 0,
+            "posted": 0,
+            MISSING: 0,
+            DUPLICATE: 0,
+            RECORDED_MISMATCH: 0,
+            UNEXPECTED: 0,
+        }
+
+    def run(
+        self, orders: typing.Iterable[Order], posted: typing.Iterable[Posted]
+    ) -> typing.Iterator[Discrepancy]:
+        if self.partitions == 1:
+            yield from self.join(orders, posted)
+            return
+        directory = tempfile.mkdtemp(prefix="waveapps-reconcile-")
+        try:
+            order_files = self.partition(orders, directory, "orders")
+            posted_files = self.partition(posted, directory, "posted")
+            for order_file, posted_file in zip(order_files, posted_files):
+                yield from self.join(
+                    self.read_partition(order_file), self.read_partition(posted_file)
+                )
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def partition(
+        self, rows: typing.Iterable[tuple], directory: str, name: str
+    ) -> typing.List[str]:
+        paths = [
+            os.path.join(directory, "%s-%d.jsonl" % (name, i))
+            for i in range(self.partitions)
+        ]
+        files = [open(path, "w") for path in paths]
+        try:
+            for row in rows:
+                files[hash(row[0]) % self.partitions].write(json.dumps(row) + "\n")
+        finally:
+            for f in files:
+                f.close()
+        return paths
+
+    @staticmethod
+    def read_partition(path: str) -> typing.Iterator[tuple]:
+        with open(path) as f:
+            for line in f:
+                yield tuple(json.loads(line))
+
+    def join(
+        self, orders: typing.Iterable[Order], posted: typing.Iterable[Posted]
+    ) -> typing.Iterator[Discrepancy]:
+        # build side: every transaction recorded for an order, by id
+        results: typing.Dict[str, typing.Dict[str, Posted]] = {}
+        for row in posted:
+            results.setdefault(row[0], {})[row[1]] = row
+            self.counts["posted"] += 1
+        checked: typing.Set[str] = set()
+        for order, amount, currency in orders:
+            if order in checked:
+                continue
+            checked.add(order)
+            self.counts["orders"] += 1
+            transactions = results.get(order)
+            if not transactions:
+                yield self.report(MISSING, order, expected=amount)
+                continue
+            ids = tuple(sorted(transactions))
+            if len(ids) > 1:
+                yield self.report(DUPLICATE, order, expected=amount, ids=ids)
+            for _, _id, recorded, recorded_currency in transactions.values():
+                if not same_currency(currency, recorded_currency) or (
+                    amount is not None
+                    and recorded is not None
+                    and abs(amount - recorded) > self.tolerance
+                ):
+                    yield self.report(
+                        RECORDED_MISMATCH,
+                        order,
+                        expected=amount,
+                        recorded=recorded,
+                        ids=(_id,),
+                    )
+        for order, transactions in results.items():
+            if order not in checked:
+                yield self.report(
+                    UNEXPECTED, order, ids=tuple(sorted(transactions))
+                )
+
+    def report(self, kind: str, order: str, **kwargs) -> Discrepancy:
+        self.counts[kind] += 1
+        return Discrepancy(kind, order, **kwargs)
+
+
+def reconcile(
+    orders: typing.Iterable[Order],
+    posted: typing.Iterable[Posted],
+    partitions: int = 64,
+    tolerance: float = 0.005,
+) -> typing.Iterator[Discrepancy]:
+    return Reconciliation(partitions, tolerance).run(orders, posted)
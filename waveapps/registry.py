@@ -0,0 +1,129 @@
+import hashlib
+import json
+import typing
+
+ACCOUNT_FIELDS = ("name", "id", "currency", "type")
+
+Account = typing.Dict[str, str]
+
+
+def dumps(data: typing.Any) -> bytes:
+    # same output as starlette's JSONResponse.render
+    return json.dumps(
+        data, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def matches(account: Account, type: str = None, currency: str = None) -> bool:
+    if type and account["type"].upper() != type.upper():
+        return False
+    if currency and account["currency"].upper() != currency.upper():
+        return False
+    return True
+
+
+def project(account: Account, fields: typing.Sequence[str] = None) -> Account:
+    if not fields or tuple(fields) == ACCOUNT_FIELDS:
+        return account
+    return {field: account[field] for field in fields}
+
+
+class AccountRegistry:
+    """Read-only view over a business' accounts, indexed by id, type and
+    currency. The content hash and the serialized body of each filtered view
+    are computed once and reused until the accounts change."""
+
+    max_cached_views = 64
+
+    def __init__(self, accounts: typing.List[Account]):
+        self.accounts = tuple(accounts)
+        self.by_id = {x["id"]: x for x in self.accounts}
+        self.by_type = self.group("type")
+        self.by_currency = self.group("currency")
+        self.by_name = self.group("name")
+        ordered = sorted(self.accounts, key=lambda x: x["id"])
+        self.digest = hashlib.sha256(dumps(ordered)).hexdigest()
+        self._views: typing.Dict[typing.Tuple, typing.Tuple[str, bytes]] = {}
+
+    def __len__(self):
+        return len(self.accounts)
+
+    def group(self, field: str) -> typing.Dict[str, typing.Tuple[Account, ...]]:
+        result: typing.Dict[str, typing.List[Account]] = {}
+        for account in self.accounts:
+            result.setdefault(account[field].strip().upper(), []).append(account)
+        return {key: tuple(value) for key, value in result.items()}
+
+    def find(
+        self, name: str, type: str = None, currency: str = None
+    ) -> typing.List[Account]:
+        """Accounts called `name`, ignoring case and surrounding spaces."""
+        return [
+            x
+            for x in self.by_name.get(name.strip().upper(), ())
+            if matches(x, type, currency)
+        ]
+
+    @staticmethod
+    def view_key(
+        fields: typing.Sequence[str] = None, type: str = None, currency: str = None
+    ) -> typing.Tuple:
+        return (
+            tuple(fields or ACCOUNT_FIELDS),
+            (type or "").upper(),
+            (currency or "").upper(),
+        )
+
+    def filter(
+        self, type: str = None, currency: str = None
+    ) -> typing.Sequence[Account]:
+        if type and currency:
+            currency = currency.upper()
+            return [
+                x
+                for x in self.by_type.get(type.upper(), ())
+                if x["currency"].upper() == currency
+            ]
+        if type:
+            return self.by_type.get(type.upper(), ())
+        if currency:
+            return self.by_currency.get(currency.upper(), ())
+        return self.accounts
+
+    def select(
+        self,
+        fields: typing.Sequence[str] = None,
+        type: str = None,
+        currency: str = None,
+    ) -> typing.Sequence[Account]:
+        accounts = self.filter(type, currency)
+        if not fields or tuple(fields) == ACCOUNT_FIELDS:
+            return accounts
+        return [project(x, fields) for x in accounts]
+
+    def etag(
+        self,
+        fields: typing.Sequence[str] = None,
+        type: str = None,
+        currency: str = None,
+    ) -> str:
+        key = self.view_key(fields, type, currency)
+        if key == self.view_key():
+            return '"%s"' % self.digest
+        view = "%s|%s" % (self.digest, json.dumps(key))
+        return '"%s"' % hashlib.sha256(view.encode()).hexdigest()
+
+    def render(
+        self,
+        fields: typing.Sequence[str] = None,
+        type: str = None,
+        currency: str = None,
+    ) -> typing.Tuple[str, bytes]:
+        """ETag and JSON response body for a filtered view."""
+        key = self.view_key(fields, type, currency)
+        if key not in self._views:
+            if len(self._views) >= self.max_cached_views:
+                self._views.clear()
+            body = dumps({"status": True, "data": self.select(*key)})
+            self._views[key] = (self.etag(*key), body)
+        return self._views[key]
@@ -0,0 +1,174 @@
+import asyncio
+import collections
+import contextlib
+import contextvars
+import hashlib
+import time
+import typing
+import weakref
+
+INTERACTIVE = "interactive"
+NORMAL = "normal"
+BULK = "bulk"
+DEFAULT_WEIGHTS = {INTERACTIVE: 6, NORMAL: 3, BULK: 1}
+
+request_priority: "contextvars.ContextVar[str]" = contextvars.ContextVar(
+    "request_priority", default=NORMAL
+)
+
+
+@contextlib.contextmanager
+def priority(lane: str):
+    """Run every Wave call made in this context in `lane`."""
+    if lane not in DEFAULT_WEIGHTS:
+        raise ValueError("Unknown priority %s" % lane)
+    token = request_priority.set(lane)
+    try:
+        yield
+    finally:
+        request_priority.reset(token)
+
+
+class Lane:
+    def __init__(self, name: str, weight: int):
+        self.name = name
+        self.weight = weight
+        self.waiters: typing.Deque[typing.Tuple[float, asyncio.Future]] = (
+            collections.deque()
+        )
+        self.pass_value = 0.0
+        self.in_flight = 0
+        self.served = 0
+        self.waited = 0.0
+
+    def metrics(self) -> typing.Dict[str, typing.Any]:
+        return {
+            "weight": self.weight,
+            "queued": len(self.waiters),
+            "in_flight": self.in_flight,
+            "served": self.served,
+            "wait_avg": self.waited / self.served if self.served else 0.0,
+        }
+
+
+class RequestScheduler:
+    """Bounds the calls in flight for one API key.
+
+    Waiting calls are admitted lane by lane with stride scheduling over the
+    lane weights, so bulk work keeps moving without starving interactive
+    calls. The last `reserved` slots are only handed to the interactive lane.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 20,
+        reserved: int = 2,
+        weights: typing.Dict[str, int] = None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.reserved = max(min(reserved, max_concurrency - 1), 0)
+        self.lanes = {
+            name: Lane(name, weight)
+            for name, weight in (weights or DEFAULT_WEIGHTS).items()
+        }
+        self.in_flight = 0
+        self.virtual_time = 0.0
+
+    def has_capacity(self, lane: Lane) -> bool:
+        limit = self.max_concurrency
+        if lane.name != INTERACTIVE:
+            limit -= self.reserved
+        return self.in_flight < limit
+
+    @contextlib.asynccontextmanager
+    async def slot(self, name: str = None):
+        lane = self.lanes[name or request_priority.get()]
+        await self.acquire(lane)
+        try:
+            yield
+        finally:
+            self.release(lane)
+
+    async def acquire(self, lane: Lane):
+        if not lane.waiters:
+            lane.pass_value = max(lane.pass_value, self.virtual_time)
+        waiter = asyncio.get_event_loop().create_future()
+        lane.waiters.append((time.monotonic(), waiter))
+        self.wake()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # admitted just as we were cancelled, hand the slot back
+                self.release(lane)
+            else:
+                lane.waiters = collections.deque(
+                    x for x in lane.waiters if x[1] is not waiter
+                )
+            raise
+
+    def release(self, lane: Lane):
+        self.in_flight -= 1
+        lane.in_flight -= 1
+        self.wake()
+
+    def wake(self):
+        while True:
+            ready = [
+                x for x in self.lanes.values() if x.waiters and self.has_capacity(x)
+            ]
+            if not ready:
+                return
+            lane = min(ready, key=lambda x: x.pass_value)
+            queued_at, waiter = lane.waiters.popleft()
+            if waiter.done():
+                continue
+            self.virtual_time = lane.pass_value
+            lane.pass_value += 1.0 / lane.weight
+            lane.in_flight += 1
+            lane.served += 1
+            lane.waited += time.monotonic() - queued_at
+            self.in_flight += 1
+            waiter.set_result(None)
+
+    def metrics(self) -> typing.Dict[str, typing.Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "reserved": self.reserved,
+            "in_flight": self.in_flight,
+            "lanes": {name: lane.metrics() for name, lane in self.lanes.items()},
+        }
+
+
+class SchedulerRegistry:
+    """One `RequestScheduler` per API key and event loop, since waiting calls
+    are futures of the loop they were made on."""
+
+    def __init__(self, max_concurrency: int = 20, reserved: int = 2):
+        self.max_concurrency = max_concurrency
+        self.reserved = reserved
+        self.loops: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    @property
+    def schedulers(self) -> typing.Dict[str, RequestScheduler]:
+        """Schedulers of the running loop."""
+        return self.loops.setdefault(asyncio.get_event_loop(), {})
+
+    def get(self, api_key: str) -> RequestScheduler:
+        schedulers = self.schedulers
+        if api_key not in schedulers:
+            schedulers[api_key] = RequestScheduler(self.max_concurrency, self.reserved)
+        return schedulers[api_key]
+
+    @staticmethod
+    def label(api_key: str) -> str:
+        # never expose the API keys themselves
+        return "key-%s" % hashlib.sha256(str(api_key).encode()).hexdigest()[:8]
+
+    def metrics(self) -> typing.Dict[str, typing.Dict[str, typing.Any]]:
+        return {
+            self.label(key): value.metrics() for key, value in self.schedulers.items()
+        }
+
+
+schedulers = SchedulerRegistry()
@@ -0,0 +1,307 @@
+"""Typed request payloads decoded straight from parsed JSON.
+
+Each schema is a dataclass. `Decoder` inspects it once and keeps a flat list
+of field converters, so decoding a request is a single pass that never
+re-resolves types or enums, and reports every invalid field at once.
+"""
+import dataclasses
+import datetime
+import enum
+import typing
+
+from waveapps import models
+from waveapps.app import WaveException
+from waveapps.business import AccountRef
+from waveapps.taxes import TaxValue
+
+T = typing.TypeVar("T")
+Converter = typing.Callable[[typing.Any], typing.Any]
+
+
+class ValidationError(WaveException):
+    def __init__(self, errors: typing.Dict[str, str]):
+        super().__init__(
+            "Invalid payload: %s"
+            % ", ".join("%s: %s" % (key, value) for key, value in errors.items())
+        )
+        self.errors = errors
+
+
+class Invalid(ValueError):
+    pass
+
+
+def decode_str(value: typing.Any) -> str:
+    if not isinstance(value, str):
+        raise Invalid("expected a string")
+    return value
+
+
+def decode_bool(value: typing.Any) -> bool:
+    if not isinstance(value, bool):
+        raise Invalid("expected a boolean")
+    return value
+
+
+def decode_number(value: typing.Any) -> typing.Union[int, float]:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise Invalid("expected a number")
+    return value
+
+
+def decode_datetime(value: typing.Any) -> datetime.datetime:
+    # querysets hand over date objects, JSON an ISO 8601 date or datetime
+    if isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, datetime.date):
+        return datetime.datetime.combine(value, datetime.time())
+    if not isinstance(value, str):
+        raise Invalid("expected an ISO 8601 date or datetime")
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise Invalid("expected an ISO 8601 date or datetime")
+
+
+def decode_dict(value: typing.Any) -> typing.Dict[str, typing.Any]:
+    if not isinstance(value, dict):
+        raise Invalid("expected an object")
+    return value
+
+
+def choice_decoder(
+    choices: typing.Dict[str, typing.Any], case_sensitive: bool = False
+) -> Converter:
+    lookup = choices if case_sensitive else {k.lower(): v for k, v in choices.items()}
+    message = "expected one of %s" % ", ".join(sorted(lookup))
+
+    def decode(value):
+        if isinstance(value, str):
+            result = lookup.get(value if case_sensitive else value.lower())
+            if result is not None:
+                return result
+        raise Invalid(message)
+
+    return decode
+
+
+def enum_decoder(
+    klass: typing.Type[enum.Enum], aliases: typing.Dict[str, enum.Enum] = None
+) -> Converter:
+    return choice_decoder({**{x.value: x for x in klass}, **(aliases or {})})
+
+
+def run(
+    convert: Converter, value: typing.Any, path: str, errors: typing.Dict[str, str]
+) -> typing.Any:
+    try:
+        return convert(value)
+    except ValidationError as e:
+        for key, message in e.errors.items():
+            errors["%s.%s" % (path, key)] = message
+    except Invalid as e:
+        errors[path] = str(e)
+
+
+def list_decoder(item: Converter) -> Converter:
+    def decode(value):
+        if not isinstance(value, list):
+            raise Invalid("expected a list")
+        errors: typing.Dict[str, str] = {}
+        result = [run(item, x, str(i), errors) for i, x in enumerate(value)]
+        if errors:
+            raise ValidationError(errors)
+        return result
+
+    return decode
+
+
+def compile_type(tp: typing.Any) -> Converter:
+    if tp is str:
+        return decode_str
+    if tp is bool:
+        return decode_bool
+    if tp in (int, float):
+        return decode_number
+    if tp is datetime.datetime:
+        return decode_datetime
+    if tp is typing.Any:
+        return lambda value: value
+    if isinstance(tp, type) and issubclass(tp, enum.Enum):
+        return enum_decoder(tp)
+    if dataclasses.is_dataclass(tp):
+        return get_decoder(tp).decode
+    origin = getattr(tp, "__origin__", None)
+    if origin is list:
+        return list_decoder(compile_type(tp.__args__[0]))
+    if origin is dict:
+        return decode_dict
+    raise TypeError("Unsupported schema type %r" % tp)
+
+
+class Decoder(typing.Generic[T]):
+    def __init__(self, klass: typing.Type[T]):
+        self.klass = klass
+        hints = typing.get_type_hints(klass)
+        self.fields: typing.List[typing.Tuple[str, str, Converter, bool]] = []
+        for field in dataclasses.fields(klass):
+            tp = hints[field.name]
+            args = getattr(tp, "__args__", ())
+            if getattr(tp, "__origin__", None) is typing.Union and type(None) in args:
+                tp = [x for x in args if x is not type(None)][0]
+            convert = field.metadata.get("decode") or compile_type(tp)
+            required = (
+                field.default is dataclasses.MISSING
+                and field.default_factory is dataclasses.MISSING  # type: ignore
+            )
+            key = field.metadata.get("key", field.name)
+            self.fields.append((field.name, key, convert, required))
+
+    def decode(self, data: typing.Any) -> T:
+        if not isinstance(data, dict):
+            raise ValidationError({"body": "expected an object"})
+        errors: typing.Dict[str, str] = {}
+        values = {}
+        for name, key, convert, required in self.fields:
+            value = data.get(key)
+            if value is None:
+                if required:
+                    errors[key] = "field required"
+                continue
+            values[name] = run(convert, value, key, errors)
+        if errors:
+            raise ValidationError(errors)
+        return self.klass(**values)
+
+
+_decoders: typing.Dict[type, Decoder] = {}
+
+
+def get_decoder(klass: typing.Type[T]) -> Decoder[T]:
+    if klass not in _decoders:
+        _decoders[klass] = Decoder(klass)
+    return _decoders[klass]
+
+
+decode_kind = enum_decoder(
+    models.MoneyFlow,
+    {"income": models.MoneyFlow.INFlOW, "expense": models.MoneyFlow.OUTFLOW},
+)
+decode_account_type = enum_decoder(
+    models.AccountSubTypeValue,
+    {
+        "asset": models.AccountSubTypeValue.OTHER_CURRENT_ASSETS,
+        "liability": models.AccountSubTypeValue.OTHER_CURRENT_LIABILITY,
+        "expense": models.AccountSubTypeValue.EXPENSE,
+        "fee": models.AccountSubTypeValue.PAYMENT_PROCESSING_FEES,
+    },
+)
+
+
+@dataclasses.dataclass(frozen=True)
+class AccountRefPayload:
+    name: str
+    type: typing.Optional[models.AccountSubTypeValue] = dataclasses.field(
+        default=None, metadata={"decode": decode_account_type}
+    )
+    currency: typing.Optional[models.CurrencyCode] = None
+
+
+def decode_account_value(value: typing.Any) -> typing.Union[str, AccountRef]:
+    """An account id or name, or a {name, type, currency} object or list."""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, list):
+        if not 1 <= len(value) <= 3:
+            raise Invalid("expected [name, type, currency]")
+        value = dict(zip(("name", "type", "currency"), value))
+    if not isinstance(value, dict):
+        raise Invalid("expected an account id, name or {name, type, currency}")
+    ref = get_decoder(AccountRefPayload).decode(value)
+    return AccountRef(ref.name, ref.type, ref.currency)
+
+
+AccountValue = typing.Union[str, AccountRef]
+
+
+@dataclasses.dataclass(frozen=True)
+class TransactionAccountsPayload:
+    from_: AccountValue = dataclasses.field(
+        metadata={"key": "from", "decode": decode_account_value}
+    )
+    to: AccountValue = dataclasses.field(metadata={"decode": decode_account_value})
+    charges: typing.Optional[AccountValue] = dataclasses.field(
+        default=None, metadata={"decode": decode_account_value}
+    )
+
+
+def decode_tax(value: typing.Any) -> TaxValue:
+    """A sales tax abbreviation or id, or {salesTaxId | abbreviation, amount}."""
+    if isinstance(value, str):
+        return value
+    if not isinstance(value, dict) or not (
+        value.get("salesTaxId") or value.get("abbreviation")
+    ):
+        raise Invalid("expected a sales tax abbreviation, id or {salesTaxId, amount}")
+    if value.get("amount") is not None:
+        try:
+            float(value["amount"])
+        except (TypeError, ValueError):
+            raise Invalid("expected a numeric tax amount")
+    return value
+
+
+decode_taxes = list_decoder(decode_tax)
+
+
+@dataclasses.dataclass(frozen=True)
+class AdditionalItemPayload:
+    account: str
+    amount: float
+    kind: str = dataclasses.field(
+        metadata={"decode": choice_decoder({"income": "income", "expense": "expense"})}
+    )
+    description: str
+    taxes: typing.List[TaxValue] = dataclasses.field(
+        default_factory=list, metadata={"decode": decode_taxes}
+    )
+
+
+@dataclasses.dataclass(frozen=True)
+class TransactionPayload:
+    order: str
+    date: datetime.datetime
+    description: str
+    amount: float
+    kind: models.MoneyFlow = dataclasses.field(metadata={"decode": decode_kind})
+    accounts: TransactionAccountsPayload
+    currency: models.CurrencyCode
+    service_fee: typing.Optional[float] = None
+    service_fee_description: typing.Optional[str] = None
+    additional_items: typing.List[AdditionalItemPayload] = dataclasses.field(
+        default_factory=list
+    )
+    create_accounts: bool = False
+    taxes: typing.List[TaxValue] = dataclasses.field(
+        default_factory=list, metadata={"decode": decode_taxes}
+    )
+
+    def __post_init__(self):
+        if self.service_fee and not self.service_fee_description:
+            raise ValidationError(
+                {"service_fee_description": "required when service_fee is set"}
+            )
+
+
+@dataclasses.dataclass(frozen=True)
+class AccountPayload:
+    name: str
+    currency: models.CurrencyCode
+    type: models.AccountSubTypeValue = dataclasses.field(
+        metadata={"decode": decode_account_type}
+    )
+    description: typing.Optional[str] = None
+
+
+decode_transaction = get_decoder(TransactionPayload).decode
+decode_account = get_decoder(AccountPayload).decode
@@ -0,0 +1,89 @@
+import decimal
+import typing
+
+from waveapps import models
+from waveapps.app import WaveException
+
+CENT = decimal.Decimal("0.01")
+
+# a tax abbreviation or id, or {"salesTaxId" | "abbreviation", "amount"?}
+TaxValue = typing.Union[str, typing.Dict[str, typing.Any]]
+
+
+def to_decimal(value: typing.Any) -> decimal.Decimal:
+    return decimal.Decimal(str(value))
+
+
+def round_amount(value: decimal.Decimal) -> decimal.Decimal:
+    return value.quantize(CENT, rounding=decimal.ROUND_HALF_UP)
+
+
+def is_resolved(taxes: typing.Iterable[TaxValue]) -> bool:
+    """Whether line item taxes are already in Wave's {salesTaxId, amount}
+    form."""
+    return all(
+        isinstance(x, dict) and x.get("salesTaxId") and x.get("amount") is not None
+        for x in taxes
+    )
+
+
+class TaxCatalog:
+    """Sales taxes of a business by id and by abbreviation (ignoring case),
+    used to turn line item taxes into {salesTaxId, amount} entries without
+    asking Wave. Rates are decimal fractions, 0.075 for 7.5%."""
+
+    def __init__(self, taxes: typing.Iterable[models.SalesTax] = ()):
+        self.by_id = {x.id: x for x in taxes}
+        self.by_abbreviation: typing.Dict[str, models.SalesTax] = {}
+        for tax in self.by_id.values():
+            if tax.abbreviation and not tax.isArchived:
+                self.by_abbreviation[tax.abbreviation.strip().upper()] = tax
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def get(self, value: str) -> models.SalesTax:
+        tax = self.by_id.get(value) or self.by_abbreviation.get(value.strip().upper())
+        if tax is None:
+            raise WaveException("Unknown sales tax %s" % value)
+        if tax.isArchived:
+            raise WaveException("Sales tax %s is archived" % value)
+        return tax
+
+    def line_taxes(
+        self, amount: typing.Union[str, float], taxes: typing.Iterable[TaxValue]
+    ) -> typing.List[typing.Dict[str, str]]:
+        """Tax entries for a line item of `amount`. Taxes given without an
+        amount are computed from their rate: simple taxes on the line amount,
+        compound taxes on the line amount plus the simple taxes."""
+        base = to_decimal(amount)
+        entries = []
+        for value in taxes:
+            if isinstance(value, str):
+                tax, explicit = self.get(value), None
+            else:
+                ref = value.get("salesTaxId") or value.get("abbreviation")
+                if not ref:
+                    raise WaveException("Missing salesTaxId or abbreviation")
+                tax, explicit = self.get(ref), value.get("amount")
+            entries.append((tax, None if explicit is None else to_decimal(explicit)))
+        amounts: typing.Dict[str, decimal.Decimal] = {}
+        for tax, explicit in entries:
+            if not tax.isCompound:
+                amounts[tax.id] = (
+                    explicit
+                    if explicit is not None
+                    else round_amount(base * to_decimal(tax.rate))
+                )
+        compound_base = base + sum(amounts.values(), decimal.Decimal(0))
+        for tax, explicit in entries:
+            if tax.isCompound:
+                amounts[tax.id] = (
+                    explicit
+                    if explicit is not None
+                    else round_amount(compound_base * to_decimal(tax.rate))
+                )
+        return [
+            {"salesTaxId": tax_id, "amount": "%.2f" % value}
+            for tax_id, value in amounts.items()
+        ]
@@ -0,0 +1,284 @@
+import asyncio
+import collections
+import json
+import os
+import random
+import time
+import typing
+
+import httpx
+
+Entry = typing.Tuple[float, typing.Dict[str, typing.Any]]
+
+
+class RetryQueue:
+    """Bounded FIFO of undelivered webhook payloads, mirrored to a JSON lines
+    file when `path` is set so pending callbacks survive restarts. The oldest
+    entries are dropped once `max_size` is reached."""
+
+    def __init__(self, path: str = None, max_size: int = 10000):
+        self.path = path
+        self.max_size = max_size
+        self.dropped = 0
+        self.entries: typing.Deque[Entry] = collections.deque()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        row = json.loads(line)
+                        self.entries.append((row["queued_at"], row["payload"]))
+            self.trim()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def trim(self) -> bool:
+        trimmed = False
+        while len(self.entries) > self.max_size:
+            self.entries.popleft()
+            self.dropped += 1
+            trimmed = True
+        return trimmed
+
+    def push(self, entries: typing.List[Entry]):
+        self.entries.extend(entries)
+        if self.trim():
+            self.save()
+        elif self.path:
+            with open(self.path, "a") as f:
+                f.writelines(self.dump(x) for x in entries)
+
+    def remove(self, entries: typing.List[Entry]):
+        """Forget `entries` once they no longer need delivering."""
+        done = {id(x) for x in entries}
+        self.entries = collections.deque(x for x in self.entries if id(x) not in done)
+        self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            f.writelines(self.dump(x) for x in self.entries)
+        os.replace(tmp, self.path)
+
+    @staticmethod
+    def dump(entry: Entry) -> str:
+        return json.dumps({"queued_at": entry[0], "payload": entry[1]}) + "\n"
+
+
+class WebhookDispatcher:
+    """Delivers webhook callbacks over a pooled client.
+
+    With `batch_size` > 1 payloads are buffered for up to `batch_window`
+    seconds and posted together as a JSON list; otherwise each payload is
+    posted on its own as before. Failed deliveries are retried with
+    exponential backoff, then parked in a `RetryQueue` that is drained in the
+    background once the first payload is dispatched, or from `start()`. Only
+    connection errors, 5xx and 429 responses are
+    retried; payloads the callback rejects with another 4xx are moved to
+    `dead_letters` instead.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        batch_size: int = 1,
+        batch_window: float = 0.0,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0,
+        retry_path: str = None,
+        retry_queue_size: int = 10000,
+        retry_interval: float = 30.0,
+        timeout: float = 10.0,
+        max_connections: int = 10,
+        retry_queue: RetryQueue = None,
+    ):
+        self.url = url
+        self.batch_size = max(batch_size, 1)
+        self.batch_window = batch_window
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retry_interval = retry_interval
+        self.timeout = timeout
+        self.max_connections = max_connections
+        # dispatchers of one process may share a queue
+        self.retry_queue = retry_queue or RetryQueue(retry_path, retry_queue_size)
+        self.counters = {
+            "delivered": 0,
+            "failed": 0,
+            "rejected": 0,
+            "batches": 0,
+            "retried": 0,
+        }
+        self.dead_letters: typing.Deque[Entry] = collections.deque(maxlen=1000)
+        self.lags: typing.Deque[float] = collections.deque(maxlen=1000)
+        self._buffer: typing.List[Entry] = []
+        self._flusher: typing.Optional[asyncio.Future] = None
+        self._retrier: typing.Optional[asyncio.Future] = None
+        self._retrier_loop: typing.Optional[asyncio.AbstractEventLoop] = None
+        self._client: typing.Optional[httpx.AsyncClient] = None
+        self._loop: typing.Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def batching(self) -> bool:
+        return self.batch_size > 1
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_event_loop()
+        if self._client is not None and self._loop is not loop:
+            self.close_stale_client()
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                pool_limits=httpx.PoolLimits(
+                    soft_limit=self.max_connections,
+                    hard_limit=self.max_connections * 2,
+                ),
+            )
+            self._loop = loop
+        return self._client
+
+    def close_stale_client(self):
+        """Close the client made on another event loop, on that loop when it
+        is still running."""
+        client, loop = self._client, self._loop
+        self._client = self._loop = None
+        if loop is not None and loop.is_running():
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+            return
+        # a closed loop can't close its connections cleanly, don't complain
+        future = asyncio.ensure_future(client.aclose())
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+    async def dispatch(self, payload: typing.Dict[str, typing.Any]):
+        if not self.url:
+            return
+        self.start_retrier()
+        entry = (time.time(), payload)
+        if not self.batching:
+            await self.deliver([entry])
+            return
+        self._buffer.append(entry)
+        if len(self._buffer) >= self.batch_size:
+            await self.flush()
+        elif self._flusher is None:
+            self._flusher = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.batch_window)
+        self._flusher = None
+        await self.flush()
+
+    async def flush(self):
+        while self._buffer:
+            entries = self._buffer[: self.batch_size]
+            self._buffer = self._buffer[self.batch_size :]
+            await self.deliver(entries)
+
+    async def post(self, body: typing.Any) -> httpx.Response:
+        return await self.client.post(self.url, json=body)
+
+    async def deliver(self, entries: typing.List[Entry]) -> bool:
+        """Post `entries`, parking them in the retry queue if every attempt
+        fails."""
+        delivered = await self.attempt(entries)
+        if delivered is None:
+            self.counters["failed"] += len(entries)
+            self.retry_queue.push(entries)
+        return bool(delivered)
+
+    async def attempt(self, entries: typing.List[Entry]) -> typing.Optional[bool]:
+        """Post `entries` with retries. True once delivered, False when the
+        callback rejects them and None when every attempt failed."""
+        body: typing.Any = [x[1] for x in entries]
+        if not self.batching:
+            body = body[0]
+        delay = self.backoff
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self.post(body)
+                if response.status_code < 400:
+                    self.record_delivery(entries)
+                    return True
+                if response.status_code < 500 and response.status_code != 429:
+                    # retrying won't change the callback's mind
+                    self.counters["rejected"] += len(entries)
+                    self.dead_letters.extend(entries)
+                    return False
+            except (httpx.HTTPError, OSError):
+                # httpx raises connection failures as plain OSErrors
+                pass
+            if attempt < self.max_retries:
+                self.counters["retried"] += 1
+                jitter = random.uniform(0.5, 1)
+                await asyncio.sleep(min(delay, self.max_backoff) * jitter)
+                delay *= 2
+        return None
+
+    def record_delivery(self, entries: typing.List[Entry]):
+        now = time.time()
+        self.counters["delivered"] += len(entries)
+        self.counters["batches"] += 1
+        self.lags.extend(now - queued_at for queued_at, _ in entries)
+
+    async def retry_pending(self):
+        """Redeliver everything parked in the retry queue once. Entries stay
+        queued until they are delivered or rejected, so nothing is lost if
+        the process dies mid-drain. Stops at the first batch that still
+        fails."""
+        entries = list(self.retry_queue.entries)
+        size = self.batch_size if self.batching else 1
+        for i in range(0, len(entries), size):
+            batch = entries[i : i + size]
+            if await self.attempt(batch) is None:
+                self.counters["failed"] += len(batch)
+                return
+            self.retry_queue.remove(batch)
+
+    async def _retry_loop(self):
+        while True:
+            await asyncio.sleep(self.retry_interval)
+            if len(self.retry_queue):
+                await self.retry_pending()
+
+    def start_retrier(self):
+        """Drain the retry queue in the background on the current loop."""
+        loop = asyncio.get_event_loop()
+        if not self.url:
+            return
+        if self._retrier and not self._retrier.done() and self._retrier_loop is loop:
+            return
+        self._retrier = asyncio.ensure_future(self._retry_loop())
+        self._retrier_loop = loop
+
+    async def start(self):
+        self.start_retrier()
+
+    async def close(self):
+        if self._retrier:
+            self._retrier.cancel()
+            self._retrier = self._retrier_loop = None
+        if self._flusher:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+
+    def metrics(self) -> typing.Dict[str, typing.Any]:
+        lags = sorted(self.lags) or [0.0]
+        return {
+            **self.counters,
+            "buffered": len(self._buffer),
+            "queued": len(self.retry_queue),
+            "dropped": self.retry_queue.dropped,
+            "dead_letters": len(self.dead_letters),
+            "lag_avg": sum(lags) / len(lags),
+            "lag_p95": lags[min(int(len(lags) * 0.95), len(lags) - 1)],
+            "lag_max": lags[-1],
+        }